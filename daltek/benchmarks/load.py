@@ -0,0 +1,460 @@
+# daltek/benchmarks/load.py
+"""
+Prueba de carga de los endpoints de Daltek con usuarios concurrentes.
+
+Cada usuario virtual repite la sesión de quien abre un dashboard: carga el
+HTML del Drag & Drop, lista las consultas guardadas, ejecuta cada una y
+pide los campos de sus DocTypes, con pausas ("think time") entre pasos.
+
+Uso contra un sitio de pruebas servido por bench (token de API de un
+usuario con acceso al dashboard):
+    python -m daltek.benchmarks.load --url http://localhost:8000 \\
+        --token API_KEY:API_SECRET --dashboard DASH-0001 --users 200
+    python -m daltek.benchmarks.load ... --output load.json --baseline prev.json
+
+Sin servidor web, dentro del proceso: `bench --site SITIO daltek-load-test`.
+
+El reporte JSON tiene throughput, percentiles de latencia y tasa de
+errores por endpoint; con --baseline se compara con el reporte de otro
+build y el proceso termina con código 1 si hay regresiones.
+"""
+
+import argparse
+import datetime
+import json
+import platform
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+METHOD_PREFIX = "daltek.daltek.doctype.daltek.daltek."
+ENDPOINTS = (
+    "get_drag_drop_html",
+    "get_saved_queries",
+    "execute_query_builder_sql",
+    "get_doctype_fields",
+)
+PERCENTILES = (50, 90, 95, 99)
+
+DEFAULT_USERS = 20
+DEFAULT_DURATION = 60
+DEFAULT_THINK_TIME = (1.0, 3.0)
+DEFAULT_QUERY_LIMIT = 100
+DEFAULT_TOLERANCE = 0.3
+# Diferencias de p95 menores que esto (segundos) se consideran ruido
+NOISE_FLOOR = 0.005
+# Aumento de la tasa de errores que se considera regresión
+ERROR_RATE_MARGIN = 0.01
+
+
+class EndpointError(Exception):
+    """Respuesta de error de un endpoint (HTTP >= 400 o success=False)."""
+
+
+class HttpTarget:
+    """Llama a los endpoints por /api/method, como el navegador."""
+
+    def __init__(self, url, token=None, timeout=60):
+        self.url = url.rstrip("/")
+        self.token = token
+        self.timeout = timeout
+
+    def __call__(self, endpoint, params):
+        request = urllib.request.Request(
+            f"{self.url}/api/method/{METHOD_PREFIX}{endpoint}",
+            data=urllib.parse.urlencode(params).encode(),
+            headers={"Accept": "application/json"},
+        )
+        if self.token:
+            request.add_header("Authorization", f"token {self.token}")
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                body = response.read()
+        except urllib.error.HTTPError as e:
+            raise EndpointError(f"HTTP {e.code}") from e
+        return json.loads(body).get("message")
+
+
+class SiteTarget:
+    """
+    Llama a los endpoints dentro del proceso con una conexión de Frappe por
+    hilo. No incluye el servidor web ni la serialización de la respuesta.
+    """
+
+    def __init__(self, site, user="Administrator", sites_path="."):
+        self.site = site
+        self.user = user
+        self.sites_path = sites_path
+        self._local = threading.local()
+
+    def __call__(self, endpoint, params):
+        import frappe
+
+        if not getattr(self._local, "connected", False):
+            frappe.init(site=self.site, sites_path=self.sites_path)
+            frappe.connect()
+            frappe.set_user(self.user)
+            self._local.connected = True
+        try:
+            return frappe.call(f"{METHOD_PREFIX}{endpoint}", **params)
+        finally:
+            frappe.db.rollback()
+
+    def close(self):
+        import frappe
+
+        if getattr(self._local, "connected", False):
+            frappe.destroy()
+            self._local.connected = False
+
+
+def dashboard_session(call, dashboard, think, max_queries=None, limit=100):
+    """
+    Sesión de un usuario que abre `dashboard`. `call(endpoint, params)`
+    registra cada petición; `think()` espera entre pasos.
+    """
+    call("get_drag_drop_html", {})
+    think()
+    saved = call("get_saved_queries", {"doc_name": dashboard}) or {}
+    queries = saved.get("queries") or []
+    if max_queries is not None:
+        queries = queries[:max_queries]
+    doctypes = []
+    for query in queries:
+        think()
+        call(
+            "execute_query_builder_sql",
+            {"query_data": json.dumps(query), "limit": limit},
+        )
+        if query.get("doctype") and query["doctype"] not in doctypes:
+            doctypes.append(query["doctype"])
+    for doctype in doctypes:
+        think()
+        call("get_doctype_fields", {"doctype_name": doctype})
+
+
+class LoadRecorder:
+    """Latencias y errores por endpoint, compartido entre hilos."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, endpoint, elapsed, error=None):
+        with self._lock:
+            self.latencies.setdefault(endpoint, []).append(elapsed)
+            if error is not None:
+                messages = self.errors.setdefault(endpoint, {})
+                messages[error] = messages.get(error, 0) + 1
+
+    def wrap(self, target):
+        """`call` para la sesión: mide cada petición y registra sus errores"""
+
+        def call(endpoint, params):
+            started = time.perf_counter()
+            try:
+                result = target(endpoint, params)
+                if isinstance(result, dict) and result.get("success") is False:
+                    raise EndpointError(
+                        str(result.get("error") or result.get("message"))[:200]
+                    )
+            except Exception as e:
+                self.record(
+                    endpoint,
+                    time.perf_counter() - started,
+                    f"{type(e).__name__}: {e}"[:200],
+                )
+                return None
+            self.record(endpoint, time.perf_counter() - started)
+            return result
+
+        return call
+
+
+def run_load(
+    target,
+    dashboard,
+    users=DEFAULT_USERS,
+    duration=DEFAULT_DURATION,
+    iterations=None,
+    ramp_up=0,
+    think_time=DEFAULT_THINK_TIME,
+    max_queries=None,
+    limit=DEFAULT_QUERY_LIMIT,
+    seed=None,
+):
+    """
+    Lanza `users` usuarios virtuales (un hilo cada uno) que repiten la
+    sesión del dashboard hasta completar `iterations` o agotar `duration`
+    segundos. Los usuarios arrancan repartidos a lo largo de `ramp_up`.
+
+    Returns:
+        dict: reporte (ver `build_report`)
+    """
+    recorder = LoadRecorder()
+    call = recorder.wrap(target)
+    deadline = time.monotonic() + duration + ramp_up
+    stop = threading.Event()
+
+    def user(index):
+        rng = random.Random(None if seed is None else seed + index)
+
+        def think():
+            low, high = think_time
+            if high > 0:
+                stop.wait(rng.uniform(low, high))
+
+        if ramp_up and users > 1:
+            stop.wait(ramp_up * index / users)
+        completed = 0
+        try:
+            while not stop.is_set() and time.monotonic() < deadline:
+                dashboard_session(call, dashboard, think, max_queries, limit)
+                completed += 1
+                if iterations is not None and completed >= iterations:
+                    break
+        finally:
+            close = getattr(target, "close", None)
+            if close is not None:
+                close()
+
+    started = time.perf_counter()
+    threads = [
+        threading.Thread(target=user, args=(index,), daemon=True)
+        for index in range(users)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - started
+
+    return build_report(
+        recorder,
+        elapsed,
+        {
+            "dashboard": dashboard,
+            "users": users,
+            "duration": duration,
+            "iterations": iterations,
+            "ramp_up": ramp_up,
+            "think_time": list(think_time),
+            "max_queries": max_queries,
+            "limit": limit,
+        },
+    )
+
+
+def percentile(ordered, q):
+    """Percentil `q` (0-100) con interpolación lineal sobre valores ordenados"""
+    if not ordered:
+        return 0.0
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(latencies, errors, elapsed):
+    ordered = sorted(latencies)
+    requests = len(ordered)
+    failed = sum(errors.values())
+    summary = {
+        "requests": requests,
+        "errors": failed,
+        "error_rate": round(failed / requests, 4) if requests else 0.0,
+        "throughput": round(requests / elapsed, 2) if elapsed else 0.0,
+        "latency": {
+            "min": ordered[0] if ordered else 0.0,
+            "mean": sum(ordered) / requests if requests else 0.0,
+            "max": ordered[-1] if ordered else 0.0,
+        },
+    }
+    for q in PERCENTILES:
+        summary["latency"][f"p{q}"] = percentile(ordered, q)
+    summary["latency"] = {
+        key: round(value, 6) for key, value in summary["latency"].items()
+    }
+    return summary
+
+
+def build_report(recorder, elapsed, config):
+    """
+    Returns:
+        dict: {"generated_at", "environment", "config", "elapsed",
+            "totals", "endpoints": {endpoint: resumen}, "errors"}
+    """
+    endpoints = {
+        endpoint: summarize(
+            recorder.latencies[endpoint], recorder.errors.get(endpoint, {}), elapsed
+        )
+        for endpoint in ENDPOINTS
+        if endpoint in recorder.latencies
+    }
+    every = [value for values in recorder.latencies.values() for value in values]
+    every_error = {
+        f"{endpoint}: {message}": count
+        for endpoint, messages in recorder.errors.items()
+        for message, count in messages.items()
+    }
+    return {
+        "generated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "config": config,
+        "elapsed": round(elapsed, 3),
+        "totals": summarize(every, every_error, elapsed),
+        "endpoints": endpoints,
+        "errors": recorder.errors,
+    }
+
+
+def compare(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compara cada endpoint con el reporte de otro build: p95 más lento que
+    `baseline * (1 + tolerance)`, throughput menor que
+    `baseline / (1 + tolerance)` o más errores que la línea base.
+
+    Returns:
+        list: [{"endpoint", "metric", "baseline", "current"}]
+    """
+    regressions = []
+    for endpoint, stats in report["endpoints"].items():
+        reference = baseline.get("endpoints", {}).get(endpoint)
+        if not reference:
+            continue
+        p95, reference_p95 = stats["latency"]["p95"], reference["latency"]["p95"]
+        if p95 > reference_p95 * (1 + tolerance) and p95 - reference_p95 > NOISE_FLOOR:
+            regressions.append(
+                {
+                    "endpoint": endpoint,
+                    "metric": "p95",
+                    "baseline": reference_p95,
+                    "current": p95,
+                }
+            )
+        if stats["throughput"] < reference["throughput"] / (1 + tolerance):
+            regressions.append(
+                {
+                    "endpoint": endpoint,
+                    "metric": "throughput",
+                    "baseline": reference["throughput"],
+                    "current": stats["throughput"],
+                }
+            )
+        if stats["error_rate"] > reference["error_rate"] + ERROR_RATE_MARGIN:
+            regressions.append(
+                {
+                    "endpoint": endpoint,
+                    "metric": "error_rate",
+                    "baseline": reference["error_rate"],
+                    "current": stats["error_rate"],
+                }
+            )
+    return regressions
+
+
+def format_report(report):
+    """Tabla de texto con el resumen por endpoint"""
+    lines = [
+        f"{'endpoint':<28} {'req':>7} {'req/s':>8} {'p50 ms':>9} "
+        f"{'p95 ms':>9} {'p99 ms':>9} {'errores':>8}"
+    ]
+    rows = list(report["endpoints"].items()) + [("total", report["totals"])]
+    for endpoint, stats in rows:
+        latency = stats["latency"]
+        lines.append(
+            f"{endpoint:<28} {stats['requests']:>7} {stats['throughput']:>8.2f} "
+            f"{latency['p50'] * 1000:>9.1f} {latency['p95'] * 1000:>9.1f} "
+            f"{latency['p99'] * 1000:>9.1f} {stats['error_rate']:>8.1%}"
+        )
+    return "\n".join(lines)
+
+
+def parse_think_time(value):
+    """ "1,3" -> (1.0, 3.0); "2" -> (2.0, 2.0); "0" sin pausas"""
+    parts = [float(part) for part in str(value).split(",") if part.strip()]
+    if not parts or len(parts) > 2 or min(parts) < 0:
+        raise ValueError(f"Think time inválido: '{value}'")
+    return (parts[0], parts[-1])
+
+
+def write_json(path, data):
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--url", required=True, help="URL del sitio de pruebas")
+    parser.add_argument("--token", help="API_KEY:API_SECRET del usuario de prueba")
+    parser.add_argument("--dashboard", required=True, help="Documento Daltek")
+    parser.add_argument("--users", type=int, default=DEFAULT_USERS)
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION)
+    parser.add_argument("--iterations", type=int, help="Sesiones por usuario")
+    parser.add_argument("--ramp-up", type=float, default=0)
+    parser.add_argument(
+        "--think-time",
+        default=",".join(str(value) for value in DEFAULT_THINK_TIME),
+        help='Segundos entre pasos: "min,max" o un valor fijo',
+    )
+    parser.add_argument("--max-queries", type=int, help="Consultas por sesión")
+    parser.add_argument("--limit", type=int, default=DEFAULT_QUERY_LIMIT)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--output", help="Archivo JSON donde guardar el reporte")
+    parser.add_argument("--baseline", help="Reporte de otro build para comparar")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    report = run_load(
+        HttpTarget(args.url, args.token, args.timeout),
+        args.dashboard,
+        users=args.users,
+        duration=args.duration,
+        iterations=args.iterations,
+        ramp_up=args.ramp_up,
+        think_time=parse_think_time(args.think_time),
+        max_queries=args.max_queries,
+        limit=args.limit,
+        seed=args.seed,
+    )
+    print(format_report(report))
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        report["regressions"] = regressions
+    if args.output:
+        write_json(args.output, report)
+
+    if not args.baseline:
+        return 0
+    if not regressions:
+        print(f"Sin regresiones (tolerancia {args.tolerance:.0%}).")
+        return 0
+    print("Regresiones detectadas:")
+    for regression in regressions:
+        print(
+            f"  {regression['endpoint']} {regression['metric']}: "
+            f"{regression['baseline']} -> {regression['current']}"
+        )
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,316 @@
+# daltek/benchmarks/pipeline.py
+"""
+Benchmark del pipeline consulta → dataset → chart sin sitio de Frappe.
+
+Uso:
+    python -m daltek.benchmarks.pipeline
+    python -m daltek.benchmarks.pipeline --sizes 10000,100000 --output bench.json
+    python -m daltek.benchmarks.pipeline --update-baseline
+
+Los resultados se comparan contra `baseline.json` (junto a este archivo);
+si alguna etapa es más lenta que la línea base por encima de la tolerancia,
+el proceso termina con código 1. La línea base depende de la máquina: debe
+regenerarse con --update-baseline en la máquina de referencia.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from functools import partial
+
+from .stand_in import SQLiteDatabase, install_frappe_stand_in
+
+DEFAULT_SIZES = (10000, 100000, 1000000)
+DEFAULT_REPEAT = 5
+DEFAULT_TOLERANCE = 0.3
+# Diferencias menores que esto (segundos) se consideran ruido
+NOISE_FLOOR = 0.002
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+TABLE = "tabSales Invoice"
+COLUMNS = ("name", "customer", "status", "posting_date", "grand_total")
+STATUSES = ("Draft", "Unpaid", "Paid", "Overdue", "Cancelled")
+CUSTOMERS = 500
+SEED = 42
+
+# Iteraciones de las etapas que no dependen del tamaño de los datos
+BUILD_ITERATIONS = 2000
+
+
+def generate_rows(size, seed=SEED):
+    """Filas sintéticas y deterministas de facturas de venta."""
+    rng = random.Random(seed)
+    start = datetime.date(2024, 1, 1)
+    for i in range(size):
+        yield (
+            f"SINV-{i:07d}",
+            f"CUST-{rng.randrange(CUSTOMERS):04d}",
+            STATUSES[rng.randrange(len(STATUSES))],
+            (start + datetime.timedelta(days=rng.randrange(365))).isoformat(),
+            round(rng.uniform(10, 5000), 2),
+        )
+
+
+def measure(fn, repeat):
+    """Ejecuta `fn` `repeat` veces y devuelve (estadísticas, último resultado)."""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    stats = {
+        "median": statistics.median(timings),
+        "min": min(timings),
+        "max": max(timings),
+        "repeat": repeat,
+    }
+    return stats, result
+
+
+def sample_queries():
+    """Consultas representativas de lo que generan el Query Builder y los widgets."""
+    from daltek.daltek.domain.query_engine.query_definition import (
+        compile_query_definition,
+    )
+    from daltek.daltek.domain.query_engine.query_engine import QueryEngine, Sum
+
+    def invoices():
+        return (
+            QueryEngine()
+            .select("name", "customer", "status", "posting_date", "grand_total")
+            .from_table(f"`{TABLE}`")
+            .where("status != 'Cancelled'")
+            .order_by("posting_date", "DESC")
+            .limit(100)
+        )
+
+    return [
+        invoices,
+        lambda: invoices().time_bucket(
+            "posting_date", Sum("grand_total"), "month", "2024-01-01", "2024-12-31"
+        ),
+        lambda: invoices().top_n("customer", Sum("grand_total"), n=10),
+        lambda: compile_query_definition(
+            {
+                "doctype": "Sales Invoice",
+                "columns": ["name", "customer", "Customer.territory"],
+                "filters": [{"col": "status", "op": "=", "val": "Paid"}],
+                "joins": [
+                    {
+                        "doctype": "Customer",
+                        "path": [
+                            {
+                                "from": "Sales Invoice",
+                                "to": "Customer",
+                                "fieldname": "customer",
+                                "kind": "link",
+                                "owner": "Sales Invoice",
+                            }
+                        ],
+                    }
+                ],
+                "limit": 100,
+            }
+        ),
+    ]
+
+
+def run(sizes=DEFAULT_SIZES, repeat=DEFAULT_REPEAT, log=print):
+    """
+    Ejecuta todas las etapas y devuelve el reporte.
+
+    Returns:
+        dict: {"generated_at", "environment", "sizes", "results": {etapa: stats}}
+    """
+    db = SQLiteDatabase()
+    install_frappe_stand_in(db)
+
+    from daltek.daltek.domain.chart_factory import ChartFactory
+    from daltek.daltek.domain.dataset import Dataset
+    from daltek.daltek.domain.serializer import ResponseEncoder
+    from daltek.daltek.services.query_guard import prepare_select_sql
+
+    results = {}
+
+    def record(name, stats, rows=None):
+        if rows is not None:
+            stats["rows"] = rows
+        results[name] = stats
+        log(f"{name:<32} {stats['median'] * 1000:>10.2f} ms")
+
+    builders = sample_queries()
+
+    def build_queries():
+        for _ in range(BUILD_ITERATIONS):
+            sqls = [builder().build() for builder in builders]
+        return sqls
+
+    stats, sqls = measure(build_queries, repeat)
+    record("query_build", stats, rows=BUILD_ITERATIONS * len(builders))
+
+    # Solo se validan los SELECT simples: los CTE no empiezan por SELECT
+    selects = [sql for sql in sqls if sql.lstrip().upper().startswith("SELECT")]
+
+    def validate_queries():
+        for _ in range(BUILD_ITERATIONS):
+            validated = [prepare_select_sql(sql, 100) for sql in selects]
+        return validated
+
+    stats, _ = measure(validate_queries, repeat)
+    record("sql_validation", stats, rows=BUILD_ITERATIONS * len(selects))
+
+    fetch_sql = f"SELECT {', '.join(COLUMNS)} FROM `{TABLE}`"
+    for size in sizes:
+        db.create_table(TABLE, COLUMNS)
+        db.insert_many(TABLE, COLUMNS, generate_rows(size))
+
+        stats, rows = measure(lambda: db.sql(fetch_sql, as_dict=True), repeat)
+        record(f"fetch_as_dict[{size}]", stats, rows=size)
+
+        for mode in ("compat", "fast"):
+            encoder = ResponseEncoder(mode)
+            stats, payload = measure(partial(encoder.dumps, {"data": rows}), repeat)
+            record(f"response_encode_{mode}[{size}]", stats, rows=size)
+            results[f"response_encode_{mode}[{size}]"]["bytes"] = len(payload)
+
+        stats, dataset = measure(partial(Dataset, rows), repeat)
+        record(f"dataset_init[{size}]", stats, rows=size)
+        # Liberar las filas crudas antes de las etapas siguientes
+        rows = None
+
+        stats, _ = measure(
+            partial(dataset.group_by, "customer", {"grand_total": "sum"}), repeat
+        )
+        record(f"dataset_group_by[{size}]", stats, rows=size)
+
+        stats, _ = measure(
+            partial(dataset.pivot, "customer", "status", "grand_total"), repeat
+        )
+        record(f"dataset_pivot[{size}]", stats, rows=size)
+
+        stats, figure = measure(
+            lambda dataset=dataset: ChartFactory.create_chart(
+                "bar", dataset, "posting_date", "grand_total"
+            ).render(),
+            repeat,
+        )
+        record(f"chart_render[{size}]", stats, rows=size)
+
+        stats, payload = measure(partial(json.dumps, figure, default=str), repeat)
+        record(f"json_encode[{size}]", stats, rows=size)
+        results[f"json_encode[{size}]"]["bytes"] = len(payload)
+        dataset = figure = payload = None
+
+    db.close()
+    return {
+        "generated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+        },
+        "sizes": list(sizes),
+        "results": results,
+    }
+
+
+def compare(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compara el mejor tiempo (`min`, el menos sensible al ruido) de cada
+    etapa con la línea base.
+
+    Returns:
+        list: etapas más lentas que `baseline * (1 + tolerance)`
+    """
+    regressions = []
+    for name, stats in report["results"].items():
+        reference = baseline.get("results", {}).get(name)
+        if not reference or not reference.get("min"):
+            continue
+        ratio = stats["min"] / reference["min"]
+        if ratio > 1 + tolerance and stats["min"] - reference["min"] > NOISE_FLOOR:
+            regressions.append(
+                {
+                    "stage": name,
+                    "baseline": reference["min"],
+                    "current": stats["min"],
+                    "ratio": round(ratio, 2),
+                }
+            )
+    return regressions
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_json(path, data):
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--sizes",
+        default=",".join(str(size) for size in DEFAULT_SIZES),
+        help="Tamaños de dataset separados por comas",
+    )
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--output", help="Archivo JSON donde guardar los resultados")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="Sobrescribe la línea base con los resultados actuales",
+    )
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    report = run(sizes=sizes, repeat=args.repeat)
+
+    if args.output:
+        write_json(args.output, report)
+
+    if args.update_baseline:
+        write_json(args.baseline, report)
+        print(f"Línea base actualizada: {args.baseline}")
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    if not baseline:
+        print("No hay línea base para comparar.")
+        return 0
+
+    regressions = compare(report, baseline, args.tolerance)
+    report["regressions"] = regressions
+    if args.output:
+        write_json(args.output, report)
+
+    if not regressions:
+        print(f"Sin regresiones (tolerancia {args.tolerance:.0%}).")
+        return 0
+
+    print("Regresiones detectadas:")
+    for regression in regressions:
+        print(
+            f"  {regression['stage']}: {regression['baseline'] * 1000:.2f} ms -> "
+            f"{regression['current'] * 1000:.2f} ms (x{regression['ratio']})"
+        )
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
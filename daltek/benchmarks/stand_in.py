@@ -0,0 +1,79 @@
+# daltek/benchmarks/stand_in.py
+
+import sqlite3
+import sys
+import types
+
+
+class SQLiteDatabase:
+    """
+    Sustituto en memoria de `frappe.db` respaldado por SQLite.
+
+    Solo implementa `sql(query, values, as_dict=...)`, que es lo que usan
+    los servicios de Daltek para leer datos. SQLite acepta identificadores
+    entre backticks, así que las consultas de QueryEngine funcionan sin cambios
+    mientras no usen funciones propias de MariaDB.
+    """
+
+    def __init__(self):
+        self.connection = sqlite3.connect(":memory:")
+
+    def sql(self, query, values=(), as_dict=False):
+        cursor = self.connection.execute(query, values or ())
+        rows = cursor.fetchall()
+        if not as_dict:
+            return rows
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in rows]
+
+    def create_table(self, table, columns):
+        definition = ", ".join(f"`{column}`" for column in columns)
+        self.connection.execute(f"DROP TABLE IF EXISTS `{table}`")
+        self.connection.execute(f"CREATE TABLE `{table}` ({definition})")
+
+    def insert_many(self, table, columns, rows):
+        placeholders = ", ".join("?" for _ in columns)
+        self.connection.executemany(
+            f"INSERT INTO `{table}` VALUES ({placeholders})", rows
+        )
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+class StandInValidationError(Exception):
+    pass
+
+
+def install_frappe_stand_in(db):
+    """
+    Deja `db` como `frappe.db` para poder importar los servicios sin sitio.
+
+    Si Frappe está instalado se asigna a `frappe.local.db`; si no, se
+    registra un módulo `frappe` mínimo con lo que usan esos servicios
+    (`db`, `throw`, `_dict` y `conf`).
+    """
+    try:
+        import frappe
+
+        frappe.local.db = db
+        return frappe
+    except ImportError:
+        pass
+
+    class _dict(dict):
+        __getattr__ = dict.get
+        __setattr__ = dict.__setitem__
+
+    def throw(msg, exc=StandInValidationError, title=None):
+        raise exc(msg)
+
+    module = types.ModuleType("frappe")
+    module.db = db
+    module.throw = throw
+    module._dict = _dict
+    module.conf = _dict()
+    module.ValidationError = StandInValidationError
+    sys.modules["frappe"] = module
+    return module
@@ -0,0 +1,144 @@
+import json
+
+import click
+from frappe.commands import get_site, pass_context
+
+
+@click.command("daltek-index-advisor")
+@click.option(
+    "--top", default=20, type=int, help="Número de consultas más lentas a analizar"
+)
+@click.option(
+    "--max-columns", default=3, type=int, help="Columnas máximas por índice sugerido"
+)
+@click.option("--json", "as_json", is_flag=True, help="Imprime el reporte como JSON")
+@click.option("--reset", is_flag=True, help="Limpia la carga capturada al terminar")
+@pass_context
+def index_advisor(context, top, max_columns, as_json, reset):
+    """Sugiere índices compuestos a partir de las consultas del Query Builder."""
+    import frappe
+
+    from daltek.daltek.services.workload import build_index_report, clear_workload
+
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+    try:
+        report = build_index_report(top=top, max_columns=max_columns)
+        if reset:
+            clear_workload()
+    finally:
+        frappe.destroy()
+
+    if as_json:
+        click.echo(json.dumps(report, indent=2, default=str))
+        return
+
+    click.echo(
+        f"Consultas analizadas: {report['analyzed_fingerprints']} "
+        f"({report['generated_at']})"
+    )
+    if not report["doctypes"]:
+        click.echo("No hay índices sugeridos.")
+    for doctype, suggestions in report["doctypes"].items():
+        click.echo(f"\n{doctype}")
+        for suggestion in suggestions:
+            click.echo(
+                f"  ({', '.join(suggestion['columns'])}) "
+                f"filas: {suggestion['rows_before']} -> {suggestion['rows_after']} "
+                f"| {suggestion['executions']} ejecuciones, "
+                f"{suggestion['total_time']}s"
+            )
+            click.echo(f"    {suggestion['ddl']};")
+
+
+@click.command("daltek-warm-cache")
+@click.option("--dashboards", type=int, help="Dashboards más vistos a precalentar")
+@click.option("--days", type=int, help="Días de historial de vistas considerados")
+@click.option("--workers", type=int, help="Consultas simultáneas como máximo")
+@click.option("--json", "as_json", is_flag=True, help="Imprime el reporte como JSON")
+@pass_context
+def warm_cache(context, dashboards, days, workers, as_json):
+    """Precalienta la caché de resultados de los dashboards más vistos."""
+    import frappe
+
+    from daltek.daltek.services.warmup import warm_up_dashboards
+
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+    try:
+        report = warm_up_dashboards(limit=dashboards, days=days, workers=workers)
+    finally:
+        frappe.destroy()
+
+    if as_json:
+        click.echo(json.dumps(report, indent=2, default=str))
+        return
+
+    click.echo(
+        f"Dashboards: {len(report['dashboards'])} | widgets: {report['widgets']} "
+        f"| datasets: {report['datasets']} "
+        f"| ejecutados: {report['warmed']}, ya en caché: {report['cached']}, "
+        f"fallidos: {report['failed']}"
+    )
+    click.echo(f"Cobertura: {report['coverage']:.0%} en {report['duration']}s")
+
+
+@click.command("daltek-load-test")
+@click.option("--dashboard", required=True, help="Documento Daltek a abrir")
+@click.option("--users", default=20, type=int, help="Usuarios virtuales concurrentes")
+@click.option("--duration", default=60, type=float, help="Segundos de prueba")
+@click.option("--iterations", type=int, help="Sesiones por usuario")
+@click.option("--ramp-up", default=0, type=float, help="Segundos para lanzar a todos")
+@click.option(
+    "--think-time", default="1,3", help='Segundos entre pasos: "min,max" o fijo'
+)
+@click.option("--max-queries", type=int, help="Consultas ejecutadas por sesión")
+@click.option("--user", default="Administrator", help="Usuario de las sesiones")
+@click.option("--output", help="Archivo JSON donde guardar el reporte")
+@click.option("--json", "as_json", is_flag=True, help="Imprime el reporte como JSON")
+@pass_context
+def load_test(
+    context,
+    dashboard,
+    users,
+    duration,
+    iterations,
+    ramp_up,
+    think_time,
+    max_queries,
+    user,
+    output,
+    as_json,
+):
+    """Simula usuarios concurrentes abriendo un dashboard (sin servidor web)."""
+    from daltek.benchmarks.load import (
+        SiteTarget,
+        format_report,
+        parse_think_time,
+        run_load,
+        write_json,
+    )
+
+    site = get_site(context)
+    report = run_load(
+        SiteTarget(site, user=user),
+        dashboard,
+        users=users,
+        duration=duration,
+        iterations=iterations,
+        ramp_up=ramp_up,
+        think_time=parse_think_time(think_time),
+        max_queries=max_queries,
+    )
+    if output:
+        write_json(output, report)
+
+    if as_json:
+        click.echo(json.dumps(report, indent=2, default=str))
+        return
+    click.echo(format_report(report))
+
+
+commands = [index_advisor, warm_cache, load_test]
@@ -2,10 +2,51 @@
 # For license information, please see license.txt
 
 import os
+import time
 
 import frappe
 from frappe.model.document import Document
 
+from daltek.daltek.services import metrics
+from daltek.daltek.services.admission import admission_control, get_admission_metrics
+from daltek.daltek.services.crossfilter import crossfilter_dashboard
+from daltek.daltek.services.data_version import (
+    get_query_version,
+    is_settled,
+    is_unchanged,
+)
+from daltek.daltek.services.execution_plan import compile_execution_plan
+from daltek.daltek.services.export import (
+    build_export_response,
+    pop_export_token,
+    prepare_export,
+)
+from daltek.daltek.services.link_graph import (
+    find_join_path,
+    get_linked_doctypes,
+    resolve_query_joins,
+)
+from daltek.daltek.services.metrics import collect_metrics
+from daltek.daltek.services.permissions import (
+    check_sql_permissions,
+    compile_secure_definition,
+)
+from daltek.daltek.services.preview import get_preview_settings, run_preview
+from daltek.daltek.services.query_guard import (
+    check_query_cost,
+    enqueue_query,
+    get_queued_result,
+    prepare_select_sql,
+)
+from daltek.daltek.services.replica import run_read_query
+from daltek.daltek.services.serializer import json_endpoint
+from daltek.daltek.services.snapshots import get_snapshot
+from daltek.daltek.services.widget_data import load_widgets_data
+from daltek.daltek.services.workload import record_query
+
+# Módulos JS compartidos por el Query Builder y el Drag & Drop (public/js)
+SHARED_JS_FILES = ("result_cache.js", "chart_renderer.js", "sparse_table.js")
+
 
 class Daltek(Document):
     def before_save(self):
@@ -15,56 +56,83 @@ class Daltek(Document):
             self.date_created = current_datetime
 
         self.last_modified = current_datetime
+        self.execution_plan = frappe.as_json(compile_execution_plan(self), indent=None)
 
 
 @frappe.whitelist()
-def execute_query_builder_sql(sql_query, limit=100):
+@json_endpoint
+@admission_control(concurrent=True)
+def execute_query_builder_sql(
+    sql_query=None, limit=100, fingerprint=None, data_version=None, query_data=None
+):
     try:
-        # Validaciones de seguridad
-        if not sql_query or not sql_query.strip():
-            frappe.throw("La consulta SQL no puede estar vacía")
-
-        # Limpiar y normalizar la consulta
-        sql_query = sql_query.strip()
-        if sql_query.endswith(";"):
-            sql_query = sql_query[:-1]
-
-        # Validar que sea solo una consulta SELECT
-        sql_upper = sql_query.upper().strip()
-        if not sql_upper.startswith("SELECT"):
-            frappe.throw("Solo se permiten consultas SELECT")
-
-        # Evitar consultas peligrosas
-        dangerous_keywords = [
-            "DELETE",
-            "INSERT",
-            "UPDATE",
-            "DROP",
-            "CREATE",
-            "ALTER",
-            "TRUNCATE",
-        ]
-        for keyword in dangerous_keywords:
-            if keyword in sql_upper:
-                frappe.throw(f"Palabra clave no permitida: {keyword}")
-
-        # Agregar límite si no existe
-        if "LIMIT" not in sql_upper:
-            sql_query += f" LIMIT {limit}"
+        # Con la definición del Query Builder los permisos del usuario se
+        # inyectan en la consulta; el SQL libre solo puede leer DocTypes
+        # sin restricciones por registro
+        if query_data:
+            if isinstance(query_data, str):
+                query_data = frappe.parse_json(query_data)
+            # El motor emite el LIMIT; buscarlo en el texto confunde
+            # columnas como `credit_limit` con una cláusula LIMIT
+            sql_query = prepare_select_sql(
+                compile_secure_definition(
+                    resolve_query_joins({**query_data, "limit": int(limit)})
+                ).build()
+            )
+        else:
+            check_sql_permissions(sql_query)
+            sql_query = prepare_select_sql(sql_query, limit)
+
+        # Revalidación: si el cliente ya tiene este resultado y los DocTypes
+        # consultados no cambiaron, no se vuelve a ejecutar
+        version = get_query_version(sql_query)
+        unchanged = is_unchanged(version, fingerprint, data_version)
+        if data_version:
+            metrics.count_cache("revalidation", unchanged)
+        if unchanged:
+            return {"success": True, "unchanged": True, "sql": sql_query, **version}
+
+        # Estimar el coste antes de ejecutar
+        guard = check_query_cost(sql_query)
+        if guard["action"] == "reject":
+            frappe.throw(
+                "La consulta excede el presupuesto de coste permitido "
+                f"({guard['estimate']['cost']} filas estimadas)"
+            )
+        if guard["action"] == "queue":
+            job_id = enqueue_query(sql_query)
+            return {
+                "success": True,
+                "queued": True,
+                "job_id": job_id,
+                "cost": guard["estimate"],
+                "sql": sql_query,
+                "message": "La consulta es costosa y se ejecutará en segundo plano.",
+            }
 
         # Ejecutar la consulta
         frappe.log_error(f"Ejecutando consulta: {sql_query}", "QueryBuilder SQL")
 
-        results = frappe.db.sql(sql_query, as_dict=True)
+        started = time.perf_counter()
+        results, node = run_read_query(sql_query)
+        record_query(sql_query, time.perf_counter() - started)
+        if not is_settled(sql_query, version, node):
+            # Sin versión el cliente no guarda filas que pueden ser viejas
+            version = {**version, "data_version": None}
 
         return {
             "success": True,
             "data": results,
             "count": len(results),
             "sql": sql_query,
+            "cost": guard["estimate"],
+            "node": node,
+            **version,
             "message": f"Consulta ejecutada exitosamente. {len(results)} filas retornadas.",
         }
 
+    except frappe.PermissionError:
+        raise
     except frappe.ValidationError as e:
         return {
             "success": False,
@@ -85,6 +153,148 @@ def execute_query_builder_sql(sql_query, limit=100):
 
 
 @frappe.whitelist()
+@json_endpoint
+@admission_control(concurrent=True)
+def preview_query_builder_sql(query_data, session_key, preview_id):
+    """
+    Vista previa en vivo del Query Builder: pocas filas y tiempo acotado.
+
+    Args:
+        query_data (str | dict): Definición de la consulta del Query Builder
+        session_key (str): Identificador de la instancia del Query Builder
+        preview_id (int): Número creciente de vista previa en esa sesión; una
+            vista previa más nueva cancela en el servidor la que siga en curso
+
+    Returns:
+        dict: Filas de la vista previa, o superseded si llegó una más nueva
+    """
+    try:
+        if isinstance(query_data, str):
+            query_data = frappe.parse_json(query_data)
+        # El motor emite el LIMIT; agregarlo después sobre el SQL confunde
+        # columnas como `credit_limit` con una cláusula LIMIT
+        sql_query = compile_secure_definition(
+            resolve_query_joins({**query_data, "limit": get_preview_settings().limit})
+        ).build()
+
+        return {"success": True, **run_preview(sql_query, session_key, preview_id)}
+
+    except frappe.PermissionError:
+        raise
+    except frappe.ValidationError as e:
+        return {
+            "success": False,
+            "error": str(e),
+            "message": "Error de validación en la vista previa",
+        }
+    except Exception as e:
+        frappe.log_error(
+            f"Error en la vista previa: {str(e)}", "QueryBuilder Preview Error"
+        )
+        return {
+            "success": False,
+            "error": str(e),
+            "message": "Error ejecutando la vista previa",
+        }
+
+
+@frappe.whitelist()
+@json_endpoint
+def get_background_query_result(job_id):
+    """
+    Obtiene el resultado de una consulta enviada a segundo plano.
+
+    Args:
+        job_id (str): ID devuelto por execute_query_builder_sql
+
+    Returns:
+        dict: Resultado de la consulta o estado pendiente
+    """
+    result = get_queued_result(job_id)
+    if result is None:
+        return {
+            "success": False,
+            "pending": True,
+            "job_id": job_id,
+            "message": "La consulta aún se está ejecutando",
+        }
+    return result
+
+
+@frappe.whitelist()
+@admission_control()
+def prepare_query_export(file_format="csv", query_data=None, sql_query=None):
+    """
+    Prepara la exportación completa (sin LIMIT) de una consulta.
+
+    Args:
+        file_format (str): "csv", "xlsx" o "parquet"
+        query_data (str | dict): Definición del Query Builder a compilar
+        sql_query (str): SQL ya construido (alternativa a query_data)
+
+    Returns:
+        dict: URL de descarga en streaming, o id del trabajo en segundo plano
+    """
+    try:
+        if query_data:
+            if isinstance(query_data, str):
+                query_data = frappe.parse_json(query_data)
+            query_data = {**query_data, "limit": None}
+            sql_query = compile_secure_definition(
+                resolve_query_joins(query_data)
+            ).build()
+        else:
+            check_sql_permissions(sql_query)
+
+        export = prepare_export(sql_query, file_format)
+        if export["mode"] == "background":
+            return {
+                "success": True,
+                "mode": "background",
+                "job_id": export["job_id"],
+                "message": "La exportación es grande y se generará en segundo plano.",
+            }
+
+        return {
+            "success": True,
+            "mode": "inline",
+            "url": (
+                "/api/method/daltek.daltek.doctype.daltek.daltek.download_query_export"
+                f"?token={export['token']}"
+            ),
+        }
+
+    except frappe.PermissionError:
+        raise
+    except (frappe.ValidationError, ValueError) as e:
+        return {
+            "success": False,
+            "error": str(e),
+            "message": "Error de validación en la exportación",
+        }
+    except Exception as e:
+        frappe.log_error(
+            f"Error preparando exportación: {str(e)}", "QueryBuilder Export Error"
+        )
+        return {
+            "success": False,
+            "error": str(e),
+            "message": "Error preparando la exportación",
+        }
+
+
+@frappe.whitelist()
+def download_query_export(token):
+    """
+    Descarga una exportación preparada con prepare_query_export.
+    El archivo se genera a medida que se lee, sin cargar el resultado en memoria.
+    """
+    export = pop_export_token(token)
+    return build_export_response(export["sql"], export["format"])
+
+
+@frappe.whitelist()
+@admission_control()
 def get_doctype_fields(doctype_name):
     """
     Obtiene los campos de un DocType específico para el Query Builder.
@@ -172,6 +382,105 @@ def get_doctype_fields(doctype_name):
 
 
 @frappe.whitelist()
+def get_doctype_links(doctype_name):
+    """
+    Obtiene los DocTypes relacionados directamente con uno dado a través de
+    campos Link o Table, para ofrecer joins en el Query Builder.
+
+    Args:
+        doctype_name (str): Nombre del DocType
+
+    Returns:
+        dict: Lista de relaciones disponibles
+    """
+    try:
+        if not doctype_name:
+            frappe.throw("El nombre del DocType es requerido")
+
+        links = []
+        for edge in get_linked_doctypes(doctype_name):
+            forward = edge["owner"] == doctype_name
+            if edge["kind"] == "child":
+                relation = "child" if forward else "parent"
+            else:
+                relation = "link" if forward else "referenced_by"
+            links.append({**edge, "doctype": edge["to"], "relation": relation})
+
+        return {"success": True, "doctype": doctype_name, "links": links}
+
+    except Exception as e:
+        frappe.log_error(
+            f"Error obteniendo relaciones del DocType {doctype_name}: {str(e)}",
+            "QueryBuilder Error",
+        )
+        return {
+            "success": False,
+            "error": str(e),
+            "doctype": doctype_name,
+            "message": f"Error obteniendo relaciones del DocType: {str(e)}",
+        }
+
+
+@frappe.whitelist()
+def get_join_path(source_doctype, target_doctype):
+    """
+    Busca la ruta de joins más corta entre dos DocTypes.
+
+    Args:
+        source_doctype (str): DocType de origen
+        target_doctype (str): DocType de destino
+
+    Returns:
+        dict: Aristas a recorrer para unir ambos DocTypes
+    """
+    path = find_join_path(source_doctype, target_doctype)
+    if path is None:
+        return {
+            "success": False,
+            "message": f"No existe relación entre {source_doctype} y {target_doctype}",
+        }
+    return {"success": True, "path": path}
+
+
+@frappe.whitelist()
+def build_query_sql(query_data):
+    """
+    Compila la definición del Query Builder (columnas, filtros y joins)
+    a SQL mediante QueryEngine.
+
+    Args:
+        query_data (str | dict): Definición de la consulta
+
+    Returns:
+        dict: SQL generado
+    """
+    try:
+        if isinstance(query_data, str):
+            query_data = frappe.parse_json(query_data)
+
+        definition = resolve_query_joins(query_data)
+        sql = compile_secure_definition(definition).build()
+        return {"success": True, "sql": sql, "joins": definition["joins"]}
+
+    except frappe.PermissionError:
+        raise
+    except (frappe.ValidationError, ValueError) as e:
+        return {
+            "success": False,
+            "error": str(e),
+            "message": "Error de validación en la consulta",
+        }
+    except Exception as e:
+        frappe.log_error(f"Error compilando consulta: {str(e)}", "QueryBuilder Error")
+        return {
+            "success": False,
+            "error": str(e),
+            "message": "Error compilando la consulta",
+        }
+
+
+@frappe.whitelist()
+@admission_control()
 def get_query_builder_html():
     """
     Retorna el HTML completo del Query Builder para renderizar en un campo HTML.
@@ -180,10 +489,12 @@ def get_query_builder_html():
     try:
         app_path = frappe.get_app_path("daltek")
         query_builder_path = os.path.join(app_path, "public", "js", "query_builder")
+        shared_path = os.path.join(app_path, "public", "js")
 
         # Leer archivos en el orden correcto
         files_to_load = [
             ("index.html", "html"),
+            ("result_cache.js", "js"),
             ("state.js", "js"),
             ("ui.js", "js"),
             ("views.js", "js"),
@@ -196,7 +507,10 @@ def get_query_builder_html():
         js_contents = {}
 
         for filename, file_type in files_to_load:
-            file_path = os.path.join(query_builder_path, filename)
+            file_path = os.path.join(
+                shared_path if filename in SHARED_JS_FILES else query_builder_path,
+                filename,
+            )
 
             if not os.path.exists(file_path):
                 frappe.log_error(f"Archivo no encontrado: {file_path}")
@@ -212,6 +526,7 @@ def get_query_builder_html():
 
         # Inyectar los JS en los placeholders del HTML
         placeholder_map = {
+            "result_cache.js": "qb-result-cache-js",
             "state.js": "qb-state-js",
             "ui.js": "qb-ui-js",
             "views.js": "qb-views-js",
@@ -227,6 +542,7 @@ def get_query_builder_html():
                     f'<script id="{placeholder_id}">\n{js_contents[js_file]}\n</script>',
                 )
 
+        metrics.inc("daltek_html_bundle_serves_total", bundle="query_builder")
         return html_content
 
     except FileNotFoundError as e:
@@ -242,6 +558,7 @@ def get_query_builder_html():
 
 
 @frappe.whitelist()
+@admission_control()
 def get_drag_drop_html():
     """
     Retorna el HTML completo del sistema Drag and Drop para renderizar en un campo HTML.
@@ -250,10 +567,14 @@ def get_drag_drop_html():
     try:
         app_path = frappe.get_app_path("daltek")
         drag_drop_path = os.path.join(app_path, "public", "js", "drag_and_drop")
+        shared_path = os.path.join(app_path, "public", "js")
 
         # Leer archivos en el orden correcto
         files_to_load = [
             ("index.html", "html"),
+            ("result_cache.js", "js"),
+            ("chart_renderer.js", "js"),
+            ("sparse_table.js", "js"),
             ("state.js", "js"),
             ("ui.js", "js"),
             ("grid.js", "js"),
@@ -265,7 +586,9 @@ def get_drag_drop_html():
         js_contents = {}
 
         for filename, file_type in files_to_load:
-            file_path = os.path.join(drag_drop_path, filename)
+            file_path = os.path.join(
+                shared_path if filename in SHARED_JS_FILES else drag_drop_path, filename
+            )
 
             if not os.path.exists(file_path):
                 frappe.log_error(f"Archivo no encontrado: {file_path}")
@@ -281,6 +604,9 @@ def get_drag_drop_html():
 
         # Inyectar los JS en los placeholders del HTML
         placeholder_map = {
+            "result_cache.js": "dd-result-cache-js",
+            "chart_renderer.js": "dd-chart-renderer-js",
+            "sparse_table.js": "dd-sparse-table-js",
             "state.js": "dd-state-js",
             "ui.js": "dd-ui-js",
             "grid.js": "dd-grid-js",
@@ -295,6 +621,7 @@ def get_drag_drop_html():
                     f'<script id="{placeholder_id}">\n{js_contents[js_file]}\n</script>',
                 )
 
+        metrics.inc("daltek_html_bundle_serves_total", bundle="drag_drop")
         return html_content
 
     except FileNotFoundError as e:
@@ -338,6 +665,7 @@ def save_query(doc_name, query_data):
             "doctype": query_data.get("doctype"),
             "columns": query_data.get("columns", []),
             "filters": query_data.get("filters", []),
+            "joins": query_data.get("joins", []),
             "description": query_data.get("description", ""),
             "created_by": query_data.get("created_by") or frappe.session.user,
             "created_at": query_data.get("created_at") or frappe.utils.now(),
@@ -373,6 +701,7 @@ def save_query(doc_name, query_data):
 
 
 @frappe.whitelist()
+@admission_control()
 def get_saved_queries(doc_name):
     """
     Obtiene todas las consultas guardadas del documento.
@@ -478,3 +807,147 @@ def delete_query(doc_name, query_id):
     except Exception as e:
         frappe.log_error(f"Error eliminando consulta: {str(e)}", "Query Delete Error")
         return {"success": False, "message": f"Error al eliminar la consulta: {str(e)}"}
+
+
+@frappe.whitelist()
+@json_endpoint
+@admission_control(concurrent=True)
+def get_widgets_data(doc_name, requests):
+    """
+    Carga en lote los datos de los widgets que el canvas necesita mostrar.
+
+    Args:
+        doc_name (str): Nombre del documento Daltek
+        requests (str | list): [{"widget_id", "priority"}, ...] donde
+            priority es "visible", "near" o "prefetch"
+
+    Returns:
+        dict: Datos por widget y widgets diferidos para un próximo lote
+    """
+    try:
+        if isinstance(requests, str):
+            requests = frappe.parse_json(requests)
+
+        doc = frappe.get_doc("Daltek", doc_name)
+        doc.check_permission("read")
+
+        data = load_widgets_data(doc, requests or [])
+        return {"success": True, **data}
+
+    except frappe.PermissionError:
+        raise
+    except Exception as e:
+        frappe.log_error(
+            f"Error cargando datos de widgets: {str(e)}", "Dashboard Widget Error"
+        )
+        return {
+            "success": False,
+            "error": str(e),
+            "message": "Error cargando los datos de los widgets",
+        }
+
+
+@frappe.whitelist(allow_guest=True)
+def get_public_dashboard_snapshot(name, v=None):
+    """
+    Snapshot precalculado de un dashboard público (layout + datos).
+
+    Con `v` igual al hash del contenido la respuesta es inmutable y se
+    cachea un año; sin él, se revalida con ETag. No consulta la base de datos.
+    """
+    from werkzeug.wrappers import Response
+
+    snapshot = get_snapshot(name)
+    if not snapshot:
+        raise frappe.DoesNotExistError
+
+    if v == snapshot["hash"]:
+        cache_control = "public, max-age=31536000, immutable"
+    else:
+        cache_control = "public, max-age=60"
+
+    response = Response(
+        frappe.as_json(
+            {
+                "name": snapshot["name"],
+                "title": snapshot["title"],
+                "layout": snapshot["layout"],
+                "data": snapshot["data"],
+                "hash": snapshot["hash"],
+                "generated_at": snapshot["generated_at"],
+            },
+            indent=None,
+        ),
+        content_type="application/json",
+    )
+    response.headers["Cache-Control"] = cache_control
+    response.set_etag(snapshot["hash"])
+    return response.make_conditional(frappe.local.request)
+
+
+@frappe.whitelist()
+@json_endpoint
+@admission_control(concurrent=True)
+def get_crossfilter_data(doc_name, filters, known=None):
+    """
+    Recalcula los widgets de un dashboard al aplicar filtros cruzados
+    (p. ej. al hacer clic en una barra). Se resuelve en memoria sobre los
+    datos en caché y solo devuelve los widgets que cambiaron.
+
+    Args:
+        doc_name (str): Nombre del documento Daltek
+        filters (str | list): [{"column": "DocType.campo", "values" | "range",
+            "widget_id"}, ...]
+        known (str | dict): {widget_id: hash} de lo que muestra el cliente
+
+    Returns:
+        dict: Widgets que cambiaron, los que no y el origen de cada uno
+    """
+    try:
+        filters = frappe.parse_json(filters) if isinstance(filters, str) else filters
+        known = frappe.parse_json(known) if isinstance(known, str) else known
+
+        doc = frappe.get_doc("Daltek", doc_name)
+        doc.check_permission("read")
+
+        return {"success": True, **crossfilter_dashboard(doc, filters, known)}
+
+    except frappe.PermissionError:
+        raise
+    except (frappe.ValidationError, ValueError) as e:
+        return {
+            "success": False,
+            "error": str(e),
+            "message": "Error de validación en los filtros",
+        }
+    except Exception as e:
+        frappe.log_error(
+            f"Error aplicando filtros cruzados: {str(e)}", "Dashboard Crossfilter Error"
+        )
+        return {
+            "success": False,
+            "error": str(e),
+            "message": "Error aplicando los filtros cruzados",
+        }
+
+
+@frappe.whitelist()
+def get_admission_stats():
+    """Métricas del control de admisión (cola, rechazos, consultas en curso)."""
+    frappe.only_for("System Manager")
+    return {"success": True, **get_admission_metrics()}
+
+
+@frappe.whitelist()
+def get_metrics():
+    """
+    Métricas de rendimiento de Daltek en formato de texto de Prometheus.
+    Se leen de Redis (agregadas entre workers); no consultan la base de datos.
+    """
+    from werkzeug.wrappers import Response
+
+    frappe.only_for("System Manager")
+    return Response(
+        collect_metrics(),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
@@ -1,9 +1,1079 @@
 # Copyright (c) 2025, GSI and Contributors
 # See license.txt
 
-# import frappe
+import base64
+import datetime
+import json
+from decimal import Decimal
+from unittest.mock import patch
+
+import frappe
+import numpy as np
 from frappe.tests.utils import FrappeTestCase
+from frappe.utils.response import json_handler
+
+from daltek.benchmarks.load import compare as compare_load
+from daltek.benchmarks.load import run_load
+from daltek.benchmarks.pipeline import compare
+from daltek.daltek.domain.chart_factory import ChartFactory
+from daltek.daltek.domain.chunked_dataset import ChunkedDataset
+from daltek.daltek.domain.cost_guard import CostGuard
+from daltek.daltek.domain.dataset import Dataset
+from daltek.daltek.domain.execution_plan import ExecutionPlan, is_current
+from daltek.daltek.domain.exporters import iter_csv
+from daltek.daltek.domain.index_advisor import IndexAdvisor
+from daltek.daltek.domain.metrics import MetricsBuffer, render_exposition
+from daltek.daltek.domain.plotly_data_manager import PlotlyDataManager
+from daltek.daltek.domain.query_engine.query_definition import compile_query_definition
+from daltek.daltek.domain.query_engine.query_engine import Avg, Min, QueryEngine, Sum
+from daltek.daltek.domain.query_engine.sql_analysis import (
+    extract_column_usage,
+    fingerprint_sql,
+)
+from daltek.daltek.domain.serializer import ResponseEncoder
+from daltek.daltek.services.admission import BUCKET_CACHE_PREFIX, admit
+from daltek.daltek.services.crossfilter import get_dashboard_datasets
+from daltek.daltek.services.data_version import (
+    bump_doctype_version,
+    changed_doctypes,
+    doctypes_from_sql,
+    get_query_version,
+    increment_versions,
+    is_settled,
+    is_unchanged,
+    query_fingerprint,
+)
+from daltek.daltek.services.link_graph import (
+    LINK_GRAPH_VERSION_KEY,
+    clear_link_graph_cache,
+    get_link_graph_version,
+)
+from daltek.daltek.services.metrics import endpoint_label
+from daltek.daltek.services.permissions import (
+    alias_condition,
+    child_table_permissions,
+    compute_permission_conditions,
+)
+from daltek.daltek.services.preview import (
+    CLAIM_SCRIPT,
+    PREVIEW_CACHE_PREFIX,
+    error_code,
+    run_preview,
+    session_hash,
+)
+from daltek.daltek.services.replica import ReplicaRouter
+from daltek.daltek.services.snapshots import public_widget_data, regenerate_snapshot
+from daltek.daltek.services.warmup import collect_warmup_tasks, run_tasks
+from daltek.daltek.services.widget_data import (
+    load_pipeline_widget,
+    load_widget_data,
+    load_widgets_data,
+)
+from daltek.daltek.services.workload import clear_workload, get_workload, record_query
 
 
 class TestDaltek(FrappeTestCase):
     pass
+
+
+class TestIndexAdvisor(FrappeTestCase):
+    def test_fingerprint_ignores_literals(self):
+        self.assertEqual(
+            fingerprint_sql("SELECT name FROM `tabItem` WHERE item_group = 'A'"),
+            fingerprint_sql("select name from `tabItem`  where item_group = 'B';"),
+        )
+
+    def test_column_usage_roles(self):
+        usage = extract_column_usage(
+            "SELECT a.name FROM `tabSales Invoice` a "
+            "JOIN `tabSales Invoice Item` b ON b.parent = a.name "
+            "WHERE a.customer = 'X' AND a.posting_date > '2025-01-01' "
+            "ORDER BY a.posting_date"
+        )
+        self.assertIn(("tabSales Invoice Item", "parent", "join"), usage["columns"])
+        self.assertIn(("tabSales Invoice", "customer", "eq"), usage["columns"])
+        self.assertIn(("tabSales Invoice", "posting_date", "range"), usage["columns"])
+
+    def test_suggests_equality_then_range(self):
+        advisor = IndexAdvisor()
+        advisor.add_query(
+            "SELECT name FROM `tabItem` WHERE item_group = 'A' AND modified > '2025'",
+            total_time=1.0,
+        )
+        suggestions = advisor.suggest_indexes()
+        self.assertEqual(
+            suggestions["tabItem"][0]["columns"], ["item_group", "modified"]
+        )
+
+        covered = advisor.suggest_indexes(
+            existing_indexes={"tabItem": [["item_group", "modified", "name"]]}
+        )
+        self.assertEqual(covered, {})
+
+
+class TestQueryWorkload(FrappeTestCase):
+    def setUp(self):
+        clear_workload()
+
+    def tearDown(self):
+        clear_workload()
+
+    def test_executions_are_accumulated_per_fingerprint(self):
+        record_query("SELECT name FROM `tabItem` WHERE item_group = 'A'", 0.5)
+        record_query("SELECT name FROM `tabItem` WHERE item_group = 'B'", 1.5)
+
+        (entry,) = get_workload().values()
+        self.assertEqual(entry["count"], 2)
+        self.assertAlmostEqual(entry["total_time"], 2.0)
+        self.assertAlmostEqual(entry["max_time"], 1.5)
+        self.assertIn("item_group = 'A'", entry["sql"])
+
+
+class TestCostGuard(FrappeTestCase):
+    def test_nested_loop_cost_and_flags(self):
+        plan = [
+            {"table": "a", "type": "ALL", "rows": 50000, "filtered": 10},
+            {"table": "b", "type": "ref", "rows": 4, "Extra": "Using where"},
+        ]
+        guard = CostGuard(budget=40000, large_table_rows=10000)
+        estimate = guard.estimate(plan)
+
+        self.assertEqual(estimate.rows_examined, 50000 + 5000 * 4)
+        self.assertEqual(estimate.to_dict()["full_scans"], ["a"])
+        self.assertTrue(guard.is_over_budget(estimate))
+
+
+class _StandInConnection:
+    """Sustituto de una conexión MariaDB para probar el enrutado."""
+
+    def __init__(self, node, lag=0, fail=False):
+        self.node = node
+        self.lag = lag
+        self.fail = fail
+        self.statements = []
+
+    def sql(self, query, values=(), as_dict=False):
+        self.statements.append(query)
+        if query.startswith("SHOW SLAVE STATUS"):
+            return [{"Seconds_Behind_Master": self.lag}]
+        if self.fail:
+            raise Exception("replica caída")
+        return [{"node": self.node}]
+
+    def close(self):
+        pass
+
+
+class TestReplicaRouter(FrappeTestCase):
+    def test_routes_to_replica_when_in_sync(self):
+        router = ReplicaRouter(lambda: _StandInConnection("replica", lag=1))
+        rows, meta = router.run("SELECT 1", _StandInConnection("primary"))
+        self.assertEqual(rows[0]["node"], "replica")
+        self.assertEqual(meta["node"], "replica")
+
+    def test_pooled_connection_is_rolled_back_between_uses(self):
+        replica = _StandInConnection("replica")
+        router = ReplicaRouter(lambda: replica, pool_size=1)
+        primary = _StandInConnection("primary")
+
+        router.run("SELECT 1", primary)
+        router.run("SELECT 2", primary)
+
+        # Cada uso termina su transacción: el siguiente ve datos nuevos
+        self.assertEqual(
+            replica.statements,
+            ["SHOW SLAVE STATUS", "SELECT 1", "ROLLBACK", "SELECT 2", "ROLLBACK"],
+        )
+        self.assertEqual(primary.statements, [])
+
+    def test_falls_back_on_lag_or_error(self):
+        primary = _StandInConnection("primary")
+
+        lagging = ReplicaRouter(lambda: _StandInConnection("replica", lag=120))
+        rows, meta = lagging.run("SELECT 1", primary)
+        self.assertEqual((rows[0]["node"], meta["reason"]), ("primary", "replica_lag"))
+
+        broken = ReplicaRouter(lambda: _StandInConnection("replica", fail=True))
+        rows, meta = broken.run("SELECT 1", primary)
+        self.assertEqual(
+            (rows[0]["node"], meta["reason"]), ("primary", "replica_error")
+        )
+
+
+class TestQueryDefinition(FrappeTestCase):
+    def test_compiles_link_join(self):
+        sql = compile_query_definition(
+            {
+                "doctype": "Sales Invoice",
+                "columns": ["name", "Customer.territory"],
+                "filters": [{"col": "Customer.territory", "op": "=", "val": "O'Neil"}],
+                "joins": [
+                    {
+                        "doctype": "Customer",
+                        "path": [
+                            {
+                                "from": "Sales Invoice",
+                                "to": "Customer",
+                                "fieldname": "customer",
+                                "kind": "link",
+                                "owner": "Sales Invoice",
+                            }
+                        ],
+                    }
+                ],
+            }
+        ).build()
+
+        self.assertIn(
+            "LEFT JOIN `tabCustomer` AS `Customer` "
+            "ON `Customer`.`name` = `Sales Invoice`.`customer`",
+            sql,
+        )
+        self.assertIn("`Customer`.`territory` = 'O''Neil'", sql)
+
+    def test_limit_survives_limit_named_columns(self):
+        sql = compile_query_definition(
+            {
+                "doctype": "Customer",
+                "columns": ["name", "credit_limit"],
+                "filters": [{"col": "credit_limit", "op": ">", "val": 0}],
+                "limit": 100,
+            }
+        ).build()
+
+        self.assertTrue(sql.endswith("LIMIT 100"))
+
+    def test_row_conditions_keep_left_join_rows(self):
+        sql = compile_query_definition(
+            {
+                "doctype": "Sales Invoice",
+                "columns": ["name", "Customer.territory"],
+                "joins": [
+                    {
+                        "doctype": "Customer",
+                        "path": [
+                            {
+                                "from": "Sales Invoice",
+                                "to": "Customer",
+                                "fieldname": "customer",
+                                "kind": "link",
+                                "owner": "Sales Invoice",
+                            }
+                        ],
+                    }
+                ],
+            },
+            row_conditions={
+                "Sales Invoice": alias_condition(
+                    "Sales Invoice", "`tabSales Invoice`.`company` in ('A')"
+                ),
+                "Customer": "`Customer`.`owner` = 'u@x.com'",
+            },
+        ).build()
+
+        self.assertIn(
+            "ON `Customer`.`name` = `Sales Invoice`.`customer` "
+            "AND (`Customer`.`owner` = 'u@x.com')",
+            sql,
+        )
+        self.assertIn("WHERE (`Sales Invoice`.`company` in ('A'))", sql)
+
+    def test_rejects_unjoined_columns(self):
+        with self.assertRaises(ValueError):
+            compile_query_definition({"doctype": "Item", "columns": ["Customer.name"]})
+
+
+class TestChildTablePermissions(FrappeTestCase):
+    def test_rows_follow_the_parent_document(self):
+        permissions = child_table_permissions(
+            "Sales Invoice Item",
+            {
+                "Sales Invoice": {
+                    "read": True,
+                    "condition": "`tabSales Invoice`.`company` in ('A')",
+                },
+                "POS Invoice": {"read": False, "condition": ""},
+            },
+        )
+
+        self.assertTrue(permissions["read"])
+        condition = alias_condition("Sales Invoice Item", permissions["condition"])
+        self.assertEqual(
+            condition,
+            "((`Sales Invoice Item`.`parenttype` = 'Sales Invoice' AND "
+            "`Sales Invoice Item`.`parent` IN (SELECT `name` FROM "
+            "`tabSales Invoice` WHERE `tabSales Invoice`.`company` in ('A'))))",
+        )
+
+    def test_unrestricted_only_if_every_parent_is(self):
+        open_parent = {"read": True, "condition": ""}
+        self.assertEqual(
+            child_table_permissions("Has Role", {"User": open_parent}),
+            {"read": True, "condition": ""},
+        )
+        partial = child_table_permissions(
+            "Has Role",
+            {"User": open_parent, "Web Form": {"read": False, "condition": ""}},
+        )
+        self.assertEqual(
+            partial["condition"], "((`tabHas Role`.`parenttype` = 'User'))"
+        )
+
+    def test_child_without_readable_parent_is_rejected(self):
+        self.assertFalse(child_table_permissions("Has Role", {})["read"])
+
+        with patch(
+            "daltek.daltek.services.permissions.get_child_parents", return_value=[]
+        ):
+            permissions = compute_permission_conditions("Has Role", "test@example.com")
+        self.assertEqual(permissions, {"read": False, "condition": ""})
+
+
+class TestCrossfilter(FrappeTestCase):
+    def _manager(self):
+        manager = PlotlyDataManager()
+        manager.add_dataset(
+            "sales",
+            Dataset(
+                [
+                    {"region": "Norte", "total": 10, "month": 1},
+                    {"region": "Sur", "total": 5, "month": 2},
+                    {"region": "Norte", "total": None, "month": 3},
+                    {"region": None, "total": 7, "month": 3},
+                ]
+            ),
+        )
+        manager.add_widget("by_region", "sales", "count")
+        manager.add_widget("total", "sales", "sum", "total")
+        manager.add_widget("rows", "sales", limit=1)
+        return manager
+
+    def test_filters_other_widgets_in_memory(self):
+        results = self._manager().crossfilter(
+            [
+                {"column": "region", "values": ["Norte"], "widget_id": "by_region"},
+                {"column": "month", "range": [1, 3]},
+            ]
+        )
+
+        self.assertEqual(results["by_region"]["value"], 2)
+        self.assertEqual(results["total"]["value"], 10)
+        self.assertEqual(results["rows"]["count"], 1)
+
+    def test_dataset_query_is_bounded_with_limit_named_columns(self):
+        queries = {"q1": {"doctype": "Customer", "columns": ["credit_limit"]}}
+        executed = []
+
+        def run_widget_query(sql, version):
+            executed.append(sql)
+            return [], {"node": "primary"}, False
+
+        with patch(
+            "daltek.daltek.services.crossfilter.resolve_query_joins",
+            side_effect=lambda query: query,
+        ), patch(
+            "daltek.daltek.services.crossfilter.compile_secure_definition",
+            side_effect=compile_query_definition,
+        ), patch(
+            "daltek.daltek.services.crossfilter.run_widget_query",
+            side_effect=run_widget_query,
+        ):
+            get_dashboard_datasets(queries)
+
+        self.assertTrue(executed[0].endswith("LIMIT 50001"))
+
+    def test_empty_selection_aggregates_to_null(self):
+        results = self._manager().crossfilter(
+            [{"column": "region", "values": ["Este"]}], ["total"]
+        )
+
+        self.assertEqual(results, {"total": {"success": True, "value": None}})
+
+
+class TestPipelineMemoization(FrappeTestCase):
+    def test_shared_prefix_is_computed_once(self):
+        manager = PlotlyDataManager()
+        manager.add_dataset(
+            "sales",
+            Dataset(
+                [
+                    {"region": "Norte", "status": "Paid", "total": 10},
+                    {"region": "Sur", "status": "Paid", "total": 5},
+                    {"region": "Norte", "status": "Draft", "total": 7},
+                ]
+            ),
+            version="v1",
+        )
+        paid = {"op": "filter_rows", "args": {"status": "Paid"}}
+
+        by_region = manager.run_pipeline(
+            "sales", [paid, {"op": "group_by", "args": ["region", {"total": "sum"}]}]
+        )
+        ranked = manager.run_pipeline(
+            "sales", [paid, {"op": "sort_by", "args": {"column": "total"}}]
+        )
+
+        stats = manager.pipeline_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 3))
+        self.assertEqual(
+            by_region.to_dict(),
+            [
+                {"region": "Norte", "total": 10},
+                {"region": "Sur", "total": 5},
+            ],
+        )
+        self.assertEqual(ranked.df["total"].tolist(), [5, 10])
+        self.assertEqual(
+            ranked.lineage,
+            manager.get_dataset("sales")
+            .filter_rows(status="Paid")
+            .sort_by("total")
+            .lineage,
+        )
+
+    def test_cache_is_bounded(self):
+        manager = PlotlyDataManager(max_cached_steps=2)
+        manager.add_dataset("sales", Dataset([{"total": n} for n in range(5)]))
+
+        for n in range(3):
+            manager.filter_dataset("sales", total=n)
+
+        stats = manager.pipeline_stats()
+        self.assertEqual((stats["entries"], stats["evictions"]), (2, 1))
+
+
+class TestChunkedAggregation(FrappeTestCase):
+    rows = [
+        {"region": "Norte", "year": 2023, "total": 10, "discount": 1.5},
+        {"region": "Sur", "year": 2024, "total": 5, "discount": 0.0},
+        {"region": "Norte", "year": 2024, "total": 7, "discount": 0.5},
+        {"region": None, "year": 2023, "total": 3, "discount": None},
+        {"region": "Sur", "year": 2023, "total": 8, "discount": 1.0},
+    ]
+
+    def _chunked(self):
+        columns = list(self.rows[0])
+        # Bloques de dos filas como tuplas, como los entrega el cursor
+        return ChunkedDataset(
+            lambda: (
+                [tuple(row.values()) for row in self.rows[i : i + 2]]
+                for i in range(0, len(self.rows), 2)
+            ),
+            columns=columns,
+        )
+
+    def test_group_by_and_pivot_match_in_memory(self):
+        dataset = Dataset(self.rows)
+        agg = {"total": ["sum", "min", "max"], "discount": ["mean", "std"]}
+
+        grouped = self._chunked().group_by("region", agg).df
+        pivoted = self._chunked().pivot("region", "year", "total").df
+
+        self.assertEqual(
+            grouped.round(9).to_dict(),
+            dataset.group_by("region", agg).df.round(9).to_dict(),
+        )
+        self.assertEqual(
+            pivoted.to_dict(), dataset.pivot("region", "year", "total").df.to_dict()
+        )
+
+    def test_describe_matches_in_memory(self):
+        described = self._chunked().describe()
+
+        self.assertEqual(
+            described.round(9).to_dict(),
+            Dataset(self.rows).describe().round(9).to_dict(),
+        )
+
+
+class TestQueryEngineAggregates(FrappeTestCase):
+    def _invoices(self):
+        return QueryEngine().select("*").from_table("`tabSales Invoice`")
+
+    def test_time_bucket_fills_gaps(self):
+        sql = (
+            self._invoices()
+            .time_bucket("posting_date", Sum("grand_total"), "month", "2024-01-01")
+            .build()
+        )
+        self.assertTrue(sql.startswith("WITH RECURSIVE agg AS ("))
+        self.assertIn("posting_date >= DATE('2024-01-01')", sql)
+        self.assertIn("LEFT JOIN agg ON agg.bucket = buckets.bucket", sql)
+
+    def test_time_bucket_with_start_only(self):
+        sql = (
+            self._invoices()
+            .time_bucket("posting_date", Sum("grand_total"), "day", start="2024-01-01")
+            .build()
+        )
+        self.assertIn("SELECT DATE(DATE('2024-01-01')) AS first_bucket", sql)
+        self.assertIn("(SELECT MAX(bucket) FROM agg) AS last_bucket", sql)
+
+    def test_top_n_remainder_uses_measure_function(self):
+        def top(measure):
+            return self._invoices().top_n("customer", measure, n=3).build()
+
+        self.assertIn("MIN(ranked.value) AS value", top(Min("grand_total")))
+        self.assertIn(
+            "SUM(ranked.value_sum) / SUM(ranked.value_count) AS value",
+            top(Avg("grand_total")),
+        )
+        with self.assertRaises(ValueError):
+            top("COUNT(DISTINCT customer)")
+
+    def test_summary_table_pushes_top_n_to_sql(self):
+        executed = []
+        manager = PlotlyDataManager(executor=lambda sql: executed.append(sql) or [])
+        manager.add_query("invoices", self._invoices())
+
+        manager.summary_table(
+            "invoices", group_by="customer", agg={"grand_total": "sum"}, top_n=5
+        )
+
+        self.assertEqual(len(executed), 1)
+        self.assertIn("ROW_NUMBER() OVER (ORDER BY SUM(grand_total) DESC)", executed[0])
+        self.assertIn("ELSE 'Otros' END", executed[0])
+        self.assertNotIn("invoices", manager.datasets)
+
+
+class TestSparsePivot(FrappeTestCase):
+    def test_known_cardinality_compiles_to_conditional_aggregation(self):
+        executed = []
+
+        def executor(sql):
+            executed.append(sql)
+            if "col_key" in sql:
+                return [{"col_key": "Almacén A"}, {"col_key": "Almacén B"}]
+            return [{"row_key": "ITEM-1", "c0": 5, "c1": None}]
+
+        manager = PlotlyDataManager(executor=executor)
+        manager.add_query("stock", QueryEngine().select("*").from_table("`tabBin`"))
+
+        pivot = manager.pivot_table("stock", "item_code", "warehouse", "actual_qty")
+
+        self.assertIn(
+            "SUM(CASE WHEN warehouse = 'Almacén B' THEN actual_qty END) AS c1",
+            executed[1],
+        )
+        self.assertEqual(
+            pivot.to_payload(),
+            {
+                "format": "csr",
+                "shape": [1, 2],
+                "rows": ["ITEM-1"],
+                "columns": ["Almacén A", "Almacén B"],
+                "fill_value": 0,
+                "data": [5],
+                "indptr": [0, 1],
+                "indices": [0],
+            },
+        )
+
+    def test_count_pivot_leaves_missing_cells_empty(self):
+        sql = (
+            QueryEngine()
+            .select("*")
+            .from_table("`tabBin`")
+            .pivot("item_code", "warehouse", "*", "count", column_values=["W1", "W2"])
+            .build()
+        )
+
+        self.assertIn("SUM(CASE WHEN warehouse = 'W1' THEN 1 END) AS c0", sql)
+        self.assertNotIn("COUNT(", sql)
+
+    def test_sparse_pivot_matches_dense_pivot(self):
+        rows = [
+            {"item": "B", "warehouse": "W2", "qty": 3},
+            {"item": "A", "warehouse": "W1", "qty": 1},
+            {"item": "A", "warehouse": "W1", "qty": 4},
+        ]
+
+        pivot = Dataset(rows).sparse_pivot("item", "warehouse", "qty")
+
+        self.assertEqual(pivot.nnz, 2)
+        self.assertEqual(
+            pivot.to_dense("item").to_dict("records"),
+            Dataset(rows).pivot("item", "warehouse", "qty").to_dict(),
+        )
+
+
+class TestChartFactory(FrappeTestCase):
+    def test_large_scatter_uses_webgl_and_typed_arrays(self):
+        dataset = Dataset([{"x": n, "y": n / 2} for n in range(10)])
+
+        small = ChartFactory.create_chart("scatter", dataset, "x", "y").render()
+        large = ChartFactory.create_chart(
+            "scatter", dataset, "x", "y", webgl_threshold=10
+        ).render()
+
+        self.assertEqual(small["type"], "scatter")
+        self.assertEqual(small["y"][:2], [0.0, 0.5])
+        self.assertEqual(large["type"], "scattergl")
+        self.assertEqual(large["x"]["dtype"], "i4")
+        disabled = ChartFactory.create_chart(
+            "scatter", dataset, "x", "y", webgl_threshold=0
+        ).render()
+        self.assertEqual(disabled["type"], "scatter")
+        self.assertEqual(
+            np.frombuffer(base64.b64decode(large["y"]["bdata"]), "<f8").tolist(),
+            dataset.df["y"].tolist(),
+        )
+
+
+class TestResponseEncoder(FrappeTestCase):
+    rows = [
+        {
+            "name": "SINV-0001",
+            "customer": "Compañía Ñandú",
+            "grand_total": Decimal("1250.50"),
+            "posting_date": datetime.date(2024, 1, 5),
+            "modified": datetime.datetime(2024, 1, 5, 10, 30, 0, 125),
+            "status": None,
+        }
+    ]
+
+    def test_compat_mode_matches_frappe_bytes(self):
+        payload = {"message": {"success": True, "data": self.rows, "count": 1}}
+
+        self.assertEqual(
+            ResponseEncoder(fallback=json_handler).dumps(payload),
+            json.dumps(payload, default=json_handler, separators=(",", ":")).encode(),
+        )
+
+    def test_fast_mode_options_and_numpy(self):
+        encoder = ResponseEncoder("fast", decimal="str", dates="iso")
+
+        decoded = json.loads(
+            encoder.dumps({"data": self.rows, "y": np.arange(3), "n": np.int64(7)})
+        )
+
+        self.assertEqual(decoded["data"][0]["grand_total"], "1250.50")
+        self.assertEqual(decoded["data"][0]["posting_date"], "2024-01-05")
+        self.assertEqual(decoded["data"][0]["modified"], "2024-01-05T10:30:00.000125")
+        self.assertEqual(decoded["data"][0]["customer"], "Compañía Ñandú")
+        self.assertEqual(decoded["y"], [0, 1, 2])
+        self.assertEqual(decoded["n"], 7)
+
+
+class TestBenchmarkBaseline(FrappeTestCase):
+    def test_compare_flags_only_real_regressions(self):
+        baseline = {"results": {"a": {"min": 0.1}, "b": {"min": 0.001}}}
+        report = {"results": {"a": {"min": 0.2}, "b": {"min": 0.002}, "c": {"min": 1}}}
+
+        regressions = compare(report, baseline, tolerance=0.3)
+
+        self.assertEqual([r["stage"] for r in regressions], ["a"])
+        self.assertEqual(regressions[0]["ratio"], 2.0)
+
+
+class TestLoadHarness(FrappeTestCase):
+    @staticmethod
+    def target(endpoint, params):
+        if endpoint == "get_saved_queries":
+            return {"success": True, "queries": [{"doctype": "Sales Invoice"}]}
+        if endpoint == "execute_query_builder_sql":
+            return {"success": False, "error": "timeout"}
+        return {"success": True}
+
+    def test_report_per_endpoint(self):
+        report = run_load(
+            self.target, "DASH-0001", users=3, iterations=2, think_time=(0, 0)
+        )
+
+        endpoints = report["endpoints"]
+        self.assertEqual(report["totals"]["requests"], 24)
+        self.assertEqual(endpoints["get_doctype_fields"]["requests"], 6)
+        self.assertEqual(endpoints["execute_query_builder_sql"]["error_rate"], 1.0)
+        self.assertEqual(endpoints["get_drag_drop_html"]["errors"], 0)
+        self.assertIn("p95", endpoints["get_saved_queries"]["latency"])
+
+    def test_compare_flags_error_rate_and_latency(self):
+        def endpoint(p95, throughput, error_rate):
+            return {
+                "latency": {"p95": p95},
+                "throughput": throughput,
+                "error_rate": error_rate,
+            }
+
+        baseline = {"endpoints": {"a": endpoint(0.1, 50, 0), "b": endpoint(0.1, 50, 0)}}
+        report = {"endpoints": {"a": endpoint(0.2, 50, 0), "b": endpoint(0.1, 49, 0.2)}}
+
+        regressions = compare_load(report, baseline, tolerance=0.3)
+
+        self.assertEqual(
+            [(r["endpoint"], r["metric"]) for r in regressions],
+            [("a", "p95"), ("b", "error_rate")],
+        )
+
+
+class TestExporters(FrappeTestCase):
+    def test_csv_is_streamed_per_chunk(self):
+        chunks = [[(1, "a")], [(2, "b, c")]]
+
+        blocks = list(iter_csv(["id", "name"], iter(chunks)))
+
+        self.assertEqual(len(blocks), 2)
+        self.assertEqual(
+            b"".join(blocks).decode("utf-8-sig"), 'id,name\r\n1,a\r\n2,"b, c"\r\n'
+        )
+
+
+class TestWidgetData(FrappeTestCase):
+    def test_visible_widgets_are_served_first(self):
+        doc = frappe._dict(
+            layout=frappe.as_json([{"id": "w1", "properties": {}}, {"id": "w2"}]),
+            query_data_storage="[]",
+        )
+
+        data = load_widgets_data(
+            doc,
+            [
+                {"widget_id": "w2", "priority": "prefetch"},
+                {"widget_id": "w1", "priority": "visible"},
+            ],
+            time_budget=-1,
+        )
+
+        self.assertEqual(list(data["results"]), ["w1"])
+        self.assertEqual(data["deferred"], ["w2"])
+
+    def test_pipeline_query_is_bounded_with_limit_named_columns(self):
+        definition = {"doctype": "Customer", "columns": ["name", "credit_limit"]}
+        executed = []
+
+        def run_widget_query(sql, version):
+            executed.append(sql)
+            return [{"name": "C1", "credit_limit": 10}], {"node": "primary"}, False
+
+        with patch(
+            "daltek.daltek.services.widget_data.compile_secure_definition",
+            side_effect=compile_query_definition,
+        ), patch(
+            "daltek.daltek.services.widget_data.run_widget_query",
+            side_effect=run_widget_query,
+        ):
+            data = load_pipeline_widget(
+                "q1",
+                definition,
+                {"pipeline": [{"op": "sort_by", "args": {"column": "credit_limit"}}]},
+                PlotlyDataManager(),
+            )
+
+        self.assertEqual(data["count"], 1)
+        self.assertTrue(executed[0].endswith("LIMIT 50001"))
+
+    def test_widget_data_includes_its_chart(self):
+        widget = {
+            "id": "w1",
+            "properties": {
+                "query_id": "q1",
+                "chart": {"type": "scatter", "x": "region", "y": "total"},
+            },
+        }
+        rows = [{"region": "Norte", "total": 10}, {"region": "Sur", "total": 5}]
+
+        with patch(
+            "daltek.daltek.services.widget_data.resolve_query_joins",
+            side_effect=lambda query: query,
+        ), patch(
+            "daltek.daltek.services.widget_data.load_dataset",
+            return_value={"success": True, "rows": rows, "count": 2},
+        ), patch(
+            "daltek.daltek.services.widget_data.get_widget_settings",
+            return_value=frappe._dict(webgl_threshold=2),
+        ):
+            data = load_widget_data(widget, {"q1": {"doctype": "Sales Invoice"}})
+
+        self.assertEqual(data["chart"]["type"], "scattergl")
+        self.assertEqual(public_widget_data(widget, data)["chart"], data["chart"])
+
+
+class TestExecutionPlan(FrappeTestCase):
+    def test_widgets_share_datasets(self):
+        plan = ExecutionPlan(link_version="a1b2c3d4e5")
+        plan.add_query("q1", {"doctype": "Item"}, "SELECT 1", "fp", ["Item"])
+        plan.add_query("q2", {"doctype": "Item"}, "SELECT 1", "fp", ["Item"])
+        plan.add_query_error("q3", "No existe relación entre Item y Customer")
+        built = []
+
+        def build_sql(query, spec):
+            built.append(spec)
+            return f"{query['sql']} /* {spec} */"
+
+        total = {"query_id": "q1", "aggregate": "COUNT", "chart": {"type": "bar"}}
+        first = plan.add_widget("w1", total, build_sql)
+        second = plan.add_widget("w2", {**total, "query_id": "q2", "chart": None})
+        rows = plan.add_widget("w3", {"query_id": "q1"}, build_sql)
+        plan.add_widget("w4", {"query_id": "q3"}, build_sql)
+        plan.add_widget("w5", {}, build_sql)
+        data = plan.as_dict()
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, rows)
+        self.assertEqual(built, [{"aggregate": "count"}, {"limit": 100}])
+        self.assertEqual(data["datasets"][first]["query_id"], "q1")
+        self.assertEqual(data["widgets"]["w1"]["chart"], {"type": "bar"})
+        self.assertIn("relación", data["widgets"]["w4"]["error"])
+        self.assertIn("error", data["widgets"]["w5"])
+        self.assertEqual(data["doctypes"], ["Item"])
+        self.assertTrue(is_current(data, "a1b2c3d4e5"))
+        self.assertFalse(is_current(data, "f6a7b8c9d0"))
+
+    def test_link_version_never_repeats_after_a_cache_flush(self):
+        compiled = get_link_graph_version()
+
+        frappe.cache().delete_value(LINK_GRAPH_VERSION_KEY)
+        flushed = get_link_graph_version()
+        clear_link_graph_cache()
+
+        self.assertNotEqual(flushed, compiled)
+        self.assertNotIn(get_link_graph_version(), (compiled, flushed))
+
+
+class TestCacheWarmup(FrappeTestCase):
+    def _plan(self):
+        plan = ExecutionPlan()
+        plan.add_query("q1", {"doctype": "Item"}, "SELECT 1", "fp", ["Item"])
+        plan.add_widget("w1", {"query_id": "q1", "aggregate": "count"})
+        plan.add_widget("w2", {"query_id": "q1", "aggregate": "count", "chart": {}})
+        plan.add_widget("w3", {"query_id": "q1", "pivot": {"index": "a"}})
+        plan.add_widget("w4", {"query_id": "missing"})
+        return plan.as_dict()
+
+    def test_tasks_are_plan_datasets_without_repeats(self):
+        seen = set()
+        with patch(
+            "daltek.daltek.services.warmup.get_execution_plan",
+            return_value=self._plan(),
+        ):
+            tasks = collect_warmup_tasks(frappe._dict(name="D1"), seen)
+            again = collect_warmup_tasks(frappe._dict(name="D2"), seen)
+
+        self.assertEqual([task["widgets"] for task in tasks], [["w1", "w2"], ["w3"]])
+        self.assertEqual(again, [])
+
+    def test_counts_warmed_cached_and_failed(self):
+        tasks = [
+            {"dashboard": "D1", "widgets": [w], "dataset": w, "plan": {}}
+            for w in ("w1", "w2", "w3", "w4")
+        ]
+        results = [
+            {"success": True, "node": "primary"},
+            {"success": True, "node": "cache"},
+            {"success": False, "error": "Sin permiso"},
+            Exception("conexión perdida"),
+        ]
+        with patch(
+            "daltek.daltek.services.warmup.load_plan_dataset", side_effect=results
+        ):
+            counts = run_tasks(tasks)
+
+        self.assertEqual(counts, {"warmed": 1, "cached": 1, "failed": 2})
+
+
+class TestDataVersion(FrappeTestCase):
+    def test_doctypes_include_joins_and_subqueries(self):
+        sql = (
+            "SELECT * FROM (SELECT s.name FROM `tabSales Invoice` s "
+            "LEFT JOIN `tabCustomer` AS c ON c.name = s.customer) AS ranked"
+        )
+        self.assertEqual(doctypes_from_sql(sql), ["Customer", "Sales Invoice"])
+
+    def test_revalidation_depends_on_literals_and_version(self):
+        sql = "SELECT name FROM `tabItem` WHERE item_group = 'A'"
+        current = {"fingerprint": query_fingerprint(sql), "data_version": "v1"}
+
+        self.assertTrue(is_unchanged(current, query_fingerprint(sql), "v1"))
+        self.assertFalse(is_unchanged(current, query_fingerprint(sql), "v0"))
+        self.assertFalse(
+            is_unchanged(current, query_fingerprint(sql.replace("'A'", "'B'")), "v1")
+        )
+
+    def test_child_tables_are_versioned_after_commit(self):
+        doc = frappe.new_doc("User")
+        sql = "SELECT parent FROM `tabHas Role`"
+        before = get_query_version(sql)
+
+        with patch.object(frappe.db, "after_commit") as after_commit:
+            bump_doctype_version(doc)
+        self.assertIn("Has Role", changed_doctypes(doc))
+        # Hasta el commit la versión no cambia
+        self.assertEqual(get_query_version(sql), before)
+
+        callback = after_commit.add.call_args.args[0]
+        callback()
+        self.assertNotEqual(get_query_version(sql), before)
+
+    def test_rows_read_while_version_changes_are_not_settled(self):
+        sql = "SELECT name FROM `tabToDo`"
+        version = get_query_version(sql)
+        self.assertTrue(is_settled(sql, version, {"node": "primary"}))
+
+        increment_versions(["ToDo"])
+        self.assertFalse(is_settled(sql, version, {"node": "primary"}))
+
+        # La réplica puede no tener todavía el cambio recién versionado
+        current = get_query_version(sql)
+        self.assertTrue(is_settled(sql, current, {"node": "primary"}))
+        self.assertFalse(
+            is_settled(sql, current, {"node": "replica", "max_staleness": 35})
+        )
+
+
+class TestDashboardSnapshot(FrappeTestCase):
+    def test_snapshot_is_built_as_the_dashboard_owner(self):
+        doc = frappe._dict(name="D1", owner="Guest", is_public=1)
+        current_user = frappe.session.user
+        users = []
+
+        def build_snapshot(doc, previous=None):
+            users.append(frappe.session.user)
+            return {"hash": "h1"}
+
+        module = "daltek.daltek.services.snapshots"
+        with patch(f"{module}.frappe.get_doc", return_value=doc), patch(
+            f"{module}.get_execution_plan", return_value={"doctypes": []}
+        ), patch(f"{module}.build_snapshot", side_effect=build_snapshot), patch(
+            f"{module}.clear_snapshot_page_cache"
+        ):
+            self.addCleanup(frappe.cache().delete_value, "daltek_dashboard_snapshot:D1")
+            regenerate_snapshot("D1", force=True)
+
+        self.assertEqual(users, ["Guest"])
+        self.assertEqual(frappe.session.user, current_user)
+
+    def test_public_data_drops_raw_rows(self):
+        widget = {"id": "w1", "properties": {"chart": {"x": "region", "y": "total"}}}
+        rows = [{"region": "Norte", "total": 10}, {"region": "Sur", "total": 5}]
+
+        published = public_widget_data(
+            widget, {"success": True, "rows": rows, "count": 2, "node": "primary"}
+        )
+
+        self.assertNotIn("rows", published)
+        self.assertNotIn("node", published)
+        self.assertEqual(published["count"], 2)
+        self.assertEqual(published["chart"]["x"], ["Norte", "Sur"])
+
+
+class TestAdmissionControl(FrappeTestCase):
+    def test_rejects_when_user_bucket_is_empty(self):
+        conf = {
+            "daltek_user_rate": 0.001,
+            "daltek_user_burst": 2,
+            "daltek_admission_max_wait": 0.01,
+        }
+        cache = frappe.cache()
+        bucket = cache.make_key(BUCKET_CACHE_PREFIX + "user:" + frappe.session.user)
+        cache.execute_command("DEL", bucket)
+        self.addCleanup(cache.execute_command, "DEL", bucket)
+
+        with patch.dict(frappe.conf, conf):
+            for _ in range(2):
+                with admit("test"):
+                    pass
+            with self.assertRaises(frappe.TooManyRequestsError):
+                with admit("test"):
+                    pass
+
+        self.assertGreaterEqual(frappe.local.response["retry_after"], 1)
+
+
+class TestQueryPreview(FrappeTestCase):
+    # Como en el endpoint, el motor emite el LIMIT de la vista previa
+    sql = compile_query_definition(
+        {"doctype": "Customer", "columns": ["name", "credit_limit"], "limit": 20}
+    ).build()
+
+    def setUp(self):
+        self.statements = []
+        cache = frappe.cache()
+        self.key = cache.make_key(PREVIEW_CACHE_PREFIX + session_hash("qb-1"))
+        cache.execute_command("DEL", self.key)
+        self.addCleanup(cache.execute_command, "DEL", self.key)
+
+    def fake_sql(self, query, values=(), as_dict=False):
+        self.statements.append(query)
+        if query == "SELECT CONNECTION_ID()":
+            return [[42]]
+        if "PROCESSLIST" in query:
+            return [[7]]
+        return []
+
+    def test_newer_preview_kills_previous_query(self):
+        frappe.cache().eval(CLAIM_SCRIPT, 1, self.key, 1, 7, 60)
+
+        with patch.object(frappe.db, "sql", self.fake_sql):
+            result = run_preview(self.sql, "qb-1", 2)
+
+        self.assertEqual(result["count"], 0)
+        self.assertIn("KILL QUERY 7", self.statements)
+        self.assertTrue(self.statements[-1].startswith("SET STATEMENT"))
+        self.assertIn("daltek-preview:", self.statements[-1])
+        self.assertTrue(self.statements[-1].endswith("LIMIT 20"))
+
+    def test_preview_claimed_during_cancellation_does_not_run(self):
+        frappe.cache().eval(CLAIM_SCRIPT, 1, self.key, 1, 7, 60)
+
+        def fake_sql(query, values=(), as_dict=False):
+            if query.startswith("KILL QUERY"):
+                # Llega una vista previa más nueva mientras se cancela la 1
+                frappe.cache().eval(CLAIM_SCRIPT, 1, self.key, 3, 9, 60)
+            return self.fake_sql(query, values, as_dict)
+
+        with patch.object(frappe.db, "sql", fake_sql):
+            result = run_preview(self.sql, "qb-1", 2)
+
+        self.assertTrue(result["superseded"])
+        self.assertFalse(any("SET STATEMENT" in query for query in self.statements))
+
+    def test_older_preview_is_superseded_without_running(self):
+        frappe.cache().eval(CLAIM_SCRIPT, 1, self.key, 5, 7, 60)
+
+        with patch.object(frappe.db, "sql", self.fake_sql):
+            result = run_preview(self.sql, "qb-1", 4)
+
+        self.assertTrue(result["superseded"])
+        self.assertFalse(any("SET STATEMENT" in query for query in self.statements))
+
+    def test_error_code_unwraps_frappe_errors(self):
+        interrupted = Exception(1317, "Query execution was interrupted")
+        wrapped = frappe.QueryTimeoutError(interrupted)
+
+        self.assertEqual(error_code(interrupted), 1317)
+        self.assertEqual(error_code(wrapped), 1317)
+        self.assertIsNone(error_code(ValueError("x")))
+
+
+class TestMetricsExposition(FrappeTestCase):
+    def test_unknown_methods_share_one_series(self):
+        prefix = "/api/method/daltek.daltek.doctype.daltek.daltek."
+        self.assertEqual(
+            endpoint_label(prefix + "get_widgets_data"), "get_widgets_data"
+        )
+        self.assertEqual(endpoint_label(prefix + "no_such_method_123"), "other")
+        self.assertEqual(
+            endpoint_label("/api/method/daltek.hooks.get_widgets_data"), "other"
+        )
+
+    def test_histogram_buckets_are_cumulative(self):
+        buffer = MetricsBuffer()
+        for seconds in (0.003, 0.2, 45):
+            buffer.observe("daltek_query_duration_seconds", seconds, node="primary")
+        buffer.inc("daltek_cache_requests_total", cache="widget_result", result="hit")
+
+        text = render_exposition(buffer.drain())
+
+        self.assertIn(
+            'daltek_query_duration_seconds_bucket{node="primary",le="0.005"} 1', text
+        )
+        self.assertIn(
+            'daltek_query_duration_seconds_bucket{node="primary",le="30.0"} 2', text
+        )
+        self.assertIn(
+            'daltek_query_duration_seconds_bucket{node="primary",le="+Inf"} 3', text
+        )
+        self.assertIn('daltek_query_duration_seconds_count{node="primary"} 3', text)
+        self.assertIn(
+            'daltek_cache_requests_total{cache="widget_result",result="hit"} 1', text
+        )
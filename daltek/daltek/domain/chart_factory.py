@@ -1,14 +1,84 @@
 # daltek/domain/chart_factory.py
 
+import base64
+
+import numpy as np
+import pandas as pd
+
+# Puntos a partir de los cuales las trazas usan WebGL y las columnas
+# numéricas se envían como arreglos tipados
+DEFAULT_WEBGL_THRESHOLD = 5000
+
+# Equivalente WebGL de cada tipo de traza de Plotly
+WEBGL_TRACES = {"scatter": "scattergl"}
+
+
+def typed_array(series):
+    """
+    Columna numérica sin nulos como arreglo tipado de Plotly
+    ({"dtype", "bdata"} en base64): ocupa menos que la lista JSON y el
+    navegador la decodifica sin parsear número por número. Si la columna
+    no es numérica o tiene nulos se devuelve como lista.
+    """
+    if (
+        not pd.api.types.is_numeric_dtype(series)
+        or pd.api.types.is_bool_dtype(series)
+        or series.isna().any()
+    ):
+        return series.tolist()
+    values = series.to_numpy()
+    if pd.api.types.is_integer_dtype(series) and (
+        values.size == 0
+        or (
+            values.min() >= np.iinfo(np.int32).min
+            and values.max() <= np.iinfo(np.int32).max
+        )
+    ):
+        dtype, values = "i4", values.astype("<i4")
+    else:
+        dtype, values = "f8", values.astype("<f8")
+    return {"dtype": dtype, "bdata": base64.b64encode(values.tobytes()).decode()}
+
+
 # Clases base de charts
 class ChartBase:
-    def __init__(self, dataset, x, y, title=None, color=None, style=None):
+    def __init__(
+        self,
+        dataset,
+        x,
+        y,
+        title=None,
+        color=None,
+        style=None,
+        webgl_threshold=DEFAULT_WEBGL_THRESHOLD,
+    ):
         self.dataset = dataset
         self.x = x
         self.y = y
         self.title = title or ""
         self.color = color or "blue"
         self.style = style or {}
+        # None o un umbral <= 0 desactivan WebGL
+        self.webgl_threshold = (
+            webgl_threshold if webgl_threshold and webgl_threshold > 0 else None
+        )
+
+    @property
+    def large(self):
+        """True si el chart supera el umbral de puntos para WebGL"""
+        return (
+            self.webgl_threshold is not None
+            and len(self.dataset.df) >= self.webgl_threshold
+        )
+
+    def trace_type(self, trace_type):
+        """Tipo de traza, en su versión WebGL si el chart es grande"""
+        return WEBGL_TRACES.get(trace_type, trace_type) if self.large else trace_type
+
+    def column(self, name):
+        """Valores de una columna; arreglo tipado si el chart es grande"""
+        series = self.dataset.df[name]
+        return typed_array(series) if self.large else series.tolist()
 
     def render(self):
         raise NotImplementedError("Render debe implementarse en subclases")
@@ -19,9 +89,27 @@ class BarChart(ChartBase):
     def render(self):
         return {
             "type": "bar",
-            "x": self.dataset.df[self.x].tolist(),
-            "y": self.dataset.df[self.y].tolist(),
+            "x": self.column(self.x),
+            "y": self.column(self.y),
+            "name": self.title,
+            "marker": {
+                "color": self.color,
+                **self.style,
+            },
+        }
+
+
+class LineChart(ChartBase):
+    mode = "lines"
+
+    def render(self):
+        return {
+            "type": self.trace_type("scatter"),
+            "mode": self.mode,
+            "x": self.column(self.x),
+            "y": self.column(self.y),
             "name": self.title,
+            "line": {"color": self.color},
             "marker": {
                 "color": self.color,
                 **self.style,
@@ -29,6 +117,10 @@ class BarChart(ChartBase):
         }
 
 
+class ScatterChart(LineChart):
+    mode = "markers"
+
+
 class PieChart(ChartBase):
     def render(self):
         colors = self.color
@@ -46,6 +138,54 @@ class PieChart(ChartBase):
         }
 
 
+class HeatmapChart(ChartBase):
+    """
+    Heatmap de una tabla pivote dispersa (SparsePivot). Plotly acepta x, y
+    y z como listas de celdas, así que solo se envían las celdas con dato.
+    """
+
+    def __init__(
+        self,
+        pivot,
+        title=None,
+        color=None,
+        style=None,
+        webgl_threshold=DEFAULT_WEBGL_THRESHOLD,
+    ):
+        super().__init__(
+            pivot,
+            None,
+            None,
+            title=title,
+            style=style,
+            webgl_threshold=webgl_threshold,
+        )
+        self.color = color or "Blues"
+
+    @property
+    def large(self):
+        return (
+            self.webgl_threshold is not None
+            and self.dataset.nnz >= self.webgl_threshold
+        )
+
+    def render(self):
+        x, y, z = [], [], []
+        for row, column, value in self.dataset.iter_cells():
+            x.append(column)
+            y.append(row)
+            z.append(value)
+        return {
+            "type": "heatmap",
+            "x": x,
+            "y": y,
+            "z": typed_array(pd.Series(z)) if self.large else z,
+            "name": self.title,
+            "colorscale": self.color,
+            **self.style,
+        }
+
+
 # Fábrica
 class ChartFactory:
     """
@@ -55,11 +195,25 @@ class ChartFactory:
     CHART_TYPES = {
         "bar": BarChart,
         "pie": PieChart,
-        # Se pueden agregar más tipos: "line": LineChart, etc.
+        "line": LineChart,
+        "scatter": ScatterChart,
     }
 
     @staticmethod
-    def create_chart(chart_type, dataset, x, y, title=None, color=None, style=None):
+    def create_chart(
+        chart_type,
+        dataset,
+        x,
+        y,
+        title=None,
+        color=None,
+        style=None,
+        webgl_threshold=DEFAULT_WEBGL_THRESHOLD,
+    ):
+        """
+        webgl_threshold: filas a partir de las cuales line/scatter usan
+        trazas WebGL (scattergl) con arreglos tipados; None o 0 lo desactivan
+        """
         # Validar tipo
         ChartCls = ChartFactory.CHART_TYPES.get(chart_type.lower())
         if not ChartCls:
@@ -81,4 +235,31 @@ class ChartFactory:
             raise ValueError("style debe ser un dict con propiedades CSS/Plotly")
 
         # Crear instancia del chart
-        return ChartCls(dataset, x, y, title=title, color=color, style=style)
+        return ChartCls(
+            dataset,
+            x,
+            y,
+            title=title,
+            color=color,
+            style=style,
+            webgl_threshold=webgl_threshold,
+        )
+
+    @staticmethod
+    def create_pivot_chart(
+        pivot,
+        title=None,
+        color=None,
+        style=None,
+        webgl_threshold=DEFAULT_WEBGL_THRESHOLD,
+    ):
+        """Heatmap de un SparsePivot; color es la escala de colores de Plotly"""
+        if style and not isinstance(style, dict):
+            raise ValueError("style debe ser un dict con propiedades CSS/Plotly")
+        return HeatmapChart(
+            pivot,
+            title=title,
+            color=color,
+            style=style,
+            webgl_threshold=webgl_threshold,
+        )
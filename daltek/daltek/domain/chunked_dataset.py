@@ -0,0 +1,381 @@
+# daltek/domain/chunked_dataset.py
+
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from .dataset import Dataset
+from .sparse_pivot import SparsePivot
+
+# Agregaciones que se combinan de forma exacta entre bloques
+CHUNKED_AGGREGATES = ("sum", "count", "min", "max", "mean", "var", "std")
+DESCRIBE_PERCENTILES = (0.25, 0.5, 0.75)
+
+
+class QuantileSketch:
+    """
+    Resumen de cuantiles combinable (estilo KLL): cada nivel guarda hasta
+    `k` valores; al llenarse se ordena y la mitad sube al nivel siguiente
+    con el doble de peso. La memoria crece con log(n/k) y no con n.
+
+    Mientras no hubo compactaciones los cuantiles son exactos (mismo
+    criterio de interpolación lineal que pandas).
+    """
+
+    def __init__(self, k=2048):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.count = 0
+        self._offset = 0
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        self.count += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def merge(self, other):
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self._compress()
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self.k:
+                items = np.sort(items)
+                keep = items[-1:] if len(items) % 2 else items[:0]
+                paired = items[: len(items) - len(keep)]
+                # Se alterna qué elemento de cada par sube para no sesgar
+                promoted = paired[self._offset :: 2]
+                self._offset ^= 1
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[level + 1] = np.concatenate(
+                    [self.levels[level + 1], promoted]
+                )
+                self.levels[level] = keep
+            level += 1
+
+    def quantile(self, q):
+        if not self.count:
+            return np.nan
+        if len(self.levels) == 1:
+            return float(np.quantile(self.levels[0], q))
+        values = np.concatenate(self.levels)
+        weights = np.concatenate(
+            [np.full(len(items), 2**level) for level, items in enumerate(self.levels)]
+        )
+        order = np.argsort(values, kind="stable")
+        cumulative = np.cumsum(weights[order])
+        rank = q * (cumulative[-1] - 1)
+        return float(values[order][np.searchsorted(cumulative, rank, side="right")])
+
+
+class ChunkedDataset:
+    """
+    Dataset que se procesa por bloques de filas (por ejemplo el cursor de
+    servidor de una consulta) sin reunir el resultado completo en memoria.
+
+    `group_by`, `pivot` y `describe` combinan agregados parciales de cada
+    bloque (sumas, conteos, mínimos, máximos y momentos de Welford/Chan
+    para media y varianza; cuantiles con QuantileSketch), así que la
+    memoria depende del tamaño del bloque y del número de grupos, no de
+    las filas. Devuelven lo mismo que los métodos de Dataset.
+
+    `filter_rows` y `select_columns` son perezosos: se aplican a cada
+    bloque al recorrerlo. El linaje se calcula igual que en Dataset, así
+    que PlotlyDataManager.run_pipeline lo memoiza de la misma forma.
+
+    Args:
+        source: iterable de bloques o función que devuelve uno nuevo en cada
+            recorrido (necesario para ejecutar más de una operación). Cada
+            bloque es un DataFrame, una lista de dicts o una lista de tuplas;
+            las columnas de las tuplas se toman de `columns` o del atributo
+            `columns` del iterable (QueryStream)
+    """
+
+    def __init__(self, source, columns=None, lineage=None, transforms=()):
+        self.source = source
+        self.columns = columns
+        # Sin versión del origen no se puede saber si dos fuentes son iguales
+        self.lineage = lineage or uuid.uuid4().hex[:20]
+        self.transforms = tuple(transforms)
+
+    def frames(self):
+        """Bloques como DataFrames con los filtros ya aplicados"""
+        stream = self.source() if callable(self.source) else self.source
+        columns = getattr(stream, "columns", None) or self.columns
+        for chunk in stream:
+            if isinstance(chunk, pd.DataFrame):
+                df = chunk
+            elif chunk and not isinstance(chunk[0], dict):
+                df = pd.DataFrame(list(chunk), columns=columns)
+            else:
+                df = pd.DataFrame(chunk)
+            for transform in self.transforms:
+                df = transform(df)
+            yield df
+
+    def derive_lineage(self, operation, *args, **kwargs):
+        """Mismo linaje que la operación equivalente sobre un Dataset"""
+        return Dataset.derive_lineage(self, operation, *args, **kwargs)
+
+    def _derive(self, operation, transform, *args, **kwargs):
+        return ChunkedDataset(
+            self.source,
+            self.columns,
+            lineage=self.derive_lineage(operation, *args, **kwargs),
+            transforms=self.transforms + (transform,),
+        )
+
+    def filter_rows(self, **conditions):
+        def transform(df):
+            for col, val in conditions.items():
+                df = df[df[col] == val]
+            return df
+
+        return self._derive("filter_rows", transform, **conditions)
+
+    def select_columns(self, *cols):
+        return self._derive("select_columns", lambda df: df[list(cols)], *cols)
+
+    def group_by(self, by, agg=None):
+        """
+        Agrupa por bloques. agg: {'col': 'sum'} o {'col': ['min', 'max']}
+        con sum, count, min, max, mean, var o std; o una lista de esas
+        funciones para todas las columnas que no son de agrupación.
+        """
+        if not agg:
+            raise ValueError("La agregación por bloques requiere indicar `agg`")
+        keys = [by] if isinstance(by, str) else list(by)
+
+        state = None
+        measures = None
+        for df in self.frames():
+            if measures is None:
+                measures = _measures(agg, [c for c in df.columns if c not in keys])
+            state = _merge_states(state, _partial_state(df, keys, measures))
+
+        if measures is None:
+            measures = _measures(agg, [])
+        result = _finalize(state, keys, measures, flat=_is_flat(agg))
+        return Dataset(
+            result.reset_index(), lineage=self.derive_lineage("group_by", by, agg)
+        )
+
+    def pivot(self, index, columns, values, aggfunc="sum"):
+        """Tabla pivote por bloques (misma salida que Dataset.pivot)"""
+        keys = _as_list(index) + _as_list(columns)
+        grouped = self.group_by(keys, {values: aggfunc}).df
+        # Cada combinación ya tiene un único valor: sumar no lo altera
+        pivoted = pd.pivot_table(
+            grouped,
+            index=index,
+            columns=columns,
+            values=values,
+            aggfunc="sum",
+            fill_value=0,
+        ).reset_index()
+        return Dataset(
+            pivoted,
+            lineage=self.derive_lineage("pivot", index, columns, values, aggfunc),
+        )
+
+    def sparse_pivot(self, index, columns, values, aggfunc="sum"):
+        """Pivote disperso por bloques (misma salida que Dataset.sparse_pivot)"""
+        grouped = self.group_by([index, columns], {values: aggfunc}).df
+        return SparsePivot.from_frame(grouped, index, columns, values)
+
+    def describe(self, sketch_size=2048):
+        """
+        Estadísticas de las columnas numéricas como Dataset.describe: conteo,
+        media y desviación con Welford/Chan, extremos exactos y percentiles
+        con QuantileSketch (exactos mientras no superen `sketch_size` valores).
+        """
+        stats = {}
+        excluded = set()
+        order = []
+        for df in self.frames():
+            for col in df.columns:
+                if col not in order:
+                    order.append(col)
+                series = df[col]
+                if series.isna().all():
+                    continue
+                if not _is_numeric(series):
+                    excluded.add(col)
+                    continue
+                values = series.dropna().to_numpy(dtype=float)
+                partial = _moments(values)
+                if col not in stats:
+                    stats[col] = {
+                        "moments": (0, 0.0, 0.0),
+                        "min": np.inf,
+                        "max": -np.inf,
+                        "sketch": QuantileSketch(sketch_size),
+                    }
+                column = stats[col]
+                column["moments"] = _merge_moments(column["moments"], partial)
+                column["min"] = min(column["min"], values.min())
+                column["max"] = max(column["max"], values.max())
+                column["sketch"].update(values)
+
+        numeric = [col for col in order if col in stats and col not in excluded]
+        if not numeric:
+            raise ValueError("describe por bloques requiere columnas numéricas")
+
+        described = {}
+        for col in numeric:
+            column = stats[col]
+            n, mean, m2 = column["moments"]
+            described[col] = [
+                float(n),
+                mean,
+                np.sqrt(m2 / (n - 1)) if n > 1 else np.nan,
+                float(column["min"]),
+                *(column["sketch"].quantile(q) for q in DESCRIBE_PERCENTILES),
+                float(column["max"]),
+            ]
+        index = ["count", "mean", "std", "min"]
+        index += [f"{q:.0%}" for q in DESCRIBE_PERCENTILES] + ["max"]
+        return pd.DataFrame(described, index=index)
+
+    def quantile(self, column, q=0.5, sketch_size=2048):
+        """Cuantil(es) aproximado(s) de una columna con QuantileSketch"""
+        sketch = QuantileSketch(sketch_size)
+        for df in self.frames():
+            sketch.update(pd.to_numeric(df[column], errors="coerce"))
+        if isinstance(q, (list, tuple)):
+            return [sketch.quantile(value) for value in q]
+        return sketch.quantile(q)
+
+    def sort_by(self, column, ascending=True):
+        raise ValueError(
+            "No se puede ordenar por bloques; agrupa antes (group_by o pivot)"
+        )
+
+
+def _as_list(value):
+    return [value] if isinstance(value, str) else list(value)
+
+
+def _is_flat(agg):
+    return isinstance(agg, dict) and all(isinstance(f, str) for f in agg.values())
+
+
+def _is_numeric(series):
+    return pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(
+        series
+    )
+
+
+def _measures(agg, other_columns):
+    """[(columna, función)] en el orden de salida de pandas"""
+    if isinstance(agg, dict):
+        measures = [
+            (col, func) for col, funcs in agg.items() for func in _as_list(funcs)
+        ]
+    else:
+        measures = [(col, func) for col in other_columns for func in _as_list(agg)]
+    for _, func in measures:
+        if func not in CHUNKED_AGGREGATES:
+            raise ValueError(f"Agregación '{func}' no soportada por bloques")
+    return measures
+
+
+def _partial_state(df, keys, measures):
+    """Agregados parciales de un bloque: {(columna, estadístico): Series}"""
+    grouped = df.groupby(keys)
+    state = {}
+    for col, func in measures:
+        if func in ("mean", "var", "std"):
+            n = grouped[col].count()
+            state[(col, "n")] = n
+            state[(col, "mean")] = grouped[col].mean().fillna(0.0)
+            state[(col, "m2")] = (grouped[col].var(ddof=0) * n).fillna(0.0)
+        else:
+            state[(col, func)] = getattr(grouped[col], func)()
+    return state
+
+
+def _merge_states(state, partial):
+    if state is None:
+        return partial
+    merged = {}
+    for key, series in partial.items():
+        stat = key[1]
+        if stat in ("n", "mean", "m2"):
+            continue
+        combined = pd.concat([state[key], series])
+        levels = list(range(combined.index.nlevels))
+        reducer = "sum" if stat in ("sum", "count") else stat
+        merged[key] = getattr(combined.groupby(level=levels), reducer)()
+
+    for col in {key[0] for key in partial if key[1] == "n"}:
+        index = state[(col, "n")].index.union(partial[(col, "n")].index)
+        a = tuple(state[(col, s)].reindex(index, fill_value=0) for s in _MOMENTS)
+        b = tuple(partial[(col, s)].reindex(index, fill_value=0) for s in _MOMENTS)
+        for stat, series in zip(_MOMENTS, _merge_moments(a, b)):
+            merged[(col, stat)] = series
+    return merged
+
+
+_MOMENTS = ("n", "mean", "m2")
+
+
+def _moments(values):
+    n = len(values)
+    if not n:
+        return (0, 0.0, 0.0)
+    mean = values.mean()
+    return (n, mean, float(((values - mean) ** 2).sum()))
+
+
+def _merge_moments(a, b):
+    """Combinación de Chan de (n, media, M2); sirve con escalares o Series"""
+    n_a, mean_a, m2_a = a
+    n_b, mean_b, m2_b = b
+    n = n_a + n_b
+    # Con n = 0 ambos pesos son 0 y la media queda en 0
+    safe_n = np.where(n == 0, 1, n) if isinstance(n, pd.Series) else (n or 1)
+    delta = mean_b - mean_a
+    mean = mean_a + delta * n_b / safe_n
+    m2 = m2_a + m2_b + delta**2 * n_a * n_b / safe_n
+    return n, mean, m2
+
+
+def _finalize(state, keys, measures, flat):
+    """Resultado agrupado (índice = claves) con las columnas que daría pandas"""
+    if state is None:
+        names = [col if flat else (col, func) for col, func in measures]
+        result = pd.DataFrame(
+            {name: [] for name in names},
+            index=pd.MultiIndex.from_arrays([[]] * len(keys), names=keys),
+        )
+    else:
+        columns = {}
+        for col, func in measures:
+            if func in ("mean", "var", "std"):
+                n = state[(col, "n")]
+                if func == "mean":
+                    values = state[(col, "mean")].where(n > 0)
+                else:
+                    values = (state[(col, "m2")] / (n - 1)).where(n > 1)
+                    if func == "std":
+                        values = np.sqrt(values)
+            else:
+                values = state[(col, func)]
+            columns[col if flat else (col, func)] = values
+        result = pd.DataFrame(columns)
+        result.index.names = keys
+
+    if not flat:
+        result.columns = pd.MultiIndex.from_tuples(list(result.columns))
+    return result.sort_index()
@@ -0,0 +1,74 @@
+# daltek/domain/cost_guard.py
+
+
+class QueryCostEstimate:
+    """
+    Estimación del coste de una consulta a partir de su plan EXPLAIN.
+    """
+
+    def __init__(self, rows_examined, full_scans=None, filesorts=None, temporary=None):
+        self.rows_examined = int(rows_examined)
+        self.full_scans = full_scans or []
+        self.filesorts = filesorts or []
+        self.temporary = temporary or []
+
+    @property
+    def cost(self):
+        """Filas examinadas más las que hay que ordenar fuera de índice."""
+        sorted_rows = sum(rows for _table, rows in self.filesorts)
+        return self.rows_examined + sorted_rows
+
+    def to_dict(self):
+        return {
+            "rows_examined": self.rows_examined,
+            "cost": self.cost,
+            "full_scans": [table for table, _rows in self.full_scans],
+            "filesorts": [table for table, _rows in self.filesorts],
+            "temporary": self.temporary,
+        }
+
+
+class CostGuard:
+    """
+    Decide si una consulta puede ejecutarse en línea según un presupuesto
+    de coste expresado en filas examinadas.
+    """
+
+    def __init__(self, budget=1000000, large_table_rows=10000):
+        self.budget = int(budget)
+        self.large_table_rows = int(large_table_rows)
+
+    def estimate(self, plan):
+        """
+        Estima el coste de un plan EXPLAIN (lista de dicts de MariaDB).
+
+        En un join anidado cada tabla se recorre una vez por cada fila que
+        sale de las anteriores, así que las filas examinadas se acumulan
+        multiplicando por el "fanout" de los pasos previos.
+        """
+        fanout = 1.0
+        rows_examined = 0.0
+        full_scans = []
+        filesorts = []
+        temporary = []
+
+        for step in plan:
+            table = step.get("table")
+            rows = float(step.get("rows") or 0)
+            filtered = float(step.get("filtered") or 100) / 100
+            extra = step.get("Extra") or ""
+
+            rows_examined += fanout * rows
+            if step.get("type") == "ALL" and rows >= self.large_table_rows:
+                full_scans.append((table, int(rows)))
+            if "Using filesort" in extra and rows >= self.large_table_rows:
+                filesorts.append((table, int(fanout * rows)))
+            if "Using temporary" in extra:
+                temporary.append(table)
+
+            fanout *= max(rows * filtered, 1.0)
+
+        return QueryCostEstimate(rows_examined, full_scans, filesorts, temporary)
+
+    def is_over_budget(self, estimate):
+        return estimate.cost > self.budget
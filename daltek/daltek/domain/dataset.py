@@ -1,17 +1,38 @@
 # daltek/domain/dataset.py
 
+import hashlib
+import inspect
+import json
+import uuid
+
 import pandas as pd
 
+from .sparse_pivot import SparsePivot
+
+
+def lineage_hash(parent, operation, params):
+    """Hash determinista de aplicar `operation(**params)` al linaje `parent`"""
+    payload = json.dumps(
+        [parent, operation, params], sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha1(payload.encode()).hexdigest()[:20]
+
 
 class Dataset:
     """
     Clase base para manejar datos de un dashboard.
     Puede inicializarse desde listas de dicts, pandas DataFrame, o resultados de consultas.
+
+    Cada dataset tiene un linaje: un hash de su origen y de las operaciones
+    que lo produjeron. Dos cadenas de operaciones iguales sobre el mismo
+    origen tienen el mismo linaje, lo que permite memoizarlas
+    (PlotlyDataManager.run_pipeline).
     """
 
-    def __init__(self, data):
+    def __init__(self, data, lineage=None):
         """
         data: lista de dicts o DataFrame
+        lineage: linaje del dataset; si no se indica, se deriva del contenido
         """
         if isinstance(data, pd.DataFrame):
             self.df = data.copy()
@@ -19,6 +40,42 @@ class Dataset:
             self.df = pd.DataFrame(data)
         else:
             raise ValueError("Dataset: data debe ser una lista de dicts o DataFrame")
+        self._lineage = lineage
+
+    @property
+    def lineage(self):
+        if self._lineage is None:
+            self._lineage = self._content_lineage()
+        return self._lineage
+
+    @lineage.setter
+    def lineage(self, value):
+        self._lineage = value
+
+    def _content_lineage(self):
+        try:
+            digest = hashlib.sha1(
+                pd.util.hash_pandas_object(self.df, index=True).values.tobytes()
+            )
+        except TypeError:
+            # Celdas no hasheables (listas, dicts): linaje único del objeto
+            return uuid.uuid4().hex[:20]
+        digest.update(repr(list(self.df.columns)).encode())
+        return lineage_hash(None, "data", digest.hexdigest())
+
+    def derive_lineage(self, operation, *args, **kwargs):
+        """
+        Linaje del resultado de `operation` con esos argumentos, sin
+        ejecutarla. Los argumentos se normalizan con la firma del método, así
+        que posicionales, nombrados y valores por defecto dan el mismo hash.
+        """
+        bound = inspect.signature(getattr(Dataset, operation)).bind(
+            self, *args, **kwargs
+        )
+        bound.apply_defaults()
+        params = dict(bound.arguments)
+        params.pop("self")
+        return lineage_hash(self.lineage, operation, params)
 
     def head(self, n=5):
         """Primeras n filas"""
@@ -36,11 +93,15 @@ class Dataset:
         df_filtered = self.df.copy()
         for col, val in conditions.items():
             df_filtered = df_filtered[df_filtered[col] == val]
-        return Dataset(df_filtered)
+        return Dataset(
+            df_filtered, lineage=self.derive_lineage("filter_rows", **conditions)
+        )
 
     def select_columns(self, *cols):
         """Selecciona columnas específicas"""
-        return Dataset(self.df[list(cols)])
+        return Dataset(
+            self.df[list(cols)], lineage=self.derive_lineage("select_columns", *cols)
+        )
 
     def group_by(self, by, agg=None):
         """
@@ -49,7 +110,7 @@ class Dataset:
         """
         grouped = self.df.groupby(by).agg(agg or {})
         grouped = grouped.reset_index()
-        return Dataset(grouped)
+        return Dataset(grouped, lineage=self.derive_lineage("group_by", by, agg))
 
     def pivot(self, index, columns, values, aggfunc="sum"):
         """Crea tabla pivote"""
@@ -61,7 +122,18 @@ class Dataset:
             aggfunc=aggfunc,
             fill_value=0,
         ).reset_index()
-        return Dataset(pivoted)
+        return Dataset(
+            pivoted,
+            lineage=self.derive_lineage("pivot", index, columns, values, aggfunc),
+        )
+
+    def sparse_pivot(self, index, columns, values, aggfunc="sum"):
+        """
+        Tabla pivote dispersa (SparsePivot): solo las combinaciones con
+        filas, sin armar la matriz densa de Dataset.pivot.
+        """
+        grouped = self.df.groupby([index, columns])[values].agg(aggfunc)
+        return SparsePivot.from_frame(grouped.reset_index(), index, columns, values)
 
     def describe(self):
         """Estadísticas básicas de columnas numéricas"""
@@ -73,4 +145,7 @@ class Dataset:
 
     def sort_by(self, column, ascending=True):
         """Ordena por columna"""
-        return Dataset(self.df.sort_values(by=column, ascending=ascending))
+        return Dataset(
+            self.df.sort_values(by=column, ascending=ascending),
+            lineage=self.derive_lineage("sort_by", column, ascending),
+        )
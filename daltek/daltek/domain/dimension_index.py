@@ -0,0 +1,73 @@
+# daltek/domain/dimension_index.py
+
+import datetime
+
+import numpy as np
+import pandas as pd
+
+
+class DimensionIndex:
+    """
+    Índice de una columna de un dataset para filtrarlo sin recorrer el
+    DataFrame: cada fila guarda el código de su valor dentro de los valores
+    únicos ordenados, así que filtrar por valores o por rango se reduce a
+    comparar enteros (una máscara booleana vectorizada).
+
+    Los nulos tienen código -1 y nunca cumplen un filtro, como en SQL.
+    """
+
+    def __init__(self, series):
+        if series.dtype == object and _looks_like_dates(series):
+            series = pd.to_datetime(series, errors="coerce")
+        codes, values = pd.factorize(series, sort=True)
+        self.codes = codes
+        self.values = pd.Index(values)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def mask(self, condition):
+        """
+        condition: {"values": [...]} (pertenencia) o {"range": [desde, hasta]}
+        (desde inclusive, hasta exclusive; cualquiera puede ser None)
+        """
+        if "values" in condition:
+            return self.mask_values(condition["values"])
+        if "range" in condition:
+            low, high = condition["range"]
+            return self.mask_range(low, high)
+        raise ValueError("El filtro debe indicar 'values' o 'range'")
+
+    def mask_values(self, values):
+        positions = self.values.get_indexer(self._coerce(list(values)))
+        # Una posición extra al final para el código -1 (nulos)
+        selected = np.zeros(len(self.values) + 1, dtype=bool)
+        selected[positions[positions >= 0]] = True
+        return selected[self.codes]
+
+    def mask_range(self, low=None, high=None):
+        try:
+            start = (
+                0
+                if low is None
+                else self.values.searchsorted(self._coerce([low])[0], side="left")
+            )
+            end = (
+                len(self.values)
+                if high is None
+                else self.values.searchsorted(self._coerce([high])[0], side="left")
+            )
+        except TypeError:
+            raise ValueError("El rango no es comparable con los valores de la columna")
+        return (self.codes >= start) & (self.codes < end)
+
+    def _coerce(self, values):
+        if isinstance(self.values, pd.DatetimeIndex):
+            return pd.DatetimeIndex(pd.to_datetime(values, errors="coerce"))
+        return pd.Index(values)
+
+
+def _looks_like_dates(series):
+    """Columnas de date/datetime de Python (lo que devuelve la base de datos)."""
+    sample = series.dropna()
+    return not sample.empty and isinstance(sample.iloc[0], datetime.date)
@@ -0,0 +1,136 @@
+# daltek/domain/execution_plan.py
+
+import hashlib
+import json
+
+# Se incrementa cuando cambia el formato del plan o cómo se compila; los
+# planes guardados con otra versión se recompilan al cargarlos
+PLAN_VERSION = 1
+DEFAULT_ROW_LIMIT = 100
+
+
+def dataset_spec(properties):
+    """
+    Propiedades de un widget que determinan sus datos (no las de
+    presentación como el título o el chart), normalizadas para que dos
+    widgets que piden lo mismo compartan dataset.
+    """
+    if properties.get("pivot"):
+        return {"pivot": properties["pivot"]}
+
+    limit = int(properties.get("limit") or DEFAULT_ROW_LIMIT)
+    if properties.get("pipeline"):
+        return {"pipeline": properties["pipeline"], "limit": limit}
+
+    aggregate = (properties.get("aggregate") or "").lower()
+    if aggregate:
+        spec = {"aggregate": aggregate}
+        if properties.get("field"):
+            spec["field"] = properties["field"]
+        return spec
+    return {"limit": limit}
+
+
+def dataset_key(query_fingerprint, spec):
+    """Identificador determinista del dataset: consulta + propiedades"""
+    payload = json.dumps(
+        [query_fingerprint, spec], sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+
+class ExecutionPlan:
+    """
+    Plan de ejecución de un dashboard, compilado al guardarlo:
+
+    - queries: {query_id: {"definition", "sql", "fingerprint", "doctypes"}}
+      con los joins ya resueltos y el SQL base sin permisos; o {"error"}
+    - datasets: {clave: {"query_id", "properties", "sql"}}, uno por cada
+      combinación distinta de consulta y propiedades de datos (`sql` es la
+      plantilla sin permisos cuando el dataset se resuelve con un único
+      SELECT)
+    - widgets: {widget_id: {"dataset", "chart"}} o {"error"}
+    - doctypes: DocTypes que lee el dashboard, para invalidar cachés
+
+    `link_version` es la versión (token) del grafo de relaciones con la que
+    se resolvieron los joins.
+    """
+
+    def __init__(self, link_version=None):
+        self.link_version = link_version
+        self.queries = {}
+        self.datasets = {}
+        self.widgets = {}
+        self._fingerprints = {}
+
+    def add_query(self, query_id, definition, sql, fingerprint, doctypes):
+        self.queries[query_id] = {
+            "definition": definition,
+            "sql": sql,
+            "fingerprint": fingerprint,
+            "doctypes": list(doctypes),
+        }
+        # Consultas guardadas dos veces con el mismo SQL comparten datasets
+        self._fingerprints.setdefault(fingerprint, query_id)
+
+    def add_query_error(self, query_id, error):
+        self.queries[query_id] = {"error": error}
+
+    def add_widget(self, widget_id, properties, build_sql=None):
+        """
+        Registra un widget y devuelve la clave de su dataset (o None si no
+        tiene una consulta válida). `build_sql(query, spec)` arma la
+        plantilla SQL del dataset, si se resuelve con un único SELECT.
+        """
+        query = self.queries.get(properties.get("query_id"))
+        if not query:
+            self.widgets[widget_id] = {
+                "error": "El widget no tiene una consulta válida"
+            }
+            return None
+        if query.get("error"):
+            self.widgets[widget_id] = {"error": query["error"]}
+            return None
+
+        spec = dataset_spec(properties)
+        key = dataset_key(query["fingerprint"], spec)
+        if key not in self.datasets:
+            dataset = {
+                "query_id": self._fingerprints[query["fingerprint"]],
+                "properties": spec,
+                "sql": None,
+            }
+            if build_sql is not None:
+                try:
+                    dataset["sql"] = build_sql(query, spec)
+                except ValueError as e:
+                    dataset = {"error": str(e)}
+            self.datasets[key] = dataset
+
+        self.widgets[widget_id] = {"dataset": key, "chart": properties.get("chart")}
+        return key
+
+    def doctypes(self):
+        doctypes = set()
+        for query in self.queries.values():
+            doctypes.update(query.get("doctypes") or [])
+        return sorted(doctypes)
+
+    def as_dict(self):
+        return {
+            "version": PLAN_VERSION,
+            "link_version": self.link_version,
+            "queries": self.queries,
+            "datasets": self.datasets,
+            "widgets": self.widgets,
+            "doctypes": self.doctypes(),
+        }
+
+
+def is_current(plan, link_version):
+    """True si el plan guardado se puede ejecutar sin recompilar"""
+    return bool(
+        plan
+        and plan.get("version") == PLAN_VERSION
+        and plan.get("link_version") == link_version
+    )
@@ -0,0 +1,124 @@
+# daltek/domain/exporters.py
+
+import csv
+import io
+
+EXPORT_FORMATS = {
+    "csv": {"extension": "csv", "content_type": "text/csv; charset=utf-8"},
+    "xlsx": {
+        "extension": "xlsx",
+        "content_type": (
+            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        ),
+    },
+    "parquet": {
+        "extension": "parquet",
+        "content_type": "application/vnd.apache.parquet",
+    },
+}
+
+
+def iter_chunks(cursor, chunk_size=5000):
+    """Lee un cursor (idealmente sin buffer) en bloques de `chunk_size` filas."""
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield rows
+
+
+def iter_csv(columns, chunks):
+    """
+    Genera el CSV en bloques de bytes, uno por bloque de filas, para
+    enviarlo como respuesta en streaming. Incluye BOM para que Excel
+    reconozca UTF-8.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    buffer.write("\ufeff")
+    writer.writerow(columns)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate(0)
+
+    tail = buffer.getvalue()
+    if tail:
+        yield tail.encode("utf-8")
+
+
+def write_csv(path, columns, chunks):
+    with open(path, "wb") as f:
+        for block in iter_csv(columns, chunks):
+            f.write(block)
+
+
+def write_xlsx(path, columns, chunks, sheet_title="Datos"):
+    """XLSX en modo write-only: openpyxl no conserva las filas ya escritas."""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=sheet_title)
+    sheet.append(list(columns))
+    for rows in chunks:
+        for row in rows:
+            sheet.append(list(row))
+    workbook.save(path)
+
+
+def _parquet_type(inferred):
+    """Tipo de columna estable entre bloques a partir del primer bloque."""
+    import pyarrow as pa
+
+    if pa.types.is_null(inferred):
+        return pa.string()
+    if pa.types.is_decimal(inferred):
+        # La precisión inferida depende de los valores del bloque
+        return pa.decimal128(38, inferred.scale)
+    return inferred
+
+
+def write_parquet(path, columns, chunks):
+    """
+    Parquet con un row group por bloque. El esquema se infiere del primer
+    bloque; las columnas sin valores en él se escriben como texto.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    schema = None
+    try:
+        for rows in chunks:
+            data = [list(values) for values in zip(*rows)]
+            if schema is None:
+                schema = pa.schema(
+                    [
+                        pa.field(str(name), _parquet_type(pa.array(values).type))
+                        for name, values in zip(columns, data)
+                    ]
+                )
+                writer = pq.ParquetWriter(path, schema)
+
+            arrays = []
+            for values, field in zip(data, schema):
+                if pa.types.is_string(field.type):
+                    values = [None if v is None else str(v) for v in values]
+                arrays.append(pa.array(values, type=field.type))
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+        if writer is None:
+            schema = pa.schema([pa.field(str(name), pa.string()) for name in columns])
+            writer = pq.ParquetWriter(path, schema)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+WRITERS = {
+    "csv": write_csv,
+    "xlsx": write_xlsx,
+    "parquet": write_parquet,
+}
@@ -0,0 +1,170 @@
+# daltek/domain/index_advisor.py
+
+import math
+
+from .query_engine.sql_analysis import extract_column_usage, fingerprint_sql
+
+
+class IndexAdvisor:
+    """
+    Acumula la carga de consultas ejecutadas (workload) y sugiere índices
+    compuestos por tabla siguiendo la regla igualdad → rango → orden.
+    """
+
+    # Selectividad que asume MariaDB para un predicado de rango sin estadísticas
+    RANGE_SELECTIVITY = 1 / 3
+
+    def __init__(self, max_columns=3):
+        self.max_columns = max_columns
+        self.workload = {}
+
+    def add_query(self, sql, total_time=0.0, count=1):
+        """Registra una consulta (o un agregado de ejecuciones de la misma)."""
+        fingerprint = fingerprint_sql(sql)
+        entry = self.workload.setdefault(
+            fingerprint,
+            {"sql": sql, "count": 0, "total_time": 0.0, "usage": None},
+        )
+        entry["count"] += count
+        entry["total_time"] += total_time
+        if entry["usage"] is None:
+            entry["usage"] = extract_column_usage(sql)
+        return fingerprint
+
+    def top_fingerprints(self, n=20):
+        """Huellas ordenadas por tiempo total acumulado (las más costosas primero)."""
+        ranked = sorted(
+            self.workload.items(),
+            key=lambda item: item[1]["total_time"],
+            reverse=True,
+        )
+        return [fingerprint for fingerprint, _entry in ranked[:n]]
+
+    def candidate_for(self, fingerprint):
+        """
+        Devuelve el índice ideal de cada tabla para una consulta concreta:
+        {tabla: {"columns": [...], "equality": [...], "range": col | None}}.
+        """
+        usage = self.workload[fingerprint]["usage"]
+        by_table = {}
+        for table, column, role in usage["columns"]:
+            roles = by_table.setdefault(table, {"eq": [], "range": [], "order": []})
+            # En un JOIN la tabla interna se recorre por búsqueda de igualdad
+            bucket = "eq" if role == "join" else role
+            if bucket == "group":
+                bucket = "order"
+            if column not in roles[bucket]:
+                roles[bucket].append(column)
+
+        candidates = {}
+        for table, roles in by_table.items():
+            columns = list(roles["eq"])
+            if roles["range"]:
+                columns.append(roles["range"][0])
+            else:
+                columns.extend(c for c in roles["order"] if c not in columns)
+            columns = columns[: self.max_columns]
+            # `name` es la clave primaria: un índice que empieza por ella sobra
+            if columns and columns[0] != "name":
+                candidates[table] = {
+                    "columns": columns,
+                    "equality": [c for c in columns if c in roles["eq"]],
+                    "range": roles["range"][0]
+                    if roles["range"] and roles["range"][0] in columns
+                    else None,
+                }
+        return candidates
+
+    def suggest_indexes(self, fingerprints=None, existing_indexes=None):
+        """
+        Sugiere índices compuestos por tabla.
+
+        Args:
+            fingerprints (list): huellas a considerar (por defecto todas)
+            existing_indexes (dict): {tabla: [[columnas], ...]} ya existentes
+
+        Returns:
+            dict: {tabla: [{"columns", "equality", "range", "fingerprints",
+                "count", "total_time"}, ...]}
+        """
+        existing_indexes = existing_indexes or {}
+        suggestions = {}
+
+        for fingerprint in fingerprints or list(self.workload):
+            entry = self.workload[fingerprint]
+            for table, candidate in self.candidate_for(fingerprint).items():
+                columns = candidate["columns"]
+                if self.is_covered(columns, existing_indexes.get(table, [])):
+                    continue
+                suggestion = suggestions.setdefault(table, {}).setdefault(
+                    tuple(columns),
+                    {
+                        **candidate,
+                        "fingerprints": [],
+                        "count": 0,
+                        "total_time": 0.0,
+                    },
+                )
+                suggestion["fingerprints"].append(fingerprint)
+                suggestion["count"] += entry["count"]
+                suggestion["total_time"] += entry["total_time"]
+
+        return {
+            table: self._merge_prefixes(list(by_columns.values()))
+            for table, by_columns in suggestions.items()
+        }
+
+    @staticmethod
+    def is_covered(columns, indexes):
+        """Un índice existente cubre la sugerencia si la tiene como prefijo."""
+        return any(list(index[: len(columns)]) == list(columns) for index in indexes)
+
+    @staticmethod
+    def _merge_prefixes(suggestions):
+        """Funde las sugerencias que son prefijo de otra más larga."""
+        suggestions.sort(key=lambda s: len(s["columns"]), reverse=True)
+        merged = []
+        for suggestion in suggestions:
+            target = next(
+                (
+                    m
+                    for m in merged
+                    if m["columns"][: len(suggestion["columns"])]
+                    == suggestion["columns"]
+                ),
+                None,
+            )
+            if target:
+                target["fingerprints"].extend(suggestion["fingerprints"])
+                target["count"] += suggestion["count"]
+                target["total_time"] += suggestion["total_time"]
+            else:
+                merged.append(suggestion)
+        merged.sort(key=lambda s: s["total_time"], reverse=True)
+        return merged
+
+    @classmethod
+    def estimate_rows(cls, table_rows, distinct_values=None, has_range=False):
+        """
+        Estima las filas examinadas usando el índice sugerido.
+
+        Args:
+            table_rows (int): filas de la tabla
+            distinct_values (int): valores distintos de las columnas de igualdad
+            has_range (bool): si el índice termina en una columna de rango
+        """
+        rows = float(table_rows or 0)
+        if distinct_values:
+            rows = rows / max(int(distinct_values), 1)
+        if has_range:
+            rows = rows * cls.RANGE_SELECTIVITY
+        return max(int(math.ceil(rows)), 1) if table_rows else 0
+
+    @staticmethod
+    def index_name(columns):
+        return "daltek_idx_" + "_".join(columns)[:50]
+
+    @classmethod
+    def ddl(cls, table, columns):
+        cols = ", ".join(f"`{column}`" for column in columns)
+        return f"ALTER TABLE `{table}` ADD INDEX `{cls.index_name(columns)}` ({cols})"
@@ -0,0 +1,204 @@
+# daltek/domain/metrics.py
+
+import bisect
+import math
+from collections import defaultdict
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+ROWS_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+BYTES_BUCKETS = (1024, 10240, 102400, 1048576, 10485760, 104857600)
+
+# nombre -> (tipo, ayuda, buckets de histograma)
+METRICS = {
+    "daltek_query_duration_seconds": (
+        "histogram",
+        "Tiempo de ejecución de las consultas analíticas",
+        DURATION_BUCKETS,
+    ),
+    "daltek_query_rows": (
+        "histogram",
+        "Filas devueltas por las consultas analíticas",
+        ROWS_BUCKETS,
+    ),
+    "daltek_request_duration_seconds": (
+        "histogram",
+        "Duración de las peticiones a los endpoints de Daltek",
+        DURATION_BUCKETS,
+    ),
+    "daltek_response_bytes": (
+        "histogram",
+        "Tamaño de las respuestas de los endpoints de Daltek",
+        BYTES_BUCKETS,
+    ),
+    "daltek_cache_requests_total": (
+        "counter",
+        "Consultas a las cachés de Daltek por resultado (hit/miss)",
+        None,
+    ),
+    "daltek_html_bundle_serves_total": (
+        "counter",
+        "HTML del Query Builder y del Drag & Drop servidos",
+        None,
+    ),
+    "daltek_background_jobs_total": (
+        "counter",
+        "Trabajos en segundo plano de Daltek por estado",
+        None,
+    ),
+    "daltek_preview_requests_total": (
+        "counter",
+        "Vistas previas del Query Builder por resultado (completed, superseded, timeout)",
+        None,
+    ),
+    "daltek_preview_cancellations_total": (
+        "counter",
+        "Consultas de vista previa canceladas en la base de datos por una más nueva",
+        None,
+    ),
+    "daltek_admission_events_total": (
+        "counter",
+        "Peticiones del control de admisión por evento (admitted, queued, rejected_*)",
+        None,
+    ),
+    "daltek_admission_rejections_total": (
+        "counter",
+        "Peticiones rechazadas por el control de admisión por endpoint",
+        None,
+    ),
+    "daltek_admission_wait_seconds_total": (
+        "counter",
+        "Tiempo total de espera de turno en el control de admisión",
+        None,
+    ),
+}
+
+
+def series_key(name, labels):
+    """Clave de una serie: 'nombre|etiqueta=valor,...' con etiquetas ordenadas."""
+    return (
+        name + "|" + ",".join(f"{k}={_clean_label(labels[k])}" for k in sorted(labels))
+    )
+
+
+def parse_series_key(key):
+    name, _, raw = key.partition("|")
+    labels = dict(part.split("=", 1) for part in raw.split(",") if part)
+    return name, labels
+
+
+class MetricsBuffer:
+    """
+    Acumulador de contadores e histogramas en memoria. Cada hilo usa el
+    suyo, así que no necesita locks; `drain()` entrega lo acumulado para
+    sumarlo al agregado compartido.
+
+    Los histogramas guardan conteos por bucket sin acumular (más el bucket
+    "+Inf"), `_sum` y `_count`; la exposición calcula los acumulados.
+    """
+
+    def __init__(self):
+        self.values = defaultdict(float)
+
+    def inc(self, name, amount=1, **labels):
+        self.values[series_key(name, labels)] += amount
+
+    def observe(self, name, value, **labels):
+        buckets = METRICS[name][2]
+        position = bisect.bisect_left(buckets, value)
+        le = _format_bound(buckets[position]) if position < len(buckets) else "+Inf"
+        self.values[series_key(f"{name}_bucket", {**labels, "le": le})] += 1
+        self.values[series_key(f"{name}_sum", labels)] += value
+        self.values[series_key(f"{name}_count", labels)] += 1
+
+    def drain(self):
+        values, self.values = self.values, defaultdict(float)
+        return dict(values)
+
+
+def render_exposition(values, gauges=None):
+    """
+    Formato de texto de Prometheus (0.0.4).
+
+    Args:
+        values (dict): {clave de serie: valor} de contadores e histogramas
+        gauges (dict): {nombre: (ayuda, [(etiquetas, valor), ...])}
+    """
+    series = defaultdict(list)
+    for key, value in values.items():
+        name, labels = parse_series_key(key)
+        series[name].append((labels, value))
+
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "histogram":
+            lines.extend(_histogram_lines(name, buckets, series))
+        else:
+            for labels, value in sorted(series.get(name, []), key=_sort_key):
+                lines.append(_sample(name, labels, value))
+
+    for name, (help_text, samples) in (gauges or {}).items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in samples:
+            lines.append(_sample(name, labels, value))
+
+    return "\n".join(lines) + "\n"
+
+
+def _histogram_lines(name, buckets, series):
+    # Etiquetas de cada serie del histograma sin "le"
+    label_sets = {}
+    for labels, _ in series.get(f"{name}_count", []):
+        label_sets[_sort_key((labels, 0))] = labels
+
+    lines = []
+    for _, labels in sorted(label_sets.items()):
+        counts = {
+            bucket_labels["le"]: value
+            for bucket_labels, value in series.get(f"{name}_bucket", [])
+            if {k: v for k, v in bucket_labels.items() if k != "le"} == labels
+        }
+        cumulative = 0
+        for bound in [_format_bound(b) for b in buckets] + ["+Inf"]:
+            cumulative += counts.get(bound, 0)
+            lines.append(_sample(f"{name}_bucket", {**labels, "le": bound}, cumulative))
+        for suffix in ("_sum", "_count"):
+            value = next(
+                (v for lbl, v in series.get(name + suffix, []) if lbl == labels), 0
+            )
+            lines.append(_sample(name + suffix, labels, value))
+    return lines
+
+
+def _sample(name, labels, value):
+    if labels:
+        rendered = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+        name = f"{name}{{{rendered}}}"
+    return f"{name} {_format_value(value)}"
+
+
+def _sort_key(item):
+    return tuple(sorted(item[0].items()))
+
+
+def _clean_label(value):
+    """Los separadores de la clave no pueden aparecer en los valores."""
+    return str(value).replace("|", "_").replace(",", "_").replace("=", "_")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_bound(bound):
+    return repr(float(bound))
+
+
+def _format_value(value):
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
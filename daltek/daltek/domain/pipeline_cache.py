@@ -0,0 +1,71 @@
+# daltek/domain/pipeline_cache.py
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class PipelineCache:
+    """
+    Caché LRU acotada de resultados intermedios de operaciones sobre
+    datasets, indexada por el hash de linaje del resultado.
+
+    Dos widgets que parten del mismo dataset y aplican los mismos primeros
+    pasos obtienen el mismo linaje para ese prefijo, así que se calcula una
+    sola vez. Los datasets en caché se comparten: no deben modificarse.
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Tiempo de cálculo que se ahorró al reutilizar resultados
+        self.saved_seconds = 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, lineage):
+        return lineage in self._entries
+
+    def get_or_compute(self, lineage, compute):
+        """Resultado con ese linaje, calculándolo con `compute()` si falta"""
+        with self._lock:
+            entry = self._entries.get(lineage)
+            if entry is not None:
+                self._entries.move_to_end(lineage)
+                self.hits += 1
+                self.saved_seconds += entry[1]
+                return entry[0]
+            self.misses += 1
+
+        started = time.perf_counter()
+        result = compute()
+        elapsed = time.perf_counter() - started
+
+        with self._lock:
+            self._entries[lineage] = (result, elapsed)
+            self._entries.move_to_end(lineage)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "saved_ms": round(self.saved_seconds * 1000, 2),
+        }
@@ -1,24 +1,97 @@
 # daltek/domain/dashboard_data.py
+import copy
+from functools import partial
+
+import numpy as np
+
+from .dataset import Dataset, lineage_hash
+from .dimension_index import DimensionIndex
+from .pipeline_cache import PipelineCache
+from .query_engine.query_engine import Avg, Count, Max, Min, Sum
+from .sparse_pivot import SparsePivot
+
+AGGREGATES = {
+    "sum": Sum,
+    "count": Count,
+    "avg": Avg,
+    "mean": Avg,
+    "min": Min,
+    "max": Max,
+}
+
+# Operaciones de Dataset que pueden formar parte de un pipeline
+PIPELINE_OPERATIONS = ("filter_rows", "select_columns", "group_by", "pivot", "sort_by")
+
+
 class PlotlyDataManager:
     """
     Clase para manejar múltiples datasets y preparar los datos
     para diferentes widgets y gráficos de un dashboard.
+
+    Además de datasets en memoria admite orígenes SQL (QueryEngine): sobre
+    ellos las agregaciones se resuelven en la base de datos mediante
+    `executor`, una función que recibe SQL y devuelve una lista de dicts.
+
+    Para el filtrado cruzado, los widgets registrados con add_widget
+    comparten los datasets del dashboard y los filtros se resuelven con
+    índices de dimensión (DimensionIndex) construidos una sola vez.
+
+    Los pipelines de operaciones (run_pipeline) se memoizan por linaje en
+    una caché LRU: los prefijos comunes entre widgets se calculan una vez.
     """
 
-    def __init__(self):
+    def __init__(self, executor=None, max_cached_steps=64):
         self.datasets = {}
+        self.queries = {}
+        self.executor = executor
+        self.indexes = {}
+        self.widgets = {}
+        self.pipeline_cache = PipelineCache(max_cached_steps)
 
-    def add_dataset(self, name, dataset):
-        """Agrega un dataset"""
+    def add_dataset(self, name, dataset, version=None):
+        """
+        Agrega un dataset (Dataset o ChunkedDataset para procesarlo por
+        bloques). `version` identifica su contenido (por ejemplo la huella y
+        versión de datos de la consulta) y fija su linaje sin tener que
+        hashear las filas.
+        """
+        if version is not None:
+            dataset.lineage = lineage_hash(
+                None, "source", {"name": name, "version": version}
+            )
         self.datasets[name] = dataset
+        self.indexes = {
+            key: index for key, index in self.indexes.items() if key[0] != name
+        }
+
+    def add_query(self, name, query_engine):
+        """Agrega un origen SQL que se ejecuta solo cuando se necesita"""
+        self.queries[name] = query_engine
 
     def get_dataset(self, name):
+        if name not in self.datasets and name in self.queries:
+            self.datasets[name] = Dataset(self._execute(self.queries[name].build()))
         return self.datasets.get(name)
 
-    def summary_table(self, dataset_name, group_by=None, agg=None):
+    def summary_table(
+        self, dataset_name, group_by=None, agg=None, time_bucket=None, top_n=None
+    ):
         """
         Devuelve un resumen tabular listo para un widget tipo tabla.
+
+        Si el dataset es un origen SQL, la agregación se compila a una única
+        consulta:
+            time_bucket: {"column", "granularity", "start", "end", "fill_value"}
+                -> filas {"bucket", "value"} con periodos vacíos rellenados
+            top_n: int o {"n", "other_label"} junto con `group_by`
+                -> filas {"label", "value"} con el resto agrupado en "Otros"
         """
+        if dataset_name in self.queries and (group_by or time_bucket or top_n):
+            return self._sql_summary(dataset_name, group_by, agg, time_bucket, top_n)
+
+        if time_bucket or top_n:
+            raise ValueError("time_bucket y top_n requieren un origen SQL (add_query)")
+
         ds = self.get_dataset(dataset_name)
         if not ds:
             return None
@@ -26,6 +99,92 @@ class PlotlyDataManager:
             ds = ds.group_by(group_by, agg)
         return ds.to_dict()
 
+    def pivot_table(
+        self, dataset_name, index, columns, values, aggfunc="sum", max_columns=50
+    ):
+        """
+        Tabla pivote dispersa (SparsePivot) sin armar la matriz densa.
+
+        Sobre un origen SQL se resuelve en la base de datos: si `columns`
+        tiene hasta `max_columns` valores distintos se compila a agregación
+        condicional (una fila por valor de `index`); si no, se piden solo
+        las coordenadas con datos.
+        """
+        if dataset_name not in self.queries:
+            ds = self.get_dataset(dataset_name)
+            if not ds:
+                return None
+            aggfunc = "mean" if aggfunc == "avg" else aggfunc
+            return ds.sparse_pivot(index, columns, values, aggfunc)
+
+        engine = copy.deepcopy(self.queries[dataset_name])
+        distinct = self._execute(engine.distinct_values(columns, max_columns + 1))
+        column_values = [
+            row["col_key"] for row in distinct if row["col_key"] is not None
+        ]
+        if len(distinct) <= max_columns:
+            engine.pivot(index, columns, values, aggfunc, column_values)
+            return SparsePivot.from_columns(
+                self._execute(engine.build()), column_values
+            )
+        engine.pivot(index, columns, values, aggfunc)
+        return SparsePivot.from_coordinates(self._execute(engine.build()))
+
+    def _sql_summary(self, dataset_name, group_by, agg, time_bucket, top_n):
+        engine = copy.deepcopy(self.queries[dataset_name])
+        measures = self._measures(agg)
+
+        if time_bucket:
+            _alias, measure = measures[0]
+            engine.time_bucket(
+                time_bucket["column"],
+                measure,
+                granularity=time_bucket.get("granularity", "day"),
+                start=time_bucket.get("start"),
+                end=time_bucket.get("end"),
+                fill_value=time_bucket.get("fill_value", 0),
+            )
+        elif top_n:
+            if not group_by or isinstance(group_by, (list, tuple)):
+                raise ValueError("top_n requiere agrupar por una sola columna")
+            options = top_n if isinstance(top_n, dict) else {"n": top_n}
+            _alias, measure = measures[0]
+            engine.top_n(
+                group_by,
+                measure,
+                n=options.get("n", 10),
+                other_label=options.get("other_label", "Otros"),
+            )
+        else:
+            columns = [group_by] if isinstance(group_by, str) else list(group_by)
+            engine._select = []
+            engine.select(*columns)
+            for alias, measure in measures:
+                measure.alias = alias
+                engine.select(measure)
+            engine._group_by = []
+            engine.group_by(*columns)
+
+        return self._execute(engine.build())
+
+    @staticmethod
+    def _measures(agg):
+        """{'col': 'sum'} -> [(alias, SQLFunction)]; sin agg se cuentan filas"""
+        if not agg:
+            return [("count", Count())]
+        measures = []
+        for column, func in agg.items():
+            func_cls = AGGREGATES.get(str(func).lower())
+            if not func_cls:
+                raise ValueError(f"Agregación '{func}' no soportada en SQL")
+            measures.append((column, func_cls(column)))
+        return measures
+
+    def _execute(self, sql):
+        if not self.executor:
+            raise ValueError("PlotlyDataManager: no hay executor para orígenes SQL")
+        return self.executor(sql)
+
     def prepare_for_plot(self, dataset_name, x, y, kind="line"):
         """
         Prepara los datos en formato dict para Plotly o cualquier librería.
@@ -37,7 +196,148 @@ class PlotlyDataManager:
         return {"x": ds.df[x].tolist(), "y": ds.df[y].tolist(), "type": kind}
 
     def filter_dataset(self, dataset_name, **conditions):
+        return self.run_pipeline(
+            dataset_name, [{"op": "filter_rows", "args": conditions}]
+        )
+
+    def run_pipeline(self, dataset_name, steps):
+        """
+        Aplica una cadena de operaciones de Dataset memoizando cada paso.
+
+        Args:
+            steps (list): [{"op": "filter_rows" | "select_columns" |
+                "group_by" | "pivot" | "sort_by", "args": {...} o [...]}];
+                `args` se pasa como argumentos nombrados (dict) o
+                posicionales (lista)
+
+        Returns:
+            Dataset: resultado compartido con otros pipelines; no modificarlo
+        """
         ds = self.get_dataset(dataset_name)
-        if ds:
-            return ds.filter_rows(**conditions)
-        return None
+        if ds is None:
+            return None
+        for step in steps:
+            operation = step.get("op")
+            if operation not in PIPELINE_OPERATIONS:
+                raise ValueError(f"Operación '{operation}' no soportada en un pipeline")
+            args = step.get("args") or {}
+            positional, named = (args, {}) if isinstance(args, list) else ([], args)
+            try:
+                lineage = ds.derive_lineage(operation, *positional, **named)
+            except TypeError as e:
+                raise ValueError(f"Argumentos inválidos para '{operation}': {e}")
+            ds = self.pipeline_cache.get_or_compute(
+                lineage,
+                partial(getattr(ds, operation), *positional, **named),
+            )
+        return ds
+
+    def pipeline_stats(self):
+        """Reutilización de la caché de pipelines (hits, misses, evictions...)"""
+        return self.pipeline_cache.stats()
+
+    def dimension_index(self, dataset_name, column):
+        """Índice de `column`, construido la primera vez que se filtra por ella"""
+        key = (dataset_name, column)
+        if key not in self.indexes:
+            ds = self.get_dataset(dataset_name)
+            self.indexes[key] = DimensionIndex(ds.df[column])
+        return self.indexes[key]
+
+    def add_widget(
+        self, widget_id, dataset_name, aggregate=None, field=None, limit=None
+    ):
+        """
+        Registra un widget sobre un dataset compartido.
+
+        Con `aggregate` (count, sum, avg, min, max) el widget muestra un
+        valor; si no, las primeras `limit` filas que cumplen los filtros.
+        """
+        aggregate = (aggregate or "").lower() or None
+        if aggregate and aggregate not in AGGREGATES:
+            raise ValueError(f"Agregación '{aggregate}' no soportada")
+        if aggregate and aggregate != "count" and not field:
+            raise ValueError(f"La agregación '{aggregate}' requiere un campo")
+        self.widgets[widget_id] = {
+            "dataset": dataset_name,
+            "aggregate": aggregate,
+            "field": field,
+            "limit": limit,
+        }
+
+    def crossfilter(self, filters, widget_ids=None):
+        """
+        Recalcula los widgets aplicando filtros cruzados en memoria.
+
+        Args:
+            filters (list): [{"column", "values" | "range", "widget_id"}]; el
+                filtro no se aplica al widget que lo originó ni a datasets
+                sin esa columna
+            widget_ids (list): widgets a recalcular (por defecto, todos)
+
+        Returns:
+            dict: {widget_id: {"success", "value"} o {"success", "count", "rows"}}
+        """
+        masks = {}
+        results = {}
+        for widget_id in widget_ids or list(self.widgets):
+            spec = self.widgets[widget_id]
+            df = self.get_dataset(spec["dataset"]).df
+
+            active = tuple(
+                i
+                for i, f in enumerate(filters)
+                if f.get("widget_id") != widget_id and f["column"] in df.columns
+            )
+            # Widgets del mismo dataset con los mismos filtros comparten máscara
+            key = (spec["dataset"], active)
+            if key not in masks:
+                mask = np.ones(len(df), dtype=bool)
+                for i in active:
+                    index = self.dimension_index(spec["dataset"], filters[i]["column"])
+                    mask &= index.mask(filters[i])
+                masks[key] = mask
+
+            results[widget_id] = self._widget_result(df, spec, masks[key])
+        return results
+
+    @staticmethod
+    def _widget_result(df, spec, mask):
+        """Mismo resultado que la consulta SQL del widget sobre las filas filtradas"""
+        aggregate = spec["aggregate"]
+        if not aggregate:
+            positions = np.flatnonzero(mask)
+            if spec["limit"] is not None:
+                positions = positions[: spec["limit"]]
+            return {
+                "success": True,
+                "count": len(positions),
+                "rows": records(df.iloc[positions]),
+            }
+
+        if not spec["field"]:
+            return {"success": True, "value": int(mask.sum())}
+
+        # Como en SQL, los nulos no cuentan y sin filas el resultado es NULL
+        values = df[spec["field"]][mask].dropna()
+        if aggregate == "count":
+            value = len(values)
+        elif values.empty:
+            value = None
+        elif aggregate == "sum":
+            value = values.sum()
+        elif aggregate in ("avg", "mean"):
+            value = values.mean()
+        elif aggregate == "min":
+            value = values.min()
+        else:
+            value = values.max()
+        return {
+            "success": True,
+            "value": value.item() if hasattr(value, "item") else value,
+        }
+
+
+def records(df):
+    """Filas como lista de dicts con None en lugar de NaN/NaT (como en SQL)"""
+    return df.astype(object).where(df.notna(), None).to_dict("records")
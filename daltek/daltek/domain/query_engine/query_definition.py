@@ -0,0 +1,173 @@
+# daltek/domain/query_engine/query_definition.py
+
+import re
+
+from .query_engine import QueryEngine, quote_literal
+
+ALLOWED_OPERATORS = ("=", "!=", ">", "<", ">=", "<=", "LIKE", "IN")
+
+_IDENTIFIER_RE = re.compile(r"^[\w][\w \-]*$")
+
+
+def quote_identifier(name):
+    """Entrecomilla un identificador (tabla, alias o columna) validándolo."""
+    name = str(name).strip()
+    if not _IDENTIFIER_RE.match(name):
+        raise ValueError(f"Identificador no válido: {name}")
+    return f"`{name}`"
+
+
+def quote_value(value):
+    """
+    Convierte un valor de filtro en un literal SQL seguro. Los filtros del
+    Query Builder suelen llegar como texto: los números y booleanos
+    escritos como texto se envían como tales.
+    """
+    if not isinstance(value, (bool, int, float)):
+        text = str(value)
+        if re.fullmatch(r"-?\d+(\.\d+)?", text):
+            return text
+        if text.lower() in ("true", "false"):
+            return "1" if text.lower() == "true" else "0"
+    return quote_literal(value)
+
+
+def table_name(doctype):
+    return f"tab{doctype}"
+
+
+def join_condition(edge):
+    """
+    Condición ON para unir `edge["to"]` partiendo de `edge["from"]`.
+
+    Link: el DocType dueño guarda el `name` del otro en `fieldname`.
+    Child: la tabla hija guarda el padre en `parent`/`parenttype`/`parentfield`.
+    """
+    source = quote_identifier(edge["from"])
+    target = quote_identifier(edge["to"])
+    field = quote_identifier(edge["fieldname"])
+    forward = edge["owner"] == edge["from"]
+
+    if edge["kind"] == "link":
+        if forward:
+            return f"{target}.`name` = {source}.{field}"
+        return f"{target}.{field} = {source}.`name`"
+
+    if forward:
+        child, parent, parent_doctype = target, source, edge["from"]
+    else:
+        child, parent, parent_doctype = source, target, edge["to"]
+    return (
+        f"{child}.`parent` = {parent}.`name`"
+        f" AND {child}.`parenttype` = {quote_value(parent_doctype)}"
+        f" AND {child}.`parentfield` = {quote_value(edge['fieldname'])}"
+    )
+
+
+def split_column(column, base_doctype):
+    """'Customer.territory' -> ('Customer', 'territory'); 'name' -> (base, 'name')."""
+    if "." in column:
+        doctype, fieldname = column.rsplit(".", 1)
+        return doctype, fieldname
+    return base_doctype, column
+
+
+def definition_doctypes(definition):
+    """DocTypes que lee la definición: el base y los de sus joins."""
+    doctypes = [definition.get("doctype")]
+    for join in definition.get("joins") or []:
+        for edge in join.get("path") or []:
+            if edge["to"] not in doctypes:
+                doctypes.append(edge["to"])
+    return doctypes
+
+
+def compile_query_definition(definition, row_conditions=None):
+    """
+    Compila la definición guardada por el Query Builder en un QueryEngine.
+
+    `row_conditions` ({doctype: condición SQL sobre su alias}) restringe las
+    filas visibles: la del DocType base va al WHERE y la de cada DocType
+    unido a su ON, para que un LEFT JOIN no descarte la fila base.
+
+    Args:
+        definition (dict): {
+            "doctype": DocType base,
+            "columns": ["campo", "Otro DocType.campo", ...],
+            "filters": [{"col", "op", "val"}, ...] (con "IN", val es una lista),
+            "joins": [{"doctype", "path": [arista, ...]}, ...],
+            "limit": int opcional
+        }
+        row_conditions (dict): condiciones de permisos por DocType
+
+    Returns:
+        QueryEngine: consulta lista para build()
+    """
+    base = definition.get("doctype")
+    if not base:
+        raise ValueError("La definición debe indicar un DocType base")
+    row_conditions = row_conditions or {}
+
+    engine = QueryEngine().from_table(
+        quote_identifier(table_name(base)), alias=quote_identifier(base)
+    )
+
+    joined = {base}
+    for join in definition.get("joins") or []:
+        for edge in join.get("path") or []:
+            if edge["to"] in joined:
+                continue
+            if edge["from"] not in joined:
+                raise ValueError(
+                    f"La ruta hacia {join.get('doctype')} no parte de un DocType unido"
+                )
+            on_condition = join_condition(edge)
+            if row_conditions.get(edge["to"]):
+                on_condition += f" AND ({row_conditions[edge['to']]})"
+            engine.left_join(
+                quote_identifier(table_name(edge["to"])),
+                on_condition,
+                alias=quote_identifier(edge["to"]),
+            )
+            joined.add(edge["to"])
+
+    columns = definition.get("columns") or []
+    if not columns:
+        raise ValueError("Debe seleccionar al menos una columna")
+
+    for column in columns:
+        doctype, fieldname = split_column(column, base)
+        if doctype not in joined:
+            raise ValueError(f"El DocType {doctype} no está unido a la consulta")
+        expression = f"{quote_identifier(doctype)}.{quote_identifier(fieldname)}"
+        if doctype != base:
+            expression += f" AS `{doctype}.{fieldname}`"
+        engine.select(expression)
+
+    for condition in definition.get("filters") or []:
+        op = str(condition.get("op", "=")).upper()
+        if op not in ALLOWED_OPERATORS:
+            raise ValueError(f"Operador no permitido: {op}")
+        doctype, fieldname = split_column(condition["col"], base)
+        if doctype not in joined:
+            raise ValueError(f"El DocType {doctype} no está unido a la consulta")
+        value = condition.get("val")
+        column = f"{quote_identifier(doctype)}.{quote_identifier(fieldname)}"
+        if op == "IN":
+            values = value if isinstance(value, (list, tuple)) else [value]
+            if not values:
+                engine.where("1 = 0")
+                continue
+            engine.where(f"{column} IN ({', '.join(map(quote_value, values))})")
+            continue
+        if op == "LIKE" and "%" not in str(value):
+            value = f"%{value}%"
+        engine.where(f"{column} {op} {quote_value(value)}")
+
+    if row_conditions.get(base):
+        engine.where(f"({row_conditions[base]})")
+
+    if definition.get("limit"):
+        engine.limit(definition["limit"])
+
+    return engine
@@ -1,3 +1,32 @@
+import copy
+
+BUCKET_EXPRESSIONS = {
+    "day": "DATE({col})",
+    "week": "DATE_SUB(DATE({col}), INTERVAL WEEKDAY({col}) DAY)",
+    "month": "CAST(DATE_FORMAT({col}, '%Y-%m-01') AS DATE)",
+    "quarter": "MAKEDATE(YEAR({col}), 1) + INTERVAL (QUARTER({col}) - 1) QUARTER",
+    "year": "CAST(DATE_FORMAT({col}, '%Y-01-01') AS DATE)",
+}
+
+BUCKET_INTERVALS = {
+    "day": "INTERVAL 1 DAY",
+    "week": "INTERVAL 1 WEEK",
+    "month": "INTERVAL 1 MONTH",
+    "quarter": "INTERVAL 1 QUARTER",
+    "year": "INTERVAL 1 YEAR",
+}
+
+
+PIVOT_AGGREGATES = {
+    "sum": "SUM({expr})",
+    "count": "COUNT({expr})",
+    "avg": "AVG({expr})",
+    "mean": "AVG({expr})",
+    "min": "MIN({expr})",
+    "max": "MAX({expr})",
+}
+
+
 class QueryEngine:
     def __init__(self):
         self._select = []
@@ -9,6 +38,9 @@ class QueryEngine:
         self._order_by = []
         self._limit = None
         self._offset = None
+        self._time_bucket = None
+        self._top_n = None
+        self._pivot = None
 
     def select(self, *columns):
         for col in columns:
@@ -72,7 +104,213 @@ class QueryEngine:
         self._offset = int(count)
         return self
 
+    def time_bucket(
+        self,
+        column,
+        measure,
+        granularity="day",
+        start=None,
+        end=None,
+        fill_value=0,
+    ):
+        """
+        Agrega `measure` por periodos de `column` (día, semana, mes,
+        trimestre o año) rellenando con `fill_value` los periodos sin datos.
+        El resultado tiene las columnas `bucket` y `value`.
+        """
+        granularity = granularity.lower()
+        if granularity not in BUCKET_EXPRESSIONS:
+            raise ValueError(f"Granularidad '{granularity}' no soportada")
+        self._time_bucket = {
+            "column": column,
+            "measure": measure,
+            "granularity": granularity,
+            "start": start,
+            "end": end,
+            "fill_value": fill_value,
+        }
+        return self
+
+    def top_n(self, dimension, measure, n=10, other_label="Otros"):
+        """
+        Agrega `measure` por `dimension` y conserva los `n` valores mayores,
+        acumulando el resto en una fila `other_label`.
+        El resultado tiene las columnas `label` y `value`.
+        """
+        self._top_n = {
+            "dimension": dimension,
+            "measure": measure,
+            "n": int(n),
+            "other_label": other_label,
+        }
+        return self
+
+    def pivot(self, index, column, values, aggfunc="sum", column_values=None):
+        """
+        Tabla pivote resuelta en la base de datos.
+
+        Con `column_values` (cardinalidad conocida, sin nulos) se compila a
+        agregación condicional: una fila por `index` (`row_key`) y una
+        columna `c0`, `c1`... por cada valor de `column`, en ese orden. Sin ellos
+        devuelve coordenadas (`row_key`, `col_key`, `value`) solo de las
+        combinaciones que existen, para armar una matriz dispersa.
+        `limit()` acota las filas (o celdas) del resultado.
+        """
+        aggfunc = aggfunc.lower()
+        if aggfunc not in PIVOT_AGGREGATES:
+            raise ValueError(f"Agregación '{aggfunc}' no soportada en un pivote")
+        self._pivot = {
+            "index": index,
+            "column": column,
+            "values": values,
+            "aggfunc": aggfunc,
+            "column_values": (
+                list(column_values) if column_values is not None else None
+            ),
+        }
+        return self
+
+    def distinct_values(self, column, limit=None):
+        """Consulta de los valores distintos de `column` (cardinalidad del pivote)"""
+        inner = self._aggregate_query(column, "col_key", None)
+        inner._select = [f"{column} AS col_key"]
+        inner._order_by = ["col_key ASC"]
+        inner._limit = limit
+        return inner._build_select()
+
     def build(self):
+        if self._time_bucket:
+            return self._build_time_bucket()
+        if self._top_n:
+            return self._build_top_n()
+        if self._pivot:
+            return self._build_pivot()
+        return self._build_select()
+
+    def _aggregate_query(self, key_expression, key_alias, measure):
+        """Copia de la consulta agrupada por `key_expression` con la medida como `value`."""
+        inner = copy.copy(self)
+        inner._time_bucket = None
+        inner._top_n = None
+        inner._pivot = None
+        inner._where = list(self._where)
+        inner._select = [f"{key_expression} AS {key_alias}", _measure_sql(measure)]
+        inner._group_by = [key_expression]
+        inner._having = list(self._having)
+        inner._order_by = []
+        inner._limit = None
+        inner._offset = None
+        return inner
+
+    def _build_time_bucket(self):
+        config = self._time_bucket
+        column = config["column"]
+        expression = BUCKET_EXPRESSIONS[config["granularity"]]
+        interval = BUCKET_INTERVALS[config["granularity"]]
+
+        inner = self._aggregate_query(
+            expression.format(col=column), "bucket", config["measure"]
+        )
+        if config["start"]:
+            inner.where(f"{column} >= {_date_literal(config['start'])}")
+        if config["end"]:
+            inner.where(f"{column} < {_date_literal(config['end'])} + INTERVAL 1 DAY")
+
+        # Sin inicio o fin explícito, la serie va del primer al último
+        # periodo con datos
+        first = "(SELECT MIN(bucket) FROM agg)"
+        last = "(SELECT MAX(bucket) FROM agg)"
+        if config["start"]:
+            first = expression.format(col=_date_literal(config["start"]))
+        if config["end"]:
+            last = expression.format(col=_date_literal(config["end"]))
+        bounds = f"SELECT {first} AS first_bucket, {last} AS last_bucket"
+
+        query_parts = [
+            "WITH RECURSIVE agg AS (",
+            inner._build_select(),
+            f"), bounds AS ({bounds}), buckets AS (",
+            "SELECT first_bucket AS bucket FROM bounds WHERE first_bucket IS NOT NULL",
+            "UNION ALL",
+            f"SELECT buckets.bucket + {interval} FROM buckets, bounds",
+            f"WHERE buckets.bucket + {interval} <= bounds.last_bucket",
+            ")",
+            "SELECT buckets.bucket AS bucket, "
+            f"COALESCE(agg.value, {quote_literal(config['fill_value'])}) AS value",
+            "FROM buckets LEFT JOIN agg ON agg.bucket = buckets.bucket",
+            "ORDER BY buckets.bucket ASC",
+        ]
+        return "\n".join(query_parts)
+
+    def _build_top_n(self):
+        config = self._top_n
+        measure = config["measure"]
+        value = _top_n_value(measure)
+        inner = self._aggregate_query(config["dimension"], "label", measure)
+        if isinstance(measure, Avg):
+            # El promedio del resto se calcula sobre las filas, no sobre
+            # los promedios de cada grupo
+            inner._select += [
+                f"SUM({measure.column}) AS value_sum",
+                f"COUNT({measure.column}) AS value_count",
+            ]
+        inner._select.append(
+            f"ROW_NUMBER() OVER (ORDER BY {_measure_expression(measure)} DESC) AS rnk"
+        )
+        label = (
+            f"CASE WHEN ranked.rnk <= {config['n']} THEN ranked.label "
+            f"ELSE {quote_literal(config['other_label'])} END"
+        )
+
+        query_parts = [
+            f"SELECT {label} AS label, {value} AS value",
+            "FROM (",
+            inner._build_select(),
+            ") AS ranked",
+            f"GROUP BY {label}",
+            "ORDER BY MIN(ranked.rnk) ASC",
+        ]
+        return "\n".join(query_parts)
+
+    def _build_pivot(self):
+        config = self._pivot
+        template = PIVOT_AGGREGATES[config["aggfunc"]]
+        values = config["values"]
+        if values == "*" and config["aggfunc"] != "count":
+            raise ValueError("El pivote requiere una columna de valores")
+
+        if config["column_values"] is None:
+            inner = self._aggregate_query(config["index"], "row_key", None)
+            inner._select = [
+                f"{config['index']} AS row_key",
+                f"{config['column']} AS col_key",
+                f"{template.format(expr=values)} AS value",
+            ]
+            inner._group_by = [config["index"], config["column"]]
+            inner._order_by = ["row_key ASC", "col_key ASC"]
+            inner._limit = self._limit
+            return inner._build_select()
+
+        inner = self._aggregate_query(config["index"], "row_key", None)
+        inner._select = [f"{config['index']} AS row_key"]
+        for position, value in enumerate(config["column_values"]):
+            match = f"{config['column']} = {quote_literal(value)}"
+            if config["aggfunc"] == "count":
+                # COUNT da 0 (no NULL) en las combinaciones sin filas y el
+                # pivote dejaría de ser disperso: se suman unos
+                if values != "*":
+                    match = f"{match} AND {values} IS NOT NULL"
+                expression = f"SUM(CASE WHEN {match} THEN 1 END)"
+            else:
+                expression = template.format(
+                    expr=f"CASE WHEN {match} THEN {values} END"
+                )
+            inner._select.append(f"{expression} AS c{position}")
+        inner._order_by = ["row_key ASC"]
+        inner._limit = self._limit
+        return inner._build_select()
+
+    def _build_select(self):
         if not self._select:
             raise ValueError("Debe especificar al menos una columna con select()")
         if not self._from:
@@ -116,6 +354,48 @@ class QueryEngine:
         return self.build()
 
 
+def _measure_expression(measure):
+    if isinstance(measure, SQLFunction):
+        return measure.expression
+    return str(measure)
+
+
+def _measure_sql(measure):
+    return f"{_measure_expression(measure)} AS value"
+
+
+def _top_n_value(measure):
+    """
+    Valor de cada fila de un top_n: los `n` mayores conservan el de su
+    grupo y la fila del resto combina los demás con la misma función.
+    """
+    if isinstance(measure, (Sum, Count)):
+        return "SUM(ranked.value)"
+    if isinstance(measure, Min):
+        return "MIN(ranked.value)"
+    if isinstance(measure, Max):
+        return "MAX(ranked.value)"
+    if isinstance(measure, Avg):
+        return "SUM(ranked.value_sum) / SUM(ranked.value_count)"
+    raise ValueError(
+        f"top_n no admite la medida '{_measure_expression(measure)}': "
+        "usa sum, count, avg, min o max"
+    )
+
+
+def quote_literal(value):
+    """Literal SQL de un valor según su tipo; los textos se escapan."""
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, (int, float)):
+        return str(value)
+    return "'" + str(value).replace("\\", "\\\\").replace("'", "''") + "'"
+
+
+def _date_literal(value):
+    return f"DATE({quote_literal(str(value))})"
+
+
 class SQLFunction:
     def __init__(self, expression, alias=None):
         self.expression = expression
@@ -143,6 +423,7 @@ class Avg(SQLFunction):
     def __init__(self, column, alias=None):
         expression = f"AVG({column})"
         super().__init__(expression, alias)
+        self.column = column
 
 
 class Min(SQLFunction):
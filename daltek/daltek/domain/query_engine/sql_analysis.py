@@ -0,0 +1,212 @@
+# daltek/domain/query_engine/sql_analysis.py
+
+import hashlib
+import re
+
+_LITERAL_RE = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER_RE = re.compile(r"(?<![\w`.])-?\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_COMMENT_RE = re.compile(r"/\*.*?\*/|--[^\n]*|#[^\n]*", re.DOTALL)
+_WHITESPACE_RE = re.compile(r"\s+")
+
+_IDENT = r"`[^`]+`|[A-Za-z_][\w$]*"
+_COLUMN_RE = re.compile(rf"^\(*\s*(?:({_IDENT})\s*\.\s*)?({_IDENT})")
+_TABLE_REF_RE = re.compile(
+    rf"\b(FROM|JOIN)\s+({_IDENT})(?:\s+(?:AS\s+)?(?!ON\b|USING\b|INNER\b|LEFT\b"
+    rf"|RIGHT\b|CROSS\b|JOIN\b|STRAIGHT_JOIN\b|NATURAL\b|OUTER\b)({_IDENT}))?",
+    re.IGNORECASE,
+)
+_ON_RE = re.compile(
+    r"\bON\s+(.*?)(?=\b(?:INNER|LEFT|RIGHT|CROSS|NATURAL|STRAIGHT_JOIN|JOIN)\b|$)",
+    re.IGNORECASE | re.DOTALL,
+)
+_PREDICATE_RE = re.compile(
+    r"^\s*(NOT\s+IN|NOT\s+LIKE|IS\s+NOT|<=>|<>|!=|>=|<=|=|<|>|IN|IS|LIKE|BETWEEN)",
+    re.IGNORECASE,
+)
+
+_CLAUSE_KEYWORDS = ("WHERE", "GROUP BY", "HAVING", "ORDER BY", "LIMIT", "OFFSET")
+
+EQUALITY_OPERATORS = ("=", "<=>", "IN", "IS")
+RANGE_OPERATORS = ("<", ">", "<=", ">=", "BETWEEN", "LIKE")
+
+
+def mask_literals(sql):
+    """Reemplaza literales de texto y números por `?`."""
+    masked = _LITERAL_RE.sub("?", sql)
+    return _NUMBER_RE.sub("?", masked)
+
+
+def normalize_sql(sql):
+    """
+    Normaliza una consulta para agrupar ejecuciones equivalentes:
+    elimina comentarios, literales, listas IN y espacios redundantes.
+    """
+    normalized = _COMMENT_RE.sub(" ", sql or "")
+    normalized = mask_literals(normalized)
+    normalized = _IN_LIST_RE.sub("IN (?)", normalized)
+    normalized = _WHITESPACE_RE.sub(" ", normalized).strip().rstrip(";").strip()
+    return normalized.lower()
+
+
+def fingerprint_sql(sql):
+    """Huella estable (hex de 16 caracteres) de la forma de una consulta."""
+    return hashlib.sha1(normalize_sql(sql).encode("utf-8")).hexdigest()[:16]
+
+
+def unquote_identifier(identifier):
+    return identifier.strip().strip("`")
+
+
+def split_top_level(text, separator):
+    """
+    Divide `text` por `separator` (una coma o una palabra clave como AND)
+    ignorando lo que esté dentro de paréntesis.
+    """
+    if separator == ",":
+        pattern = re.compile(r",")
+    else:
+        pattern = re.compile(rf"\s+{separator}\s+", re.IGNORECASE)
+
+    parts = []
+    depth = 0
+    start = 0
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif depth == 0:
+            match = pattern.match(text, i)
+            if match:
+                parts.append(text[start:i])
+                start = i = match.end()
+                continue
+        i += 1
+    parts.append(text[start:])
+    return [part.strip() for part in parts if part.strip()]
+
+
+def split_clauses(sql):
+    """
+    Separa una consulta SELECT en sus cláusulas de primer nivel.
+    Devuelve un dict {"SELECT": ..., "FROM": ..., "WHERE": ..., ...}.
+    """
+    text = _WHITESPACE_RE.sub(" ", _COMMENT_RE.sub(" ", sql)).strip().rstrip(";")
+    upper = text.upper()
+    positions = []
+    depth = 0
+    for i, char in enumerate(upper):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif depth == 0 and (
+            i == 0 or not (upper[i - 1].isalnum() or upper[i - 1] == "_")
+        ):
+            for keyword in ("SELECT", "FROM") + _CLAUSE_KEYWORDS:
+                if upper.startswith(keyword, i):
+                    end = i + len(keyword)
+                    if end == len(upper) or not (
+                        upper[end].isalnum() or upper[end] == "_"
+                    ):
+                        positions.append((i, keyword))
+                        break
+
+    clauses = {}
+    for index, (start, keyword) in enumerate(positions):
+        if keyword in clauses:
+            continue
+        end = positions[index + 1][0] if index + 1 < len(positions) else len(text)
+        clauses[keyword] = text[start + len(keyword) : end].strip()
+    return clauses
+
+
+def parse_column(expression):
+    """Devuelve (alias_o_tabla, columna) de una referencia simple, o None."""
+    match = _COLUMN_RE.match(expression.strip())
+    if not match:
+        return None
+    qualifier, column = match.groups()
+    column = unquote_identifier(column)
+    if column.upper() in ("NOT", "EXISTS", "SELECT", "CASE", "NULL", "?"):
+        return None
+    return (unquote_identifier(qualifier) if qualifier else None, column)
+
+
+def extract_tables(from_clause):
+    """Devuelve {alias: tabla} y la tabla principal de la cláusula FROM."""
+    tables = {}
+    main_table = None
+    for _keyword, table, alias in _TABLE_REF_RE.findall("FROM " + from_clause):
+        table = unquote_identifier(table)
+        tables[unquote_identifier(alias) if alias else table] = table
+        tables.setdefault(table, table)
+        main_table = main_table or table
+    return tables, main_table
+
+
+def extract_referenced_tables(sql):
+    """Tablas leídas por la consulta, incluidas las de subconsultas y joins."""
+    tables = {
+        unquote_identifier(table)
+        for _keyword, table, _alias in _TABLE_REF_RE.findall(mask_literals(sql))
+    }
+    return sorted(tables)
+
+
+def extract_column_usage(sql):
+    """
+    Analiza una consulta SELECT y devuelve cómo usa cada columna.
+
+    Returns:
+        dict: {
+            "tables": {alias: tabla},
+            "columns": [(tabla, columna, rol), ...]
+        }
+        donde rol es "eq", "range", "join", "group" u "order".
+    """
+    clauses = split_clauses(mask_literals(sql))
+    tables, main_table = extract_tables(clauses.get("FROM", ""))
+    usage = []
+
+    def resolve(reference, role):
+        if not reference:
+            return
+        qualifier, column = reference
+        table = tables.get(qualifier) if qualifier else main_table
+        if table:
+            usage.append((table, column, role))
+
+    for condition in _ON_RE.findall(clauses.get("FROM", "")):
+        for predicate in split_top_level(condition, "AND"):
+            sides = predicate.split("=")
+            if len(sides) == 2:
+                resolve(parse_column(sides[0]), "join")
+                resolve(parse_column(sides[1]), "join")
+
+    for predicate in split_top_level(clauses.get("WHERE", ""), "AND"):
+        if len(split_top_level(predicate.strip("()"), "OR")) > 1:
+            continue
+        reference = parse_column(predicate)
+        if not reference:
+            continue
+        remainder = _COLUMN_RE.sub("", predicate.strip(), count=1)
+        operator = _PREDICATE_RE.match(remainder)
+        if not operator:
+            continue
+        op = _WHITESPACE_RE.sub(" ", operator.group(1).upper())
+        if op in EQUALITY_OPERATORS:
+            resolve(reference, "eq")
+        elif op in RANGE_OPERATORS:
+            resolve(reference, "range")
+
+    for expression in split_top_level(clauses.get("GROUP BY", ""), ","):
+        resolve(parse_column(expression), "group")
+
+    for expression in split_top_level(clauses.get("ORDER BY", ""), ","):
+        resolve(parse_column(expression), "order")
+
+    return {"tables": tables, "columns": usage}
@@ -0,0 +1,112 @@
+# daltek/domain/serializer.py
+
+import datetime
+import decimal
+import json
+
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dependencia opcional
+    orjson = None
+
+COMPAT = "compat"
+FAST = "fast"
+MODES = (COMPAT, FAST)
+DECIMAL_MODES = ("float", "str")
+DATE_MODES = ("str", "iso")
+
+DATE_TYPES = (datetime.date, datetime.datetime, datetime.time, datetime.timedelta)
+
+
+class ResponseEncoder:
+    """
+    Codificador JSON de las respuestas de Daltek (filas de consultas,
+    datasets y charts).
+
+    - compat: mismos bytes que la respuesta estándar de Frappe (json.dumps
+      con `json_handler`), pero resolviendo Decimal, fechas y tipos de
+      NumPy/pandas por tipo exacto en lugar de la cadena de isinstance.
+    - fast: orjson si está instalado (NumPy se serializa sin pasar por
+      Python); Decimal como número o texto y fechas como en Frappe
+      ("2024-01-05 10:00:00") o ISO 8601 según `decimal` y `dates`. Sin
+      orjson se usa json con la misma conversión.
+
+    `fallback` recibe lo que el codificador no conoce (p. ej. el
+    `json_handler` de Frappe para documentos y proxies).
+    """
+
+    def __init__(self, mode=COMPAT, decimal="float", dates="str", fallback=None):
+        if mode not in MODES:
+            raise ValueError(f"Modo de serialización '{mode}' no soportado")
+        if decimal not in DECIMAL_MODES:
+            raise ValueError(f"Modo de Decimal '{decimal}' no soportado")
+        if dates not in DATE_MODES:
+            raise ValueError(f"Modo de fechas '{dates}' no soportado")
+        self.mode = mode
+        self.decimal = decimal if mode == FAST else "float"
+        self.dates = dates if mode == FAST else "str"
+        self.fallback = fallback
+        self._converters = self._build_converters()
+
+    @property
+    def native(self):
+        """True si la serialización la hace orjson"""
+        return self.mode == FAST and orjson is not None
+
+    def _build_converters(self):
+        to_decimal = float if self.decimal == "float" else str
+        to_date = str if self.dates == "str" else _isoformat
+        converters = {decimal.Decimal: to_decimal}
+        converters.update((date_type, to_date) for date_type in DATE_TYPES)
+        # timedelta no tiene formato ISO en Frappe: siempre str()
+        converters[datetime.timedelta] = str
+        converters[pd.Timestamp] = to_date
+        converters[pd.DataFrame] = frame_records
+        converters[pd.Series] = _tolist
+        converters[np.ndarray] = _tolist
+        return converters
+
+    def default(self, obj):
+        converter = self._converters.get(type(obj))
+        if converter is not None:
+            return converter(obj)
+        if isinstance(obj, np.generic):
+            return obj.item()
+        # Subclases (p. ej. fechas de pandas o Decimal de otros drivers)
+        for base, converter in self._converters.items():
+            if isinstance(obj, base):
+                return converter(obj)
+        if self.fallback is not None:
+            return self.fallback(obj)
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+    def dumps(self, obj):
+        """Documento JSON en bytes UTF-8"""
+        if self.native:
+            option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+            if self.dates == "str":
+                option |= orjson.OPT_PASSTHROUGH_DATETIME
+            return orjson.dumps(obj, default=self.default, option=option)
+        return json.dumps(
+            obj,
+            default=self.default,
+            separators=(",", ":"),
+            ensure_ascii=self.mode == COMPAT,
+        ).encode()
+
+
+def frame_records(frame):
+    """Filas de un DataFrame como dicts, con NaN como null"""
+    frame = frame.astype(object).where(frame.notna(), None)
+    return frame.to_dict("records")
+
+
+def _tolist(values):
+    return values.tolist()
+
+
+def _isoformat(value):
+    return value.isoformat()
@@ -0,0 +1,150 @@
+# daltek/domain/sparse_pivot.py
+
+import numpy as np
+import pandas as pd
+
+
+class SparsePivot:
+    """
+    Tabla pivote dispersa: solo se guardan las celdas con dato, como
+    coordenadas (COO) de fila, columna y valor sobre las etiquetas
+    ordenadas. Las celdas ausentes valen `fill_value`.
+
+    Con pivotes de alta cardinalidad (artículo x almacén) la matriz densa
+    tiene millones de ceros; esta representación ocupa lo que los datos.
+    """
+
+    def __init__(self, row_labels, column_labels, rows, cols, values, fill_value=0):
+        self.row_labels = list(row_labels)
+        self.column_labels = list(column_labels)
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.cols = np.asarray(cols, dtype=np.int64)
+        self.values = np.asarray(values)
+        self.fill_value = fill_value
+
+    @property
+    def shape(self):
+        return (len(self.row_labels), len(self.column_labels))
+
+    @property
+    def nnz(self):
+        return len(self.values)
+
+    @property
+    def density(self):
+        cells = self.shape[0] * self.shape[1]
+        return self.nnz / cells if cells else 0.0
+
+    @classmethod
+    def from_coordinates(cls, records, fill_value=0):
+        """Filas {row_key, col_key, value} del pivote disperso de QueryEngine"""
+        frame = pd.DataFrame(records, columns=["row_key", "col_key", "value"])
+        return cls.from_frame(frame, "row_key", "col_key", "value", fill_value)
+
+    @classmethod
+    def from_columns(cls, records, column_values, fill_value=0):
+        """
+        Filas {row_key, c0, c1, ...} de la agregación condicional, ya
+        ordenadas por `row_key`; las celdas nulas se descartan.
+        """
+        records = [record for record in records if record["row_key"] is not None]
+        rows, cols, values = [], [], []
+        for row, record in enumerate(records):
+            for col in range(len(column_values)):
+                value = record.get(f"c{col}")
+                if value is not None:
+                    rows.append(row)
+                    cols.append(col)
+                    values.append(value)
+        return cls(
+            [record["row_key"] for record in records],
+            column_values,
+            rows,
+            cols,
+            values,
+            fill_value,
+        )
+
+    @classmethod
+    def from_frame(cls, frame, index, columns, values, fill_value=0):
+        """Coordenadas a partir de un DataFrame ya agregado (una fila por celda)"""
+        frame = frame.dropna(subset=[index, columns])
+        row_codes, row_labels = pd.factorize(frame[index], sort=True)
+        col_codes, column_labels = pd.factorize(frame[columns], sort=True)
+        return cls(
+            _plain(row_labels),
+            _plain(column_labels),
+            row_codes,
+            col_codes,
+            frame[values].to_numpy(),
+            fill_value,
+        )._ordered()
+
+    @classmethod
+    def from_payload(cls, payload):
+        """Reconstruye el pivote desde `to_payload()` (COO o CSR)"""
+        if payload["format"] == "csr":
+            counts = np.diff(np.asarray(payload["indptr"], dtype=np.int64))
+            rows = np.repeat(np.arange(len(counts)), counts)
+            cols = payload["indices"]
+        else:
+            rows, cols = payload["row"], payload["col"]
+        return cls(
+            payload["rows"],
+            payload["columns"],
+            rows,
+            cols,
+            payload["data"],
+            payload.get("fill_value", 0),
+        )
+
+    def _ordered(self):
+        """Celdas en orden de fila y columna (requisito de CSR)"""
+        order = np.lexsort((self.cols, self.rows))
+        self.rows = self.rows[order]
+        self.cols = self.cols[order]
+        self.values = self.values[order]
+        return self
+
+    def to_csr(self):
+        """(indptr, indices, data) comprimido por filas"""
+        indptr = np.zeros(self.shape[0] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.rows, minlength=self.shape[0]), out=indptr[1:])
+        return indptr, self.cols, self.values
+
+    def to_payload(self, format="csr"):
+        """Representación JSON para los widgets: "csr" o "coo" (coordenadas)"""
+        payload = {
+            "format": format,
+            "shape": list(self.shape),
+            "rows": self.row_labels,
+            "columns": self.column_labels,
+            "fill_value": self.fill_value,
+            "data": _plain(self.values),
+        }
+        if format == "csr":
+            indptr, indices, _ = self.to_csr()
+            payload.update(indptr=indptr.tolist(), indices=indices.tolist())
+        elif format == "coo":
+            payload.update(row=self.rows.tolist(), col=self.cols.tolist())
+        else:
+            raise ValueError(f"Formato de pivote '{format}' no soportado")
+        return payload
+
+    def iter_cells(self):
+        """(etiqueta de fila, etiqueta de columna, valor) de cada celda con dato"""
+        for row, col, value in zip(self.rows, self.cols, _plain(self.values)):
+            yield self.row_labels[row], self.column_labels[col], value
+
+    def to_dense(self, index="index"):
+        """DataFrame denso como Dataset.pivot; solo para pivotes pequeños"""
+        matrix = np.full(self.shape, self.fill_value, dtype=self.values.dtype)
+        matrix[self.rows, self.cols] = self.values
+        frame = pd.DataFrame(matrix, columns=self.column_labels)
+        frame.insert(0, index, self.row_labels)
+        return frame
+
+
+def _plain(values):
+    """Valores de NumPy/pandas como tipos de Python serializables"""
+    return [value.item() if hasattr(value, "item") else value for value in values]
@@ -0,0 +1,261 @@
+# daltek/services/admission.py
+
+import functools
+import time
+from contextlib import contextmanager
+
+import frappe
+
+METRICS_CACHE_KEY = "daltek_admission_metrics"
+WAITING_CACHE_KEY = "daltek_admission_waiting"
+ACTIVE_CACHE_KEY = "daltek_admission_active"
+BUCKET_CACHE_PREFIX = "daltek_admission_bucket:"
+
+# Descuenta `cost` de los buckets del usuario y del sitio solo si ambos
+# tienen saldo, para que un rechazo del sitio no gaste el del usuario.
+# Devuelve {admitido, segundos hasta poder reintentar}.
+TOKEN_BUCKET_SCRIPT = """
+local now = tonumber(ARGV[1])
+local cost = tonumber(ARGV[2])
+local tokens = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[1 + i * 2])
+    local burst = tonumber(ARGV[2 + i * 2])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local available = tonumber(state[1]) or burst
+    local elapsed = math.max(0, now - (tonumber(state[2]) or now))
+    available = math.min(burst, available + elapsed * rate)
+    tokens[i] = available
+    if available < cost then
+        wait = math.max(wait, (cost - available) / rate)
+    end
+end
+if wait > 0 then
+    return {0, tostring(wait)}
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[1 + i * 2])
+    local burst = tonumber(ARGV[2 + i * 2])
+    redis.call('HSET', key, 'tokens', tokens[i] - cost, 'ts', now)
+    redis.call('EXPIRE', key, math.ceil(burst / rate) + 1)
+end
+return {1, '0'}
+"""
+
+# Ocupa un lugar entre las consultas analíticas en curso de todos los
+# workers (y sitios del bench: comparten el servidor de base de datos).
+# Los lugares caducan tras `lease` segundos por si un worker muere
+# sin liberarlos.
+ACQUIRE_SLOT_SCRIPT = """
+local now = tonumber(ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - tonumber(ARGV[3]))
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[2]) then
+    redis.call('ZADD', KEYS[1], now, ARGV[4])
+    return 1
+end
+return 0
+"""
+
+
+def get_admission_settings():
+    """
+    Control de admisión desde site_config.json:
+        daltek_admission_enabled: activa el control (1 por defecto)
+        daltek_user_rate / daltek_user_burst: peticiones por segundo y
+            ráfaga máxima de cada usuario
+        daltek_site_rate / daltek_site_burst: lo mismo para todo el sitio
+        daltek_max_concurrent_queries: consultas analíticas simultáneas
+            entre todos los workers
+        daltek_admission_max_wait: segundos que una petición puede esperar
+            turno antes de rechazarse
+    """
+    conf = frappe.conf
+    return frappe._dict(
+        enabled=bool(conf.get("daltek_admission_enabled", 1)),
+        user_rate=float(conf.get("daltek_user_rate") or 2),
+        user_burst=float(conf.get("daltek_user_burst") or 20),
+        site_rate=float(conf.get("daltek_site_rate") or 30),
+        site_burst=float(conf.get("daltek_site_burst") or 120),
+        max_concurrent=int(conf.get("daltek_max_concurrent_queries") or 8),
+        max_wait=float(conf.get("daltek_admission_max_wait") or 2),
+        lease=int(conf.get("daltek_query_lease") or 300),
+    )
+
+
+def _run_script(script, keys, args):
+    cache = frappe.cache()
+    return cache.eval(script, len(keys), *keys, *args)
+
+
+def take_tokens(user, settings, cost=1):
+    """
+    Intenta descontar `cost` de los buckets del usuario y del sitio.
+
+    Returns:
+        tuple: (admitido, segundos a esperar para reintentar)
+    """
+    cache = frappe.cache()
+    allowed, wait = _run_script(
+        TOKEN_BUCKET_SCRIPT,
+        [
+            cache.make_key(BUCKET_CACHE_PREFIX + "user:" + user),
+            cache.make_key(BUCKET_CACHE_PREFIX + "site"),
+        ],
+        [
+            time.time(),
+            cost,
+            settings.user_rate,
+            settings.user_burst,
+            settings.site_rate,
+            settings.site_burst,
+        ],
+    )
+    return bool(int(allowed)), float(wait)
+
+
+def acquire_slot(lease_id, settings):
+    cache = frappe.cache()
+    return bool(
+        int(
+            _run_script(
+                ACQUIRE_SLOT_SCRIPT,
+                [cache.make_key(ACTIVE_CACHE_KEY, shared=True)],
+                [time.time(), settings.max_concurrent, settings.lease, lease_id],
+            )
+        )
+    )
+
+
+def release_slot(lease_id):
+    cache = frappe.cache()
+    cache.zrem(cache.make_key(ACTIVE_CACHE_KEY, shared=True), lease_id)
+
+
+def count_metric(name, amount=1):
+    try:
+        cache = frappe.cache()
+        cache.hincrbyfloat(cache.make_key(METRICS_CACHE_KEY), name, amount)
+    except Exception as e:
+        frappe.logger("daltek").warning(f"No se pudo registrar {name}: {e}")
+
+
+def reject(endpoint, reason, retry_after):
+    """Rechaza la petición con 429 e indica cuándo reintentar."""
+    retry_after = max(1, int(retry_after + 0.999))
+    count_metric(f"rejected_{reason}")
+    count_metric(f"rejected:{endpoint}")
+    frappe.local.response["retry_after"] = retry_after
+    headers = getattr(frappe.local, "response_headers", None)
+    if headers is not None:
+        headers["Retry-After"] = str(retry_after)
+    frappe.throw(
+        f"Demasiadas consultas en curso; reintenta en {retry_after} s",
+        frappe.TooManyRequestsError,
+    )
+
+
+@contextmanager
+def _waiting():
+    """Cuenta la petición en la cola de espera mientras aguarda turno."""
+    cache = frappe.cache()
+    key = cache.make_key(WAITING_CACHE_KEY)
+    cache.incr(key)
+    count_metric("queued")
+    try:
+        yield
+    finally:
+        cache.decr(key)
+
+
+@contextmanager
+def admit(endpoint, concurrent=False):
+    """
+    Admite una petición analítica o la rechaza con 429.
+
+    Primero se descuenta un token del bucket del usuario y del sitio; si
+    el saldo llega antes de `max_wait`, la petición espera. Con
+    `concurrent`, además ocupa uno de los `max_concurrent` lugares de
+    consultas simultáneas hasta terminar.
+    """
+    settings = get_admission_settings()
+    if not settings.enabled:
+        yield
+        return
+
+    started = time.monotonic()
+    deadline = started + settings.max_wait
+    user = frappe.session.user
+
+    allowed, wait = take_tokens(user, settings)
+    if not allowed:
+        with _waiting():
+            while not allowed:
+                if time.monotonic() + wait > deadline:
+                    reject(endpoint, "rate", wait)
+                time.sleep(wait)
+                allowed, wait = take_tokens(user, settings)
+
+    lease_id = None
+    if concurrent:
+        lease_id = f"{frappe.local.site}:{user}:{frappe.generate_hash(length=10)}"
+        if not acquire_slot(lease_id, settings):
+            with _waiting():
+                while not acquire_slot(lease_id, settings):
+                    if time.monotonic() > deadline:
+                        reject(endpoint, "concurrency", 1)
+                    time.sleep(0.05)
+
+    waited = time.monotonic() - started
+    count_metric("admitted")
+    if waited > 0.001:
+        count_metric("wait_seconds", round(waited, 4))
+    try:
+        yield
+    finally:
+        if lease_id:
+            release_slot(lease_id)
+
+
+def admission_control(concurrent=False):
+    """
+    Decorador para endpoints analíticos. Va debajo de @frappe.whitelist():
+
+        @frappe.whitelist()
+        @admission_control(concurrent=True)
+        def execute_query_builder_sql(...):
+    """
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with admit(fn.__name__, concurrent=concurrent):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def get_admission_metrics():
+    """
+    Contadores acumulados (admitted, queued, rejected_rate,
+    rejected_concurrency, rejected:<endpoint>, wait_seconds) y valores
+    actuales: peticiones esperando turno y consultas en curso.
+    """
+    cache = frappe.cache()
+    # HGETALL directo: los contadores no están serializados con pickle
+    counters = cache.execute_command("HGETALL", cache.make_key(METRICS_CACHE_KEY))
+    metrics = {
+        (key.decode() if isinstance(key, bytes) else key): float(value)
+        for key, value in (counters or {}).items()
+    }
+    settings = get_admission_settings()
+    active_key = cache.make_key(ACTIVE_CACHE_KEY, shared=True)
+    cache.zremrangebyscore(active_key, "-inf", time.time() - settings.lease)
+    return {
+        "counters": metrics,
+        "queue_depth": int(cache.get(cache.make_key(WAITING_CACHE_KEY)) or 0),
+        "active_queries": int(cache.zcard(active_key)),
+        "max_concurrent_queries": settings.max_concurrent,
+    }
@@ -0,0 +1,289 @@
+# daltek/services/crossfilter.py
+
+import hashlib
+import time
+from collections import OrderedDict
+
+import frappe
+
+from daltek.daltek.domain.dataset import Dataset
+from daltek.daltek.domain.plotly_data_manager import PlotlyDataManager
+from daltek.daltek.domain.query_engine.query_definition import (
+    definition_doctypes,
+    split_column,
+)
+from daltek.daltek.services import metrics
+from daltek.daltek.services.data_version import get_query_version
+from daltek.daltek.services.link_graph import resolve_query_joins
+from daltek.daltek.services.permissions import compile_secure_definition
+from daltek.daltek.services.query_guard import prepare_select_sql
+from daltek.daltek.services.snapshots import public_widget_data
+from daltek.daltek.services.widget_data import (
+    DEFAULT_ROW_LIMIT,
+    load_widget_data,
+    parse_json_field,
+    run_widget_query,
+)
+
+# Datasets e índices por dashboard, en memoria del proceso. La clave
+# incluye la huella y la versión de datos de cada consulta, así que una
+# entrada nunca queda obsoleta: solo deja de usarse.
+MAX_CACHED_DASHBOARDS = 16
+_dashboards = OrderedDict()
+
+
+def get_crossfilter_settings():
+    """
+    daltek_crossfilter_max_rows: filas máximas de un dataset compartido;
+        las consultas más grandes se filtran en SQL
+    """
+    return frappe._dict(
+        max_rows=int(frappe.conf.get("daltek_crossfilter_max_rows") or 50000),
+    )
+
+
+def qualified(doctype, fieldname):
+    return f"{doctype}.{fieldname}"
+
+
+def get_dashboard_datasets(queries):
+    """
+    PlotlyDataManager con un dataset por consulta (compartido por todos los
+    widgets que la usan), leído desde la caché de resultados.
+
+    Las columnas se renombran a "DocType.campo" para que un mismo filtro
+    signifique lo mismo en todas las consultas.
+
+    Returns:
+        dict: {"manager", "definitions": {query_id: definición},
+            "in_memory": {query_id, ...}}
+    """
+    settings = get_crossfilter_settings()
+    sources = {}
+    for query_id, query in queries.items():
+        definition = resolve_query_joins({**query, "limit": None})
+        # El LIMIT en el motor: agregarlo sobre el texto fallaría con
+        # columnas como `credit_limit` y cargaría la tabla completa
+        engine = compile_secure_definition(definition).limit(settings.max_rows + 1)
+        sql = prepare_select_sql(engine.build())
+        sources[query_id] = (definition, sql, get_query_version(sql))
+
+    key = (
+        frappe.local.site,
+        tuple(
+            sorted(
+                (query_id, version["fingerprint"], version["data_version"])
+                for query_id, (_, _, version) in sources.items()
+            )
+        ),
+    )
+    metrics.count_cache("crossfilter_datasets", key in _dashboards)
+    if key in _dashboards:
+        _dashboards.move_to_end(key)
+        return _dashboards[key]
+
+    manager = PlotlyDataManager()
+    in_memory = set()
+    settled = True
+    for query_id, (definition, sql, version) in sources.items():
+        rows, _, _ = run_widget_query(sql, version)
+        settled = settled and version["data_version"] is not None
+        if len(rows) > settings.max_rows:
+            continue
+        dataset = Dataset(list(rows))
+        dataset.df.columns = [
+            column if "." in column else qualified(definition["doctype"], column)
+            for column in dataset.df.columns
+        ]
+        manager.add_dataset(query_id, dataset)
+        in_memory.add(query_id)
+
+    entry = {
+        "manager": manager,
+        "definitions": {query_id: source[0] for query_id, source in sources.items()},
+        "in_memory": in_memory,
+    }
+    if not settled:
+        # Filas posiblemente anteriores a la versión de la clave
+        return entry
+    _dashboards[key] = entry
+    while len(_dashboards) > MAX_CACHED_DASHBOARDS:
+        _dashboards.popitem(last=False)
+    return entry
+
+
+def validate_filters(filters):
+    for f in filters:
+        if "." not in str(f.get("column", "")):
+            raise ValueError("La columna del filtro debe ser 'DocType.campo'")
+        if "values" not in f and "range" not in f:
+            raise ValueError("El filtro debe indicar 'values' o 'range'")
+    return filters
+
+
+def filters_as_definition(filters, definition, widget_id):
+    """Filtros cruzados que aplican a la consulta, en formato del Query Builder."""
+    base = definition["doctype"]
+    doctypes = definition_doctypes(definition)
+    conditions = []
+    for f in filters:
+        doctype, fieldname = f["column"].rsplit(".", 1)
+        if f.get("widget_id") == widget_id or doctype not in doctypes:
+            continue
+        col = fieldname if doctype == base else f["column"]
+        if "values" in f:
+            conditions.append({"col": col, "op": "IN", "val": list(f["values"])})
+            continue
+        low, high = f["range"]
+        if low is not None:
+            conditions.append({"col": col, "op": ">=", "val": low})
+        if high is not None:
+            conditions.append({"col": col, "op": "<", "val": high})
+    return conditions
+
+
+def memory_widget_spec(widget, definition, columns, filters):
+    """
+    Spec del widget con columnas "DocType.campo", o None si le falta alguna
+    columna en el dataset o tiene pipeline o pivote y debe resolverse en SQL.
+    """
+    base = definition["doctype"]
+    doctypes = definition_doctypes(definition)
+    properties = widget.get("properties") or {}
+    # Pipelines y pivotes se resuelven sobre la consulta ya filtrada en SQL
+    if properties.get("pipeline") or properties.get("pivot"):
+        return None
+
+    field = properties.get("field")
+    if field:
+        field = qualified(*split_column(field, base))
+    chart = properties.get("chart")
+    if chart:
+        chart = {
+            **chart,
+            "x": qualified(*split_column(chart["x"], base)),
+            "y": qualified(*split_column(chart["y"], base)),
+        }
+
+    needed = [field] if field else []
+    if chart:
+        needed += [chart["x"], chart["y"]]
+    for f in filters:
+        if f.get("widget_id") != widget.get("id"):
+            if f["column"].rsplit(".", 1)[0] in doctypes:
+                needed.append(f["column"])
+    if any(column not in columns for column in needed):
+        return None
+
+    return {
+        "aggregate": properties.get("aggregate"),
+        "field": field,
+        "chart": chart,
+        "limit": int(properties.get("limit") or DEFAULT_ROW_LIMIT),
+    }
+
+
+def result_hash(data):
+    return hashlib.sha1(frappe.as_json(data, indent=None).encode()).hexdigest()[:12]
+
+
+def crossfilter_dashboard(doc, filters, known=None):
+    """
+    Recalcula los widgets del dashboard con filtros cruzados.
+
+    Los widgets cuya consulta está en un dataset compartido se recalculan en
+    memoria con índices de dimensión; solo se consulta la base de datos si
+    el filtro necesita columnas que no están en caché o el dataset es
+    demasiado grande.
+
+    Args:
+        filters (list): [{"column": "DocType.campo", "values": [...] |
+            "range": [desde, hasta], "widget_id": widget que lo originó}]
+        known (dict): {widget_id: hash} de lo que el cliente ya muestra
+
+    Returns:
+        dict: {"widgets": {id: datos} solo de los que cambiaron,
+            "unchanged": [...], "sources": {id: "memory" | "sql"}, "elapsed_ms"}
+    """
+    started = time.perf_counter()
+    filters = validate_filters(filters or [])
+    known = known or {}
+
+    widgets = [
+        w
+        for w in parse_json_field(doc.layout, [])
+        if (w.get("properties") or {}).get("query_id")
+    ]
+    queries = {q.get("id"): q for q in parse_json_field(doc.query_data_storage, [])}
+    used = {
+        w["properties"]["query_id"]
+        for w in widgets
+        if w["properties"]["query_id"] in queries
+    }
+    datasets = get_dashboard_datasets(
+        {query_id: queries[query_id] for query_id in used}
+    )
+    # Los widgets se registran en un manager propio de la petición que
+    # comparte los datasets e índices cacheados
+    manager = PlotlyDataManager()
+    manager.datasets = datasets["manager"].datasets
+    manager.indexes = datasets["manager"].indexes
+
+    published = {}
+    sources = {}
+    specs = {}
+    for widget in widgets:
+        widget_id = widget.get("id")
+        query_id = widget["properties"]["query_id"]
+        if query_id not in used:
+            published[widget_id] = {"success": False}
+            continue
+
+        definition = datasets["definitions"][query_id]
+        spec = None
+        if query_id in datasets["in_memory"]:
+            columns = manager.get_dataset(query_id).df.columns
+            spec = memory_widget_spec(widget, definition, columns, filters)
+
+        if spec:
+            manager.add_widget(
+                widget_id,
+                query_id,
+                aggregate=spec["aggregate"],
+                field=spec["field"],
+                limit=None if spec["aggregate"] else spec["limit"],
+            )
+            specs[widget_id] = spec
+            sources[widget_id] = "memory"
+            continue
+
+        # Fallback: la consulta del widget con los filtros agregados
+        query = {
+            **queries[query_id],
+            "filters": list(queries[query_id].get("filters") or [])
+            + filters_as_definition(filters, definition, widget_id),
+        }
+        published[widget_id] = public_widget_data(
+            widget, load_widget_data(widget, {query_id: query})
+        )
+        sources[widget_id] = "sql"
+
+    for widget_id, data in manager.crossfilter(filters, list(specs)).items():
+        widget = {"id": widget_id, "properties": {"chart": specs[widget_id]["chart"]}}
+        published[widget_id] = public_widget_data(widget, data)
+
+    changed = {}
+    unchanged = []
+    for widget_id, data in published.items():
+        data["hash"] = result_hash(data)
+        if known.get(widget_id) == data["hash"]:
+            unchanged.append(widget_id)
+        else:
+            changed[widget_id] = data
+
+    return {
+        "widgets": changed,
+        "unchanged": unchanged,
+        "sources": sources,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
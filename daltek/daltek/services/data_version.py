@@ -0,0 +1,140 @@
+# daltek/services/data_version.py
+
+import hashlib
+import time
+from functools import partial
+
+import frappe
+
+from daltek.daltek.domain.query_engine.sql_analysis import extract_referenced_tables
+
+VERSIONS_CACHE_KEY = "daltek_doctype_versions"
+EPOCH_CACHE_KEY = "daltek_data_epoch"
+# {doctype: timestamp del último cambio}, para no cachear lecturas de una
+# réplica que todavía puede no tenerlo
+CHANGED_AT_CACHE_KEY = "daltek_doctype_changed_at"
+
+# DocTypes que cambian constantemente y nunca alimentan dashboards
+IGNORED_DOCTYPES = {
+    "Access Log",
+    "Activity Log",
+    "Comment",
+    "Error Log",
+    "Route History",
+    "Scheduled Job Log",
+    "Version",
+}
+
+
+def changed_doctypes(doc):
+    """
+    DocTypes cuyos datos cambian al guardar o borrar `doc`: el suyo y los
+    de sus tablas hijas, que no disparan doc_events propios.
+    """
+    return sorted({doc.doctype} | {df.options for df in doc.meta.get_table_fields()})
+
+
+def bump_doctype_version(doc, method=None):
+    """
+    doc_event para cualquier DocType: incrementa el contador de versión del
+    DocType y de sus tablas hijas para que las cachés de resultados de los
+    clientes se revaliden.
+
+    El incremento se hace después del commit: antes, una lectura con la
+    versión nueva todavía vería las filas anteriores y las cachearía.
+    """
+    if doc.doctype in IGNORED_DOCTYPES:
+        return
+    frappe.db.after_commit.add(partial(increment_versions, changed_doctypes(doc)))
+
+
+def increment_versions(doctypes):
+    try:
+        cache = frappe.cache()
+        key = cache.make_key(VERSIONS_CACHE_KEY)
+        for doctype in doctypes:
+            cache.hincrby(key, doctype, 1)
+        now = time.time()
+        cache.execute_command(
+            "HSET",
+            cache.make_key(CHANGED_AT_CACHE_KEY),
+            *[value for doctype in doctypes for value in (doctype, now)],
+        )
+    except Exception as e:
+        # Nunca bloquear el guardado del documento por la caché
+        frappe.logger("daltek").warning(f"No se pudo versionar {doctypes}: {e}")
+
+
+def get_data_epoch():
+    """
+    Identificador de la generación de contadores. Si Redis se vacía, los
+    contadores vuelven a cero; el epoch nuevo evita confundirlos con los
+    que ya tienen los clientes.
+    """
+    epoch = frappe.cache().get_value(EPOCH_CACHE_KEY)
+    if not epoch:
+        epoch = frappe.generate_hash(length=8)
+        frappe.cache().set_value(EPOCH_CACHE_KEY, epoch)
+    return epoch
+
+
+def get_data_version(doctypes):
+    """Versión combinada de los datos de `doctypes`."""
+    doctypes = sorted(set(doctypes))
+    cache = frappe.cache()
+    counters = (
+        cache.hmget(cache.make_key(VERSIONS_CACHE_KEY), doctypes) if doctypes else []
+    )
+    parts = [get_data_epoch()] + [
+        f"{doctype}:{int(counter or 0)}" for doctype, counter in zip(doctypes, counters)
+    ]
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()[:16]
+
+
+def doctypes_from_sql(sql):
+    return [
+        table[3:] for table in extract_referenced_tables(sql) if table.startswith("tab")
+    ]
+
+
+def query_fingerprint(sql):
+    """
+    Huella exacta del SQL. A diferencia de fingerprint_sql, conserva los
+    literales: dos filtros con valores distintos son resultados distintos.
+    """
+    return hashlib.sha1(" ".join(sql.split()).encode()).hexdigest()[:16]
+
+
+def get_query_version(sql):
+    """Huella de la consulta y versión de los DocTypes que lee."""
+    return {
+        "fingerprint": query_fingerprint(sql),
+        "data_version": get_data_version(doctypes_from_sql(sql)),
+    }
+
+
+def is_settled(sql, version, node):
+    """
+    True si las filas que se leyeron para `version` corresponden a esa
+    versión y se pueden guardar bajo ella (en Redis y en el cliente): los
+    DocTypes no cambiaron durante la consulta y, si la sirvió la réplica,
+    ningún cambio reciente puede faltarle todavía (`node["max_staleness"]`).
+    """
+    doctypes = sorted(set(doctypes_from_sql(sql)))
+    if get_data_version(doctypes) != version["data_version"]:
+        return False
+    if node.get("node") != "replica" or not doctypes:
+        return True
+    cache = frappe.cache()
+    changed_at = cache.hmget(cache.make_key(CHANGED_AT_CACHE_KEY), doctypes)
+    latest = max(float(value or 0) for value in changed_at)
+    return time.time() - latest > node.get("max_staleness", 0)
+
+
+def is_unchanged(current, fingerprint=None, data_version=None):
+    """True si el cliente ya tiene el resultado de esta consulta y versión."""
+    return bool(
+        data_version
+        and fingerprint == current["fingerprint"]
+        and data_version == current["data_version"]
+    )
@@ -0,0 +1,88 @@
+# daltek/services/execution_plan.py
+
+import frappe
+from frappe.model.document import Document
+
+from daltek.daltek.domain.execution_plan import ExecutionPlan, is_current
+from daltek.daltek.domain.query_engine.query_definition import (
+    compile_query_definition,
+    definition_doctypes,
+)
+from daltek.daltek.services import metrics
+from daltek.daltek.services.data_version import query_fingerprint
+from daltek.daltek.services.link_graph import (
+    get_link_graph_version,
+    resolve_query_joins,
+)
+from daltek.daltek.services.query_guard import prepare_select_sql
+from daltek.daltek.services.widget_data import parse_json_field, widget_sql
+
+
+def dataset_sql(query, spec):
+    """Plantilla SQL (sin permisos) de un dataset de filas o agregado"""
+    if spec.get("pivot") or spec.get("pipeline"):
+        return None
+    definition = query["definition"]
+    try:
+        return widget_sql(
+            compile_query_definition(definition), definition["doctype"], spec
+        )
+    except frappe.ValidationError as e:
+        raise ValueError(str(e)) from e
+
+
+def compile_execution_plan(doc):
+    """
+    Compila el layout y las consultas guardadas de un dashboard en un plan
+    de ejecución (ver ExecutionPlan): joins resueltos, SQL base con su
+    huella, datasets sin duplicados y el dataset y chart de cada widget.
+
+    El SQL del plan no lleva permisos: las condiciones de fila del usuario
+    se aplican al cargar los datos.
+    """
+    plan = ExecutionPlan(get_link_graph_version())
+    for query in parse_json_field(doc.query_data_storage, []):
+        query_id = query.get("id")
+        try:
+            definition = resolve_query_joins({**query, "limit": None})
+            sql = prepare_select_sql(compile_query_definition(definition).build())
+        except (frappe.ValidationError, ValueError) as e:
+            # Una consulta inválida no impide guardar el dashboard; sus
+            # widgets responden con el error
+            plan.add_query_error(query_id, str(e))
+            continue
+        plan.add_query(
+            query_id,
+            definition,
+            sql,
+            query_fingerprint(sql),
+            definition_doctypes(definition),
+        )
+
+    for widget in parse_json_field(doc.layout, []):
+        plan.add_widget(
+            widget.get("id"), widget.get("properties") or {}, build_sql=dataset_sql
+        )
+    return plan.as_dict()
+
+
+def get_execution_plan(doc):
+    """
+    Plan de ejecución guardado en el dashboard. Si falta o quedó obsoleto
+    (otra versión del formato o cambió el grafo de relaciones), se
+    recompila y se vuelve a guardar sin tocar `modified`.
+    """
+    plan = parse_json_field(doc.get("execution_plan"), None)
+    current = is_current(plan, get_link_graph_version())
+    metrics.count_cache("execution_plan", current)
+    if current:
+        return plan
+
+    plan = compile_execution_plan(doc)
+    if isinstance(doc, Document) and not doc.is_new():
+        value = frappe.as_json(plan, indent=None)
+        frappe.db.set_value(
+            "Daltek", doc.name, "execution_plan", value, update_modified=False
+        )
+        doc.execution_plan = value
+    return plan
@@ -0,0 +1,251 @@
+# daltek/services/export.py
+
+import os
+
+import frappe
+
+from daltek.daltek.domain.exporters import (
+    EXPORT_FORMATS,
+    WRITERS,
+    iter_chunks,
+    iter_csv,
+)
+from daltek.daltek.services.query_guard import estimate_query_cost, prepare_select_sql
+
+EXPORT_TOKEN_PREFIX = "daltek_export:"
+
+
+def get_export_settings():
+    """
+    Configuración de exportación desde site_config.json:
+        daltek_export_chunk_size: filas leídas del cursor por bloque
+        daltek_export_background_rows: filas estimadas a partir de las cuales
+            la exportación se genera en segundo plano
+    """
+    conf = frappe.conf
+    return frappe._dict(
+        chunk_size=int(conf.get("daltek_export_chunk_size") or 5000),
+        background_rows=int(conf.get("daltek_export_background_rows") or 200000),
+        token_ttl=300,
+    )
+
+
+class QueryStream:
+    """
+    Resultado de una consulta leído desde un cursor del lado del servidor
+    (SSCursor) sobre una conexión propia.
+
+    La conexión no es `frappe.db`: la respuesta en streaming se consume
+    después de que Frappe cierra la conexión de la petición.
+    """
+
+    def __init__(self, sql_query, chunk_size):
+        import pymysql
+
+        self.connection = open_export_connection()
+        try:
+            self.cursor = self.connection.cursor(pymysql.cursors.SSCursor)
+            self.cursor.execute(sql_query)
+        except Exception:
+            self.connection.close()
+            raise
+        self.columns = [column[0] for column in self.cursor.description]
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        try:
+            yield from iter_chunks(self.cursor, self.chunk_size)
+        finally:
+            self.close()
+
+    def close(self):
+        if self.connection is None:
+            return
+        try:
+            self.cursor.close()
+        finally:
+            self.connection.close()
+            self.connection = None
+
+
+def open_export_connection():
+    """Conexión MariaDB nueva con las credenciales del sitio."""
+    from frappe.database import get_db
+
+    conf = frappe.conf
+    db = get_db(
+        host=conf.db_host,
+        port=conf.db_port,
+        user=conf.db_user or conf.db_name,
+        password=conf.db_password,
+        cur_db_name=conf.db_name,
+    )
+    db.connect()
+    return db._conn
+
+
+def validate_export_format(file_format):
+    file_format = (file_format or "csv").lower()
+    if file_format not in EXPORT_FORMATS:
+        frappe.throw(f"Formato de exportación no soportado: {file_format}")
+    if file_format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            frappe.throw("La exportación a Parquet requiere instalar pyarrow")
+    return file_format
+
+
+def prepare_export(sql_query, file_format="csv"):
+    """
+    Valida la exportación y decide cómo servirla.
+
+    Returns:
+        dict: {"mode": "inline", "token"} para descargar en streaming o
+            {"mode": "background", "job_id"} si la consulta es grande
+    """
+    file_format = validate_export_format(file_format)
+    sql_query = prepare_select_sql(sql_query)
+    settings = get_export_settings()
+
+    estimate = estimate_query_cost(sql_query)
+    if estimate and estimate["rows_examined"] >= settings.background_rows:
+        job_id = frappe.generate_hash(length=12)
+        frappe.enqueue(
+            "daltek.daltek.services.export.run_export_job",
+            queue="long",
+            job_id=f"daltek_export_{job_id}",
+            sql_query=sql_query,
+            file_format=file_format,
+            export_id=job_id,
+            owner=frappe.session.user,
+        )
+        return {"mode": "background", "job_id": job_id, "estimate": estimate}
+
+    token = frappe.generate_hash(length=20)
+    frappe.cache().set_value(
+        EXPORT_TOKEN_PREFIX + token,
+        {"sql": sql_query, "format": file_format, "owner": frappe.session.user},
+        expires_in_sec=settings.token_ttl,
+    )
+    return {"mode": "inline", "token": token, "estimate": estimate}
+
+
+def pop_export_token(token):
+    """Recupera (una sola vez) la exportación preparada por prepare_export."""
+    key = EXPORT_TOKEN_PREFIX + str(token)
+    export = frappe.cache().get_value(key)
+    if not export:
+        frappe.throw("La exportación expiró o no existe")
+    if export["owner"] != frappe.session.user:
+        frappe.throw(
+            "No tienes permiso para descargar esta exportación", frappe.PermissionError
+        )
+    frappe.cache().delete_value(key)
+    return export
+
+
+def export_filename(file_format, export_id=None):
+    """
+    Nombre del archivo exportado. Lleva el id de la exportación (o un hash)
+    para que dos exportaciones en el mismo segundo no se pisen.
+    """
+    stamp = frappe.utils.now_datetime().strftime("%Y%m%d_%H%M%S")
+    suffix = export_id or frappe.generate_hash(length=8)
+    extension = EXPORT_FORMATS[file_format]["extension"]
+    return f"daltek_export_{stamp}_{suffix}.{extension}"
+
+
+def build_export_response(sql_query, file_format):
+    """
+    Respuesta HTTP de la exportación.
+
+    CSV se envía en streaming directamente desde el cursor. XLSX y Parquet
+    necesitan el archivo completo (el ZIP/pie se escribe al final), así que
+    se escriben por bloques a un temporal y se sirve ese archivo.
+    """
+    from werkzeug.wrappers import Response
+    from werkzeug.wsgi import wrap_file
+
+    settings = get_export_settings()
+    filename = export_filename(file_format)
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    content_type = EXPORT_FORMATS[file_format]["content_type"]
+
+    stream = QueryStream(sql_query, settings.chunk_size)
+    if file_format == "csv":
+        response = Response(
+            iter_csv(stream.columns, stream),
+            content_type=content_type,
+            headers=headers,
+            direct_passthrough=True,
+        )
+        response.call_on_close(stream.close)
+        return response
+
+    import tempfile
+
+    handle, path = tempfile.mkstemp(suffix=f".{file_format}")
+    os.close(handle)
+    try:
+        WRITERS[file_format](path, stream.columns, stream)
+        f = open(path, "rb")
+    finally:
+        stream.close()
+        # El archivo abierto sigue legible tras borrarlo del disco
+        os.remove(path)
+
+    response = Response(
+        wrap_file(frappe.local.request.environ, f),
+        content_type=content_type,
+        headers=headers,
+        direct_passthrough=True,
+    )
+    response.call_on_close(f.close)
+    return response
+
+
+def run_export_job(sql_query, file_format, export_id, owner):
+    """
+    Escribe la exportación en los archivos privados del sitio y avisa al
+    usuario con la URL del File creado.
+    """
+    settings = get_export_settings()
+    filename = export_filename(file_format, export_id)
+    path = frappe.get_site_path("private", "files", filename)
+
+    try:
+        stream = QueryStream(sql_query, settings.chunk_size)
+        try:
+            WRITERS[file_format](path, stream.columns, stream)
+        finally:
+            stream.close()
+
+        file_doc = frappe.get_doc(
+            {
+                "doctype": "File",
+                "file_name": filename,
+                "file_url": f"/private/files/{filename}",
+                "is_private": 1,
+                "file_size": os.path.getsize(path),
+            }
+        )
+        file_doc.flags.ignore_permissions = True
+        file_doc.insert()
+        file_doc.db_set("owner", owner)
+        frappe.db.commit()
+
+        payload = {
+            "export_id": export_id,
+            "success": True,
+            "file_url": file_doc.file_url,
+        }
+    except Exception as e:
+        frappe.log_error(
+            f"Error generando exportación: {str(e)}", "QueryBuilder Export Error"
+        )
+        if os.path.exists(path):
+            os.remove(path)
+        payload = {"export_id": export_id, "success": False, "error": str(e)}
+
+    frappe.publish_realtime("daltek_export_ready", payload, user=owner)
@@ -0,0 +1,170 @@
+# daltek/services/link_graph.py
+
+from collections import deque
+
+import frappe
+
+LINK_GRAPH_CACHE_KEY = "daltek_link_graph"
+LINK_GRAPH_VERSION_KEY = "daltek_link_graph_version"
+LINK_FIELDTYPES = ("Link", "Table", "Table MultiSelect")
+MAX_PATH_DEPTH = 3
+
+# Copia en memoria del grafo por proceso: {sitio: (versión, grafo, rutas)}
+_local_graphs = {}
+
+
+def build_link_graph():
+    """
+    Construye el grafo de relaciones entre DocTypes a partir de los campos
+    Link/Table (estándar y personalizados).
+
+    Returns:
+        dict: {doctype: [arista, ...]} donde cada arista es
+            {"from", "to", "fieldname", "kind", "owner"}; `owner` es el
+            DocType que contiene el campo y `kind` es "link" o "child".
+    """
+    fieldtypes = ", ".join(f"'{fieldtype}'" for fieldtype in LINK_FIELDTYPES)
+    fields = frappe.db.sql(
+        f"""
+        SELECT parent AS owner, fieldname, fieldtype, options
+        FROM `tabDocField`
+        WHERE parenttype = 'DocType' AND fieldtype IN ({fieldtypes})
+            AND IFNULL(options, '') != ''
+        UNION ALL
+        SELECT dt AS owner, fieldname, fieldtype, options
+        FROM `tabCustom Field`
+        WHERE fieldtype IN ({fieldtypes}) AND IFNULL(options, '') != ''
+        """,
+        as_dict=True,
+    )
+    excluded = set(
+        frappe.get_all(
+            "DocType",
+            or_filters={"issingle": 1, "is_virtual": 1},
+            pluck="name",
+        )
+    )
+
+    graph = {}
+    for field in fields:
+        owner, target = field.owner, field.options
+        if owner in excluded or target in excluded or owner == target:
+            continue
+        kind = "link" if field.fieldtype == "Link" else "child"
+        edge = {"fieldname": field.fieldname, "kind": kind, "owner": owner}
+        graph.setdefault(owner, []).append({**edge, "from": owner, "to": target})
+        graph.setdefault(target, []).append({**edge, "from": target, "to": owner})
+    return graph
+
+
+def get_link_graph_version():
+    """
+    Versión del grafo; cambia con cada DocType o Custom Field modificado.
+
+    Es un token aleatorio y no un contador: si Redis se vacía, un contador
+    volvería a valores ya usados y los planes de ejecución compilados con
+    un grafo anterior parecerían vigentes.
+    """
+    version = frappe.cache().get_value(LINK_GRAPH_VERSION_KEY)
+    if not version:
+        version = frappe.generate_hash(length=10)
+        frappe.cache().set_value(LINK_GRAPH_VERSION_KEY, version)
+    return version
+
+
+def get_link_graph():
+    """Grafo de relaciones cacheado en Redis y en memoria del proceso."""
+    site = frappe.local.site
+    version = get_link_graph_version()
+    local = _local_graphs.get(site)
+    if local and local[0] == version:
+        return local[1]
+
+    graph = frappe.cache().get_value(LINK_GRAPH_CACHE_KEY)
+    if graph is None:
+        graph = build_link_graph()
+        frappe.cache().set_value(LINK_GRAPH_CACHE_KEY, graph)
+
+    _local_graphs[site] = (version, graph, {})
+    return graph
+
+
+def get_linked_doctypes(doctype):
+    """Aristas salientes de un DocType (vecinos directos en el grafo)."""
+    return get_link_graph().get(doctype, [])
+
+
+def find_join_path(source, target, max_depth=MAX_PATH_DEPTH):
+    """
+    Camino más corto de aristas entre dos DocTypes (búsqueda en anchura).
+    Los caminos ya calculados se memorizan junto al grafo del proceso.
+
+    Returns:
+        list | None: aristas a recorrer desde `source` hasta `target`
+    """
+    if source == target:
+        return []
+
+    graph = get_link_graph()
+    paths = _local_graphs[frappe.local.site][2]
+    key = (source, target, max_depth)
+    if key in paths:
+        return paths[key]
+
+    path = None
+    visited = {source}
+    pending = deque([(source, [])])
+    while pending:
+        doctype, edges = pending.popleft()
+        if len(edges) >= max_depth:
+            continue
+        for edge in graph.get(doctype, []):
+            if edge["to"] in visited:
+                continue
+            if edge["to"] == target:
+                path = edges + [edge]
+                break
+            visited.add(edge["to"])
+            pending.append((edge["to"], edges + [edge]))
+        if path:
+            break
+
+    paths[key] = path
+    return path
+
+
+def resolve_query_joins(definition):
+    """
+    Completa y valida las rutas de join de una definición del Query Builder.
+    Las rutas enviadas por el cliente solo se aceptan si cada arista existe
+    en el grafo; las que faltan se calculan con find_join_path.
+    """
+    base = definition.get("doctype")
+    resolved = []
+    for join in definition.get("joins") or []:
+        target = join.get("doctype")
+        path = join.get("path")
+        if path:
+            for edge in path:
+                known = get_linked_doctypes(edge.get("from"))
+                if not any(
+                    e["to"] == edge.get("to")
+                    and e["fieldname"] == edge.get("fieldname")
+                    and e["owner"] == edge.get("owner")
+                    for e in known
+                ):
+                    frappe.throw(
+                        f"Relación no válida: {edge.get('from')} → {edge.get('to')}"
+                    )
+        else:
+            path = find_join_path(base, target)
+            if path is None:
+                frappe.throw(f"No existe relación entre {base} y {target}")
+        resolved.append({"doctype": target, "path": path})
+    return {**definition, "joins": resolved}
+
+
+def clear_link_graph_cache(doc=None, method=None):
+    """Invalida el grafo cuando cambia un DocType o un Custom Field."""
+    frappe.cache().delete_value(LINK_GRAPH_CACHE_KEY)
+    frappe.cache().set_value(LINK_GRAPH_VERSION_KEY, frappe.generate_hash(length=10))
@@ -0,0 +1,194 @@
+# daltek/services/metrics.py
+
+import threading
+import time
+
+import frappe
+
+from daltek.daltek.domain.metrics import MetricsBuffer, render_exposition, series_key
+from daltek.daltek.services.admission import get_admission_metrics
+
+METRICS_CACHE_KEY = "daltek_metrics"
+DALTEK_METHOD_PREFIX = "/api/method/daltek."
+# Endpoints con serie propia; cualquier otra ruta (métodos inexistentes,
+# p. ej.) va a method="other" para no crear series sin límite
+DALTEK_ENDPOINTS = frozenset(
+    (
+        "execute_query_builder_sql",
+        "preview_query_builder_sql",
+        "get_background_query_result",
+        "prepare_query_export",
+        "download_query_export",
+        "get_doctype_fields",
+        "get_doctype_links",
+        "get_join_path",
+        "build_query_sql",
+        "get_query_builder_html",
+        "get_drag_drop_html",
+        "save_query",
+        "get_saved_queries",
+        "delete_query",
+        "get_widgets_data",
+        "get_public_dashboard_snapshot",
+        "get_crossfilter_data",
+        "get_admission_stats",
+        "get_metrics",
+    )
+)
+DALTEK_ENDPOINT_MODULE = "daltek.daltek.doctype.daltek.daltek"
+QUEUES = ("short", "default", "long")
+
+# Un buffer por hilo: registrar una métrica no toma locks ni toca Redis;
+# lo acumulado se suma al agregado compartido al terminar cada petición o
+# trabajo en segundo plano.
+_local = threading.local()
+
+
+def get_buffer():
+    if not hasattr(_local, "buffer"):
+        _local.buffer = MetricsBuffer()
+    return _local.buffer
+
+
+def inc(name, amount=1, **labels):
+    get_buffer().inc(name, amount, **labels)
+
+
+def observe(name, value, **labels):
+    get_buffer().observe(name, value, **labels)
+
+
+def count_cache(cache, hit):
+    inc("daltek_cache_requests_total", cache=cache, result="hit" if hit else "miss")
+
+
+def flush():
+    """Suma lo acumulado por este hilo al hash compartido de Redis."""
+    values = get_buffer().drain()
+    if not values:
+        return
+    try:
+        cache = frappe.cache()
+        key = cache.make_key(METRICS_CACHE_KEY)
+        pipeline = cache.pipeline(transaction=False)
+        for series, value in values.items():
+            pipeline.hincrbyfloat(key, series, value)
+        pipeline.execute()
+    except Exception as e:
+        frappe.logger("daltek").warning(f"No se pudieron publicar métricas: {e}")
+
+
+def before_request():
+    frappe.local.daltek_request_started = time.perf_counter()
+
+
+def endpoint_label(path):
+    """Etiqueta `method` de una ruta /api/method/daltek.*"""
+    module, _, method = path[len("/api/method/") :].rpartition(".")
+    if module == DALTEK_ENDPOINT_MODULE and method in DALTEK_ENDPOINTS:
+        return method
+    return "other"
+
+
+def after_request(response=None, request=None):
+    """Hook after_request: duración y tamaño de los endpoints de Daltek."""
+    request = request or getattr(frappe.local, "request", None)
+    started = getattr(frappe.local, "daltek_request_started", None)
+    if request is not None and started is not None:
+        path = request.path or ""
+        if path.startswith(DALTEK_METHOD_PREFIX):
+            method = endpoint_label(path)
+            observe(
+                "daltek_request_duration_seconds",
+                time.perf_counter() - started,
+                method=method,
+            )
+            # Las respuestas en streaming (exportaciones) no tienen tamaño
+            if response is not None and not response.is_streamed:
+                observe(
+                    "daltek_response_bytes",
+                    response.calculate_content_length() or 0,
+                    method=method,
+                )
+    flush()
+
+
+def before_job(method=None, **kwargs):
+    if str(method or "").startswith("daltek."):
+        inc(
+            "daltek_background_jobs_total",
+            job=method.rsplit(".", 1)[-1],
+            status="started",
+        )
+
+
+def after_job(method=None, **kwargs):
+    if str(method or "").startswith("daltek."):
+        inc(
+            "daltek_background_jobs_total",
+            job=method.rsplit(".", 1)[-1],
+            status="finished",
+        )
+    flush()
+
+
+def get_queue_gauges():
+    """Trabajos encolados y en ejecución por cola (leídos de RQ en Redis)."""
+    from frappe.utils.background_jobs import get_queue
+
+    queued = []
+    running = []
+    for queue_type in QUEUES:
+        try:
+            queue = get_queue(queue_type)
+        except Exception:
+            continue
+        labels = {"queue": queue_type}
+        queued.append((labels, queue.count))
+        running.append((labels, queue.started_job_registry.count))
+    return queued, running
+
+
+def collect_metrics():
+    """Exposición de Prometheus a partir de Redis, sin consultar la base de datos."""
+    flush()
+    cache = frappe.cache()
+    # HGETALL directo: los valores no están serializados con pickle
+    raw = cache.execute_command("HGETALL", cache.make_key(METRICS_CACHE_KEY)) or {}
+    values = {
+        (key.decode() if isinstance(key, bytes) else key): float(value)
+        for key, value in raw.items()
+    }
+
+    queued, running = get_queue_gauges()
+    admission = get_admission_metrics()
+    gauges = {
+        "daltek_background_jobs_queued": ("Trabajos encolados por cola", queued),
+        "daltek_background_jobs_running": ("Trabajos en ejecución por cola", running),
+        "daltek_admission_queue_depth": (
+            "Peticiones esperando turno en el control de admisión",
+            [({}, admission["queue_depth"])],
+        ),
+        "daltek_admission_active_queries": (
+            "Consultas analíticas en curso en todos los workers",
+            [({}, admission["active_queries"])],
+        ),
+    }
+    values.update(admission_series(admission["counters"]))
+    return render_exposition(values, gauges)
+
+
+def admission_series(counters):
+    """Contadores del control de admisión como series de Prometheus."""
+    values = {}
+    for key, value in counters.items():
+        if key == "wait_seconds":
+            values[series_key("daltek_admission_wait_seconds_total", {})] = value
+        elif key.startswith("rejected:"):
+            endpoint = key.split(":", 1)[1]
+            values[
+                series_key("daltek_admission_rejections_total", {"endpoint": endpoint})
+            ] = value
+        else:
+            values[series_key("daltek_admission_events_total", {"event": key})] = value
+    return values
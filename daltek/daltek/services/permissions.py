@@ -0,0 +1,204 @@
+# daltek/services/permissions.py
+
+import frappe
+
+from daltek.daltek.domain.query_engine.query_definition import (
+    compile_query_definition,
+    definition_doctypes,
+    quote_identifier,
+    table_name,
+)
+from daltek.daltek.domain.query_engine.query_engine import quote_literal
+from daltek.daltek.services.data_version import doctypes_from_sql
+
+# Un hash por usuario: {doctype: {"read": bool, "condition": str}}
+PERMISSION_CACHE_PREFIX = "daltek_permission_conditions:"
+# Los eventos invalidan la caché; el TTL acota lo que no tiene evento
+# (p. ej. permission_query_conditions que dependen de otros datos)
+PERMISSION_CACHE_TTL = 3600
+TABLE_FIELDTYPES = ("Table", "Table MultiSelect")
+
+
+def permission_cache_key(user):
+    return PERMISSION_CACHE_PREFIX + user
+
+
+def compute_permission_conditions(doctype, user):
+    """
+    Permiso de lectura y condiciones de coincidencia (User Permissions,
+    permisos "solo si es el creador", permission_query_conditions...) de
+    `user` sobre `doctype`, tal como las aplica frappe.get_list.
+    """
+    if user == "Administrator":
+        return {"read": True, "condition": ""}
+
+    # Las tablas hijas se leen a través de su padre
+    if frappe.get_meta(doctype).istable:
+        parents = [parent for parent in get_child_parents(doctype) if parent != doctype]
+        return child_table_permissions(
+            doctype,
+            {parent: get_permission_conditions(parent, user) for parent in parents},
+        )
+
+    if not frappe.has_permission(doctype, "read", user=user):
+        return {"read": False, "condition": ""}
+
+    from frappe.model.db_query import DatabaseQuery
+
+    condition = DatabaseQuery(doctype, user=user).build_match_conditions(
+        as_condition=True
+    )
+    return {"read": True, "condition": condition or ""}
+
+
+def get_child_parents(doctype):
+    """DocTypes que tienen a `doctype` como tabla hija (estándar o personalizada)."""
+    fieldtypes = ("in", TABLE_FIELDTYPES)
+    parents = frappe.get_all(
+        "DocField",
+        filters={"parenttype": "DocType", "fieldtype": fieldtypes, "options": doctype},
+        pluck="parent",
+    )
+    parents += frappe.get_all(
+        "Custom Field",
+        filters={"fieldtype": fieldtypes, "options": doctype},
+        pluck="dt",
+    )
+    return sorted(set(parents))
+
+
+def child_table_permissions(child, parents):
+    """
+    Permiso sobre una tabla hija a partir del de sus padres
+    ({padre: {"read", "condition"}}): una fila se puede leer si se puede
+    leer el documento padre al que pertenece. Sin padres conocidos no se
+    puede leer.
+    """
+    readable = {parent: perm for parent, perm in parents.items() if perm["read"]}
+    if not readable:
+        return {"read": False, "condition": ""}
+    if len(readable) == len(parents) and not any(
+        perm["condition"] for perm in readable.values()
+    ):
+        return {"read": True, "condition": ""}
+
+    table = quote_identifier(table_name(child))
+    clauses = []
+    for parent, perm in sorted(readable.items()):
+        clause = f"{table}.`parenttype` = {quote_literal(parent)}"
+        if perm["condition"]:
+            clause += (
+                f" AND {table}.`parent` IN (SELECT `name` FROM "
+                f"{quote_identifier(table_name(parent))} WHERE {perm['condition']})"
+            )
+        clauses.append(f"({clause})")
+    return {"read": True, "condition": f"({' OR '.join(clauses)})"}
+
+
+def get_permission_conditions(doctype, user=None):
+    """
+    Condiciones de `user` sobre `doctype`, cacheadas por (usuario, doctype).
+
+    Calcularlas cuesta varias consultas; con la caché cuestan una lectura
+    de Redis, o ninguna si ya se leyeron en la misma petición.
+    """
+    user = user or frappe.session.user
+    cache = frappe.cache()
+    name = permission_cache_key(user)
+    permissions = cache.hget(name, doctype)
+    if permissions is None:
+        permissions = compute_permission_conditions(doctype, user)
+        cache.hset(name, doctype, permissions)
+        # El TTL corre desde la primera entrada del hash del usuario
+        key = cache.make_key(name)
+        if cache.ttl(key) < 0:
+            cache.expire(key, PERMISSION_CACHE_TTL)
+    return permissions
+
+
+def alias_condition(doctype, condition):
+    """Reescribe `tabDocType`.campo como `DocType`.campo (alias del plan)."""
+    return condition.replace(
+        f"{quote_identifier(table_name(doctype))}.", f"{quote_identifier(doctype)}."
+    )
+
+
+def get_row_conditions(doctypes, user=None):
+    """
+    {doctype: condición sobre su alias} para los DocTypes de una consulta.
+
+    Raises:
+        frappe.PermissionError: si el usuario no puede leer alguno
+    """
+    row_conditions = {}
+    for doctype in doctypes:
+        permissions = get_permission_conditions(doctype, user)
+        if not permissions["read"]:
+            frappe.throw(
+                f"No tienes permiso para leer {doctype}", frappe.PermissionError
+            )
+        if permissions["condition"]:
+            row_conditions[doctype] = alias_condition(doctype, permissions["condition"])
+    return row_conditions
+
+
+def compile_secure_definition(definition, user=None):
+    """compile_query_definition con los permisos del usuario aplicados."""
+    return compile_query_definition(
+        definition,
+        row_conditions=get_row_conditions(definition_doctypes(definition), user),
+    )
+
+
+def check_sql_permissions(sql, user=None):
+    """
+    Valida SQL escrito a mano: solo puede leer DocTypes que el usuario
+    puede leer y que no tienen restricciones por fila, porque en SQL libre
+    no hay dónde inyectarlas de forma segura. Las tablas que no son de un
+    DocType (p. ej. `tabSessions`) se rechazan al no encontrar su meta.
+    """
+    for doctype in doctypes_from_sql(sql):
+        permissions = get_permission_conditions(doctype, user)
+        if not permissions["read"]:
+            frappe.throw(
+                f"No tienes permiso para leer {doctype}", frappe.PermissionError
+            )
+        if permissions["condition"]:
+            frappe.throw(
+                f"Tus permisos sobre {doctype} están restringidos por registro; "
+                "construye la consulta con el Query Builder",
+                frappe.PermissionError,
+            )
+
+
+def clear_user_permission_cache(user):
+    frappe.cache().delete_value(permission_cache_key(user))
+
+
+def clear_permission_cache(doc=None, method=None):
+    """Cambió la definición de roles o permisos: invalida a todos los usuarios."""
+    frappe.cache().delete_keys(PERMISSION_CACHE_PREFIX)
+
+
+def on_user_update(doc, method=None):
+    """doc_event de User: sus roles pudieron cambiar."""
+    clear_user_permission_cache(doc.name)
+
+
+def on_docshare_change(doc, method=None):
+    """doc_event de DocShare: los documentos compartidos entran en las condiciones."""
+    if doc.everyone or not doc.user:
+        clear_permission_cache()
+        return
+    clear_user_permission_cache(doc.user)
+    previous = doc.get_doc_before_save()
+    if previous and previous.user and previous.user != doc.user:
+        clear_user_permission_cache(previous.user)
+
+
+def on_user_permission_change(doc, method=None):
+    """doc_event de User Permission (on_update y on_trash)."""
+    clear_user_permission_cache(doc.user)
+    previous = doc.get_doc_before_save()
+    if previous and previous.user != doc.user:
+        clear_user_permission_cache(previous.user)
@@ -0,0 +1,189 @@
+# daltek/services/preview.py
+
+import hashlib
+import time
+
+import frappe
+
+from daltek.daltek.services import metrics
+from daltek.daltek.services.query_guard import prepare_select_sql
+
+PREVIEW_CACHE_PREFIX = "daltek_preview:"
+
+# Errores de MariaDB al interrumpir una sentencia: KILL QUERY y
+# max_statement_time
+QUERY_INTERRUPTED = 1317
+STATEMENT_TIMEOUT = 1969
+
+# Registra la vista previa `seq` como la última de la sesión, salvo que ya
+# haya una más nueva. Devuelve {registrada, registro anterior}.
+CLAIM_SCRIPT = """
+local previous = redis.call('GET', KEYS[1])
+if previous then
+    local seq = tonumber(string.match(previous, '^(%d+):'))
+    if seq and seq > tonumber(ARGV[1]) then
+        return {0, previous}
+    end
+end
+redis.call('SET', KEYS[1], ARGV[1] .. ':' .. ARGV[2], 'EX', ARGV[3])
+return {1, previous or ''}
+"""
+
+# Borra el registro solo si sigue siendo el de esta vista previa
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def get_preview_settings():
+    """
+    daltek_preview_limit: filas de la vista previa del Query Builder
+    daltek_preview_timeout: segundos máximos de la consulta de vista previa
+        (max_statement_time); hace de presupuesto en lugar de EXPLAIN
+    """
+    conf = frappe.conf
+    return frappe._dict(
+        limit=int(conf.get("daltek_preview_limit") or 20),
+        timeout=float(conf.get("daltek_preview_timeout") or 5),
+    )
+
+
+def session_hash(session_key):
+    """Identifica la sesión del Query Builder sin exponer el usuario en el SQL"""
+    raw = f"{frappe.local.site}:{frappe.session.user}:{session_key}"
+    return hashlib.sha1(raw.encode()).hexdigest()[:12]
+
+
+def preview_tag(session, seq):
+    return f"daltek-preview:{session}:{int(seq)}"
+
+
+def tag_sql(sql_query, tag):
+    """Marca la consulta con un comentario visible en PROCESSLIST"""
+    return f"SELECT /* {tag} */ {sql_query[len('SELECT'):].lstrip()}"
+
+
+def error_code(error):
+    """Código de error de MariaDB, también si Frappe envolvió la excepción"""
+    while error is not None:
+        code = error.args[0] if error.args else None
+        if isinstance(code, int):
+            return code
+        error = code if isinstance(code, BaseException) else error.__cause__
+    return None
+
+
+def cancel_preview(session, entry, own_connection):
+    """
+    Interrumpe la consulta de una vista previa anterior de la misma sesión
+    si todavía se está ejecutando. Antes de KILL QUERY se comprueba en
+    PROCESSLIST que la conexión sigue con esa consulta, para no cortar otra
+    petición que haya reutilizado la conexión.
+    """
+    seq, connection_id = entry.split(":", 1)
+    connection_id = int(connection_id)
+    if connection_id == own_connection:
+        return False
+
+    running = frappe.db.sql(
+        """SELECT ID FROM information_schema.PROCESSLIST
+        WHERE ID = %s AND INFO LIKE %s""",
+        (connection_id, f"%{preview_tag(session, seq)}%"),
+    )
+    if not running:
+        return False
+    try:
+        frappe.db.sql(f"KILL QUERY {connection_id}")
+    except Exception as e:
+        # La consulta pudo terminar entre la comprobación y el KILL
+        frappe.logger("daltek").warning(f"No se pudo cancelar la vista previa: {e}")
+        return False
+    metrics.inc("daltek_preview_cancellations_total")
+    return True
+
+
+def is_current_preview(cache, key, entry):
+    """True si `entry` ("seq:connection_id") sigue siendo la última vista previa"""
+    current = cache.execute_command("GET", key)
+    if isinstance(current, bytes):
+        current = current.decode()
+    return current == entry
+
+
+def run_preview(sql_query, session_key, seq):
+    """
+    Ejecuta la vista previa `seq` de una sesión del Query Builder con
+    tiempo acotado. El LIMIT de la vista previa lo emite el motor al
+    compilar la definición (ver get_preview_settings). Una vista previa más
+    nueva de la misma sesión cancela en el servidor la que siga en curso,
+    así que solo la última consume tiempo de base de datos.
+
+    Returns:
+        dict: {"data", "count", "sql"} o {"superseded": True}
+    """
+    settings = get_preview_settings()
+    seq = int(seq)
+    session = session_hash(session_key)
+    cache = frappe.cache()
+    key = cache.make_key(PREVIEW_CACHE_PREFIX + session)
+
+    sql_query = prepare_select_sql(sql_query)
+    connection_id = int(frappe.db.sql("SELECT CONNECTION_ID()")[0][0])
+
+    claimed, previous = cache.eval(
+        CLAIM_SCRIPT,
+        1,
+        key,
+        seq,
+        connection_id,
+        int(settings.timeout) + 60,
+    )
+    if isinstance(previous, bytes):
+        previous = previous.decode()
+    if not int(claimed):
+        metrics.inc("daltek_preview_requests_total", result="superseded")
+        return {"superseded": True, "sql": sql_query}
+    if previous:
+        cancel_preview(session, previous, connection_id)
+
+    # Una vista previa más nueva pudo registrarse mientras se cancelaba la
+    # anterior; si aún no empezó esta consulta, no la encontraría para
+    # cancelarla
+    entry = f"{seq}:{connection_id}"
+    if not is_current_preview(cache, key, entry):
+        metrics.inc("daltek_preview_requests_total", result="superseded")
+        return {"superseded": True, "sql": sql_query}
+
+    timeout = max(settings.timeout, 0.001)
+    statement = tag_sql(sql_query, preview_tag(session, seq))
+    started = time.perf_counter()
+    try:
+        results = frappe.db.sql(
+            f"SET STATEMENT max_statement_time={timeout:g} FOR {statement}",
+            as_dict=True,
+        )
+    except Exception as e:
+        code = error_code(e)
+        if code == QUERY_INTERRUPTED:
+            metrics.inc("daltek_preview_requests_total", result="superseded")
+            return {"superseded": True, "sql": sql_query}
+        if code == STATEMENT_TIMEOUT:
+            metrics.inc("daltek_preview_requests_total", result="timeout")
+            frappe.throw(
+                f"La vista previa superó {timeout:g} s; "
+                "ejecuta la consulta completa para ver los resultados"
+            )
+        raise
+    finally:
+        cache.eval(RELEASE_SCRIPT, 1, key, entry)
+
+    metrics.inc("daltek_preview_requests_total", result="completed")
+    metrics.observe(
+        "daltek_query_duration_seconds",
+        time.perf_counter() - started,
+        node="preview",
+    )
+    return {"data": results, "count": len(results), "sql": sql_query}
@@ -0,0 +1,181 @@
+# daltek/services/query_guard.py
+
+import frappe
+
+from daltek.daltek.domain.cost_guard import CostGuard
+from daltek.daltek.domain.query_engine.sql_analysis import fingerprint_sql
+from daltek.daltek.services.replica import run_read_query
+
+DANGEROUS_KEYWORDS = [
+    "DELETE",
+    "INSERT",
+    "UPDATE",
+    "DROP",
+    "CREATE",
+    "ALTER",
+    "TRUNCATE",
+]
+
+COST_CACHE_PREFIX = "daltek_query_cost:"
+RESULT_CACHE_PREFIX = "daltek_query_result:"
+RESULT_TTL = 60 * 60
+
+
+def prepare_select_sql(sql_query, limit=None):
+    """
+    Valida que la consulta sea un SELECT seguro y la normaliza.
+    Si se indica `limit` y la consulta no tiene LIMIT, se agrega.
+    """
+    # Validaciones de seguridad
+    if not sql_query or not sql_query.strip():
+        frappe.throw("La consulta SQL no puede estar vacía")
+
+    # Limpiar y normalizar la consulta
+    sql_query = sql_query.strip()
+    if sql_query.endswith(";"):
+        sql_query = sql_query[:-1]
+
+    # Validar que sea solo una consulta SELECT
+    sql_upper = sql_query.upper().strip()
+    if not sql_upper.startswith("SELECT"):
+        frappe.throw("Solo se permiten consultas SELECT")
+
+    # Evitar consultas peligrosas
+    for keyword in DANGEROUS_KEYWORDS:
+        if keyword in sql_upper:
+            frappe.throw(f"Palabra clave no permitida: {keyword}")
+
+    # Agregar límite si no existe
+    if limit is not None and "LIMIT" not in sql_upper:
+        sql_query += f" LIMIT {int(limit)}"
+
+    return sql_query
+
+
+def get_cost_guard_settings():
+    """
+    Configuración del guardián de coste desde site_config.json:
+        daltek_query_cost_budget: filas examinadas permitidas en línea
+        daltek_query_cost_action: "queue" (segundo plano) o "reject"
+        daltek_large_table_rows: umbral para marcar full scans/filesort
+        daltek_query_cost_ttl: segundos que se cachea cada estimación
+    """
+    conf = frappe.conf
+    return frappe._dict(
+        enabled=bool(conf.get("daltek_query_cost_guard", 1)),
+        budget=int(conf.get("daltek_query_cost_budget") or 1000000),
+        action=conf.get("daltek_query_cost_action") or "queue",
+        large_table_rows=int(conf.get("daltek_large_table_rows") or 10000),
+        ttl=int(conf.get("daltek_query_cost_ttl") or 600),
+    )
+
+
+def estimate_query_cost(sql_query, settings=None):
+    """
+    Estima el coste de una consulta con EXPLAIN. La estimación se cachea
+    por huella SQL, así que las ejecuciones repetidas solo leen Redis.
+
+    Returns:
+        dict | None: estimación con "over_budget", o None si EXPLAIN falla
+    """
+    settings = settings or get_cost_guard_settings()
+    cache_key = COST_CACHE_PREFIX + fingerprint_sql(sql_query)
+
+    cached = frappe.cache().get_value(cache_key)
+    if cached:
+        return {**cached, "cached": True}
+
+    try:
+        plan = frappe.db.sql(f"EXPLAIN {sql_query}", as_dict=True)
+    except Exception as e:
+        frappe.logger("daltek").warning(f"EXPLAIN falló: {e}")
+        return None
+
+    guard = CostGuard(settings.budget, settings.large_table_rows)
+    estimate = guard.estimate(plan)
+    result = {
+        **estimate.to_dict(),
+        "budget": settings.budget,
+        "over_budget": guard.is_over_budget(estimate),
+    }
+    frappe.cache().set_value(cache_key, result, expires_in_sec=settings.ttl)
+    return {**result, "cached": False}
+
+
+def check_query_cost(sql_query):
+    """
+    Paso previo a ejecutar SQL del usuario. Devuelve la estimación y la
+    acción a tomar: "run", "queue" o "reject".
+    """
+    settings = get_cost_guard_settings()
+    if not settings.enabled:
+        return {"action": "run", "estimate": None}
+
+    estimate = estimate_query_cost(sql_query, settings)
+    if not estimate or not estimate["over_budget"]:
+        return {"action": "run", "estimate": estimate}
+
+    action = "reject" if settings.action == "reject" else "queue"
+    return {"action": action, "estimate": estimate}
+
+
+def enqueue_query(sql_query):
+    """Envía la consulta a la cola larga y devuelve el id del trabajo."""
+    job_id = frappe.generate_hash(length=12)
+    frappe.enqueue(
+        "daltek.daltek.services.query_guard.run_query_job",
+        queue="long",
+        job_id=f"daltek_query_{job_id}",
+        sql_query=sql_query,
+        result_id=job_id,
+        owner=frappe.session.user,
+    )
+    return job_id
+
+
+def run_query_job(sql_query, result_id, owner):
+    """Ejecuta una consulta encolada y publica el resultado al usuario."""
+    try:
+        results, node = run_read_query(sql_query)
+        payload = {
+            "success": True,
+            "data": results,
+            "count": len(results),
+            "sql": sql_query,
+            "node": node,
+            "message": f"Consulta ejecutada exitosamente. {len(results)} filas retornadas.",
+        }
+    except Exception as e:
+        frappe.log_error(
+            f"Error ejecutando consulta en segundo plano: {str(e)}",
+            "QueryBuilder Error",
+        )
+        payload = {
+            "success": False,
+            "error": str(e),
+            "sql": sql_query,
+            "message": "Error ejecutando la consulta SQL",
+        }
+
+    frappe.cache().set_value(
+        RESULT_CACHE_PREFIX + result_id,
+        {"owner": owner, "result": payload},
+        expires_in_sec=RESULT_TTL,
+    )
+    frappe.publish_realtime(
+        "daltek_query_result",
+        {"job_id": result_id, "success": payload["success"]},
+        user=owner,
+    )
+
+
+def get_queued_result(result_id):
+    """Devuelve el resultado de un trabajo encolado, o None si aún no termina."""
+    stored = frappe.cache().get_value(RESULT_CACHE_PREFIX + result_id)
+    if not stored:
+        return None
+    if stored["owner"] != frappe.session.user:
+        frappe.throw(
+            "No tienes permiso para ver este resultado", frappe.PermissionError
+        )
+    return stored["result"]
@@ -0,0 +1,248 @@
+# daltek/services/replica.py
+
+import queue
+import threading
+import time
+
+import frappe
+
+from daltek.daltek.services import metrics
+
+
+class ReplicaRouter:
+    """
+    Enruta consultas de solo lectura a una réplica desde un pool pequeño
+    de conexiones, con retorno al primario si la réplica se retrasa o falla.
+
+    `connection_factory` debe devolver un objeto con `sql(query, values, as_dict=...)`
+    y `close()` (p. ej. `frappe.database.get_db(...)` o un sustituto en tests).
+    """
+
+    def __init__(
+        self,
+        connection_factory,
+        host=None,
+        pool_size=2,
+        max_lag=30,
+        lag_check_interval=5,
+        retry_after=30,
+        clock=time.monotonic,
+    ):
+        self.connection_factory = connection_factory
+        self.host = host
+        self.pool_size = int(pool_size)
+        self.max_lag = float(max_lag)
+        self.lag_check_interval = float(lag_check_interval)
+        self.retry_after = float(retry_after)
+        self.clock = clock
+
+        self._pool = queue.LifoQueue(maxsize=self.pool_size)
+        self._created = 0
+        self._lock = threading.Lock()
+        self._lag = None
+        self._lag_checked_at = None
+        self._unhealthy_until = 0.0
+
+    def _acquire(self, timeout=2):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.pool_size:
+                self._created += 1
+                try:
+                    return self.connection_factory()
+                except Exception:
+                    self._created -= 1
+                    raise
+
+        return self._pool.get(timeout=timeout)
+
+    def _release(self, connection):
+        # Sin autocommit, el primer SELECT abre una transacción REPEATABLE
+        # READ: sin rollback, los siguientes usos de la conexión seguirían
+        # leyendo esa instantánea aunque la réplica esté al día. Se usa SQL
+        # y no Database.rollback(), que además descarta el estado global de
+        # la petición (observadores, realtime, trabajos tras el commit)
+        try:
+            connection.sql("ROLLBACK")
+        except Exception:
+            self._discard(connection)
+            return
+        try:
+            self._pool.put_nowait(connection)
+        except queue.Full:
+            self._discard(connection)
+
+    def _discard(self, connection):
+        with self._lock:
+            self._created -= 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def replication_lag(self, connection):
+        """
+        Segundos de retraso de la réplica (cacheado `lag_check_interval`).
+        None si la replicación está detenida.
+        """
+        now = self.clock()
+        if (
+            self._lag_checked_at is not None
+            and now - self._lag_checked_at < self.lag_check_interval
+        ):
+            return self._lag
+
+        status = connection.sql("SHOW SLAVE STATUS", as_dict=True)
+        if not status:
+            # No es una réplica configurada: se asume sincronizada
+            lag = 0.0
+        else:
+            seconds = status[0].get("Seconds_Behind_Master")
+            lag = float(seconds) if seconds is not None else None
+
+        self._lag = lag
+        self._lag_checked_at = now
+        return lag
+
+    def run(self, sql, primary, values=(), as_dict=True):
+        """
+        Ejecuta `sql` en la réplica si está sana y al día; si no, en `primary`.
+
+        Returns:
+            tuple: (filas, metadatos del nodo que respondió)
+        """
+        if self.clock() < self._unhealthy_until:
+            return self._run_on_primary(
+                sql, primary, values, as_dict, "replica_unhealthy"
+            )
+
+        try:
+            connection = self._acquire()
+        except Exception as e:
+            self._mark_unhealthy(e)
+            return self._run_on_primary(
+                sql, primary, values, as_dict, "replica_unavailable"
+            )
+
+        try:
+            lag = self.replication_lag(connection)
+            if lag is None or lag > self.max_lag:
+                self._release(connection)
+                return self._run_on_primary(
+                    sql, primary, values, as_dict, "replica_lag", lag=lag
+                )
+
+            rows = connection.sql(sql, values, as_dict=as_dict)
+        except Exception as e:
+            self._discard(connection)
+            self._mark_unhealthy(e)
+            return self._run_on_primary(sql, primary, values, as_dict, "replica_error")
+
+        self._release(connection)
+        return rows, {
+            "node": "replica",
+            "host": self.host,
+            "lag": lag,
+            # Retraso máximo posible de estas filas: el medido puede tener
+            # hasta `lag_check_interval` segundos
+            "max_staleness": self.max_lag + self.lag_check_interval,
+        }
+
+    def _mark_unhealthy(self, error):
+        self._unhealthy_until = self.clock() + self.retry_after
+        self._lag_checked_at = None
+        frappe.logger("daltek").warning(f"Réplica no disponible: {error}")
+
+    @staticmethod
+    def _run_on_primary(sql, primary, values, as_dict, reason, lag=None):
+        rows = primary.sql(sql, values, as_dict=as_dict)
+        return rows, {"node": "primary", "reason": reason, "lag": lag}
+
+
+_routers = {}
+_routers_lock = threading.Lock()
+
+
+def get_replica_settings():
+    """
+    Réplica configurada en site_config.json:
+        daltek_replica: {"host", "port", "user", "password"}
+        daltek_replica_pool_size, daltek_replica_max_lag
+    Si no existe `daltek_replica`, se usa `replica_host` de Frappe.
+    """
+    conf = frappe.conf
+    replica = dict(conf.get("daltek_replica") or {})
+    if not replica and conf.get("replica_host"):
+        replica = {
+            "host": conf.replica_host,
+            "port": conf.get("replica_db_port"),
+        }
+    if not replica.get("host"):
+        return None
+
+    return frappe._dict(
+        host=replica["host"],
+        port=replica.get("port"),
+        user=replica.get("user") or conf.get("db_user") or conf.db_name,
+        password=replica.get("password") or conf.db_password,
+        pool_size=int(conf.get("daltek_replica_pool_size") or 2),
+        max_lag=float(conf.get("daltek_replica_max_lag") or 30),
+    )
+
+
+def get_router():
+    """Router de la réplica del sitio actual (uno por proceso y sitio)."""
+    site = frappe.local.site
+    if site in _routers:
+        return _routers[site]
+
+    with _routers_lock:
+        if site not in _routers:
+            settings = get_replica_settings()
+            router = None
+            if settings:
+                from frappe.database import get_db
+
+                def connection_factory():
+                    return get_db(
+                        host=settings.host,
+                        port=settings.port,
+                        user=settings.user,
+                        password=settings.password,
+                        cur_db_name=frappe.conf.db_name,
+                    )
+
+                router = ReplicaRouter(
+                    connection_factory,
+                    host=settings.host,
+                    pool_size=settings.pool_size,
+                    max_lag=settings.max_lag,
+                )
+            _routers[site] = router
+    return _routers[site]
+
+
+def run_read_query(sql, values=(), as_dict=True):
+    """
+    Ejecuta una consulta analítica de solo lectura en la réplica cuando es
+    posible. Devuelve (filas, metadatos del nodo que la sirvió).
+    """
+    started = time.perf_counter()
+    router = get_router()
+    if not router:
+        rows = frappe.db.sql(sql, values, as_dict=as_dict)
+        node = {"node": "primary", "reason": "no_replica", "lag": None}
+    else:
+        rows, node = router.run(sql, frappe.db, values, as_dict=as_dict)
+
+    metrics.observe(
+        "daltek_query_duration_seconds",
+        time.perf_counter() - started,
+        node=node["node"],
+    )
+    metrics.observe("daltek_query_rows", len(rows), node=node["node"])
+    return rows, node
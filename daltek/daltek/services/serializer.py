@@ -0,0 +1,77 @@
+# daltek/services/serializer.py
+
+import functools
+
+import frappe
+
+from daltek.daltek.domain.serializer import COMPAT, ResponseEncoder
+
+
+def get_serializer_settings():
+    """
+    daltek_json_mode: "compat" (por defecto, mismos bytes que Frappe) o
+        "fast" (orjson si está instalado)
+    daltek_json_decimal: en modo fast, "float" o "str" (sin pérdida de
+        precisión)
+    daltek_json_dates: en modo fast, "str" (formato de Frappe) o "iso"
+    """
+    conf = frappe.conf
+    return frappe._dict(
+        mode=conf.get("daltek_json_mode") or COMPAT,
+        decimal=conf.get("daltek_json_decimal") or "float",
+        dates=conf.get("daltek_json_dates") or "str",
+    )
+
+
+def get_encoder():
+    from frappe.utils.response import json_handler
+
+    settings = get_serializer_settings()
+    try:
+        return ResponseEncoder(
+            settings.mode, settings.decimal, settings.dates, fallback=json_handler
+        )
+    except ValueError as e:
+        frappe.logger("daltek").warning(f"Serializador de Daltek mal configurado: {e}")
+        return ResponseEncoder(fallback=json_handler)
+
+
+def build_json_response(message):
+    """
+    Arma la respuesta de /api/method igual que
+    frappe.utils.response.as_json, pero con el codificador de Daltek.
+    """
+    from frappe.utils.response import make_logs
+    from werkzeug.wrappers import Response
+
+    response = frappe.local.response
+    response["message"] = message
+    if "docs" in response and not response.docs:
+        del response["docs"]
+    make_logs()
+
+    status_code = response.pop("http_status_code", None)
+    result = Response(get_encoder().dumps(response), mimetype="application/json")
+    if status_code:
+        result.status_code = status_code
+    return result
+
+
+def json_endpoint(fn):
+    """
+    Decorador para endpoints con respuestas grandes. Va debajo de
+    @frappe.whitelist(); solo cambia la serialización cuando el endpoint es
+    el método de la petición HTTP, así que llamado desde Python sigue
+    devolviendo el dict.
+    """
+    method = f"{fn.__module__}.{fn.__name__}"
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        result = fn(*args, **kwargs)
+        request = getattr(frappe.local, "request", None)
+        if request is None or frappe.local.form_dict.get("cmd") != method:
+            return result
+        return build_json_response(result)
+
+    return wrapper
@@ -0,0 +1,210 @@
+# daltek/services/snapshots.py
+
+import hashlib
+
+import frappe
+
+from daltek.daltek.services.data_version import get_data_version
+from daltek.daltek.services.execution_plan import get_execution_plan
+from daltek.daltek.services.widget_data import (
+    load_widgets_data,
+    parse_json_field,
+    render_widget_chart,
+)
+
+SNAPSHOT_CACHE_PREFIX = "daltek_dashboard_snapshot:"
+SNAPSHOT_ROUTE = "dashboards"
+
+# Propiedades del widget que se publican (sin consultas ni campos internos)
+PUBLIC_WIDGET_PROPERTIES = ("title", "color", "number", "chart")
+
+
+def snapshot_cache_key(name):
+    return SNAPSHOT_CACHE_PREFIX + name
+
+
+def get_snapshot(name):
+    """Snapshot publicado del dashboard, o None si aún no existe."""
+    return frappe.cache().get_value(snapshot_cache_key(name))
+
+
+def public_widget_data(widget, data):
+    """
+    Lo que se publica de cada widget: su valor agregado, el número de filas
+    y, si el widget define `properties.chart` ({"type", "x", "y"}), la traza
+    ya renderizada. Las filas crudas no se publican.
+
+    Los pivotes se publican dispersos: como heatmap si `chart.type` es
+    "heatmap" o, si no, como tabla en formato CSR/COO.
+    """
+    if not data.get("success"):
+        return {"success": False}
+
+    published = {"success": True}
+    if "value" in data:
+        published["value"] = data["value"]
+    # Los datos de load_widget_data ya traen la traza del chart
+    chart = data.get("chart") or render_widget_chart(
+        (widget.get("properties") or {}).get("chart"), data
+    )
+    if "pivot" in data:
+        published["count"] = data["count"]
+        if chart:
+            published["chart"] = chart
+        else:
+            published["table"] = data["pivot"]
+    if "rows" in data:
+        published["count"] = data["count"]
+        if chart:
+            published["chart"] = chart
+    return published
+
+
+def build_snapshot(doc, previous=None):
+    """
+    Ejecuta las consultas de todos los widgets y arma el snapshot público
+    (layout + datos). Si se pasa el snapshot anterior, los widgets cuyos
+    datos no cambiaron se reutilizan sin volver a consultar.
+
+    Returns:
+        dict: {"name", "title", "layout", "data", "versions", "hash", "generated_at"}
+    """
+    widgets = parse_json_field(doc.layout, [])
+    previous_versions = (previous or {}).get("versions", {})
+    requests = [
+        {
+            "widget_id": w.get("id"),
+            "priority": "visible",
+            **previous_versions.get(w.get("id"), {}),
+        }
+        for w in widgets
+    ]
+    loaded = load_widgets_data(doc, requests, time_budget=float("inf"))["results"]
+
+    layout = []
+    data = {}
+    versions = {}
+    for widget in widgets:
+        widget_id = widget.get("id")
+        properties = widget.get("properties") or {}
+        layout.append(
+            {
+                "id": widget_id,
+                "type": widget.get("type"),
+                "position": widget.get("position") or {},
+                "properties": {
+                    key: properties[key]
+                    for key in PUBLIC_WIDGET_PROPERTIES
+                    if key in properties
+                },
+            }
+        )
+
+        result = loaded.get(widget_id) or {}
+        if result.get("unchanged"):
+            data[widget_id] = previous["data"].get(widget_id, {"success": False})
+        else:
+            data[widget_id] = public_widget_data(widget, result)
+        if result.get("data_version"):
+            versions[widget_id] = {
+                "fingerprint": result["fingerprint"],
+                "data_version": result["data_version"],
+            }
+
+    content = frappe.as_json({"layout": layout, "data": data}, indent=None)
+    return {
+        "name": doc.name,
+        "title": doc.name1 or doc.name,
+        "layout": layout,
+        "data": data,
+        "versions": versions,
+        "hash": hashlib.sha1(content.encode()).hexdigest()[:12],
+        "generated_at": frappe.utils.now(),
+    }
+
+
+def regenerate_snapshot(name, force=False):
+    """
+    Regenera y publica el snapshot de un dashboard público. Devuelve True
+    si el contenido cambió.
+
+    Sin `force`, si ningún DocType del plan de ejecución cambió desde el
+    snapshot anterior no se vuelve a cargar ningún widget.
+
+    Los widgets se cargan siempre como el dueño del dashboard (`owner`),
+    con sus permisos y condiciones de fila: el snapshot publica lo que
+    puede ver el dueño, sin importar quién guardó el dashboard o si lo
+    regeneró la tarea programada.
+    """
+    doc = frappe.get_doc("Daltek", name)
+    if not doc.is_public:
+        delete_snapshot(name)
+        return False
+
+    previous = None if force else get_snapshot(name)
+    data_version = get_data_version(get_execution_plan(doc)["doctypes"])
+    if previous and previous.get("data_version") == data_version:
+        return False
+
+    user = frappe.session.user
+    frappe.set_user(doc.owner)
+    try:
+        snapshot = build_snapshot(doc, previous)
+    finally:
+        frappe.set_user(user)
+    snapshot["data_version"] = data_version
+    frappe.cache().set_value(snapshot_cache_key(name), snapshot)
+
+    changed = not previous or previous["hash"] != snapshot["hash"]
+    if changed:
+        clear_snapshot_page_cache(name)
+    return changed
+
+
+def delete_snapshot(name):
+    frappe.cache().delete_value(snapshot_cache_key(name))
+    clear_snapshot_page_cache(name)
+
+
+def clear_snapshot_page_cache(name):
+    """La página se cachea como HTML del sitio; se invalida al cambiar el hash."""
+    from frappe.website.utils import clear_cache
+
+    clear_cache(f"{SNAPSHOT_ROUTE}/{name}")
+
+
+def on_dashboard_update(doc, method=None):
+    """doc_event de Daltek: el layout o las consultas pudieron cambiar."""
+    if not doc.is_public:
+        if doc.has_value_changed("is_public"):
+            delete_snapshot(doc.name)
+        return
+    frappe.enqueue(
+        "daltek.daltek.services.snapshots.regenerate_snapshot",
+        queue="short",
+        job_id=f"daltek_snapshot_{doc.name}",
+        deduplicate=True,
+        enqueue_after_commit=True,
+        name=doc.name,
+        force=True,
+    )
+
+
+def on_dashboard_trash(doc, method=None):
+    delete_snapshot(doc.name)
+
+
+def refresh_public_snapshots():
+    """
+    Tarea programada: regenera los snapshots de los dashboards públicos.
+    Los dashboards y widgets cuyos DocTypes no cambiaron no se vuelven a
+    consultar.
+    """
+    for name in frappe.get_all("Daltek", filters={"is_public": 1}, pluck="name"):
+        try:
+            regenerate_snapshot(name)
+        except Exception as e:
+            frappe.log_error(
+                f"Error regenerando el snapshot de {name}: {str(e)}",
+                "Dashboard Snapshot Error",
+            )
@@ -0,0 +1,209 @@
+# daltek/services/warmup.py
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import frappe
+
+from daltek.daltek.domain.plotly_data_manager import PlotlyDataManager
+from daltek.daltek.services import metrics
+from daltek.daltek.services.execution_plan import get_execution_plan
+from daltek.daltek.services.widget_data import load_plan_dataset
+
+WARMUP_REPORT_CACHE_KEY = "daltek_warmup_report"
+
+
+def get_warmup_settings():
+    """
+    Configuración del precalentamiento desde site_config.json:
+        daltek_warmup_dashboards: dashboards más vistos que se precalientan
+        daltek_warmup_days: días de View Log considerados
+        daltek_warmup_workers: consultas simultáneas como máximo
+    """
+    conf = frappe.conf
+    return frappe._dict(
+        dashboards=int(conf.get("daltek_warmup_dashboards") or 10),
+        days=int(conf.get("daltek_warmup_days") or 14),
+        workers=max(1, int(conf.get("daltek_warmup_workers") or 4)),
+    )
+
+
+def get_hot_dashboards(limit, days):
+    """Dashboards Daltek más abiertos en los últimos `days` días (View Log)."""
+    since = frappe.utils.add_days(frappe.utils.now_datetime(), -days)
+    views = frappe.get_all(
+        "View Log",
+        filters={"reference_doctype": "Daltek", "creation": (">=", since)},
+        fields=["reference_name", "count(name) as views"],
+        group_by="reference_name",
+        order_by="views desc",
+        limit=limit,
+    )
+    existing = set(
+        frappe.get_all(
+            "Daltek",
+            filters={"name": ("in", [v.reference_name for v in views])},
+            pluck="name",
+        )
+    )
+    return [v.reference_name for v in views if v.reference_name in existing]
+
+
+def collect_warmup_tasks(doc, seen=None):
+    """
+    Datasets del plan de ejecución del dashboard, uno por cada combinación
+    distinta de consulta y propiedades de datos. `seen` (claves de dataset
+    ya recogidas) evita repetir el mismo SQL entre dashboards.
+
+    Returns:
+        list: [{"dashboard", "widgets", "dataset", "plan"}, ...]
+    """
+    seen = set() if seen is None else seen
+    plan = get_execution_plan(doc)
+    tasks = {}
+    for widget_id, widget in plan["widgets"].items():
+        key = widget.get("dataset")
+        if not key or plan["datasets"][key].get("error"):
+            continue
+        if key not in tasks:
+            if key in seen:
+                continue
+            seen.add(key)
+            tasks[key] = {
+                "dashboard": doc.name,
+                "widgets": [],
+                "dataset": key,
+                "plan": plan,
+            }
+        tasks[key]["widgets"].append(widget_id)
+    return list(tasks.values())
+
+
+def run_tasks(tasks):
+    """
+    Carga cada dataset con los mismos loaders que los endpoints (filas,
+    agregados, pipelines y pivotes), así quedan en caché las mismas claves
+    que leerán los usuarios.
+
+    Returns:
+        dict: {"warmed", "cached", "failed"}
+    """
+    counts = {"warmed": 0, "cached": 0, "failed": 0}
+    manager = PlotlyDataManager()
+    for task in tasks:
+        try:
+            result = load_plan_dataset(
+                task["plan"], task["widgets"][0], task["dataset"], manager=manager
+            )
+            if not result.get("success"):
+                raise ValueError(result.get("error"))
+        except Exception as e:
+            counts["failed"] += 1
+            frappe.logger("daltek").warning(
+                f"Precalentamiento: dataset {task['dataset']} de "
+                f"{task['dashboard']} falló: {e}"
+            )
+            continue
+        counts["cached" if result.get("node") == "cache" else "warmed"] += 1
+    return counts
+
+
+def warm_tasks(site, user, tasks):
+    """
+    Ejecuta en un hilo propio (con su propia conexión) los datasets de
+    `tasks` y los deja en la caché de resultados.
+
+    Returns:
+        dict: {"warmed", "cached", "failed"}
+    """
+    frappe.init(site=site)
+    try:
+        frappe.connect()
+        frappe.set_user(user)
+        return run_tasks(tasks)
+    finally:
+        # Las métricas se acumulan por hilo: se publican antes de cerrarlo
+        metrics.flush()
+        frappe.destroy()
+
+
+def warm_up_dashboards(limit=None, days=None, workers=None):
+    """
+    Ejecuta por adelantado las consultas de los dashboards más vistos para
+    que los primeros usuarios no paguen la caché fría.
+
+    Las consultas se reparten entre a lo sumo `workers` hilos, cada uno con
+    una conexión propia, para no saturar la base de datos.
+
+    Se ejecuta con el usuario del proceso (Administrator en la tarea
+    programada y en bench), que no tiene condiciones de fila: solo quedan
+    en caché los resultados de los usuarios sin restricciones por permisos
+    de usuario sobre esos DocTypes; el resto ve otro SQL y otra clave.
+
+    Returns:
+        dict: reporte con tiempo, dashboards, widgets, datasets y cobertura
+    """
+    settings = get_warmup_settings()
+    limit = int(limit or settings.dashboards)
+    days = int(days or settings.days)
+    workers = max(1, int(workers or settings.workers))
+
+    started = time.monotonic()
+    dashboards = get_hot_dashboards(limit, days)
+
+    tasks = []
+    seen = set()
+    for name in dashboards:
+        try:
+            tasks.extend(collect_warmup_tasks(frappe.get_doc("Daltek", name), seen))
+        except Exception as e:
+            frappe.logger("daltek").warning(f"Precalentamiento: {name}: {e}")
+
+    totals = {"warmed": 0, "cached": 0, "failed": 0}
+    if tasks:
+        workers = min(workers, len(tasks))
+        # Reparto round-robin: las consultas del mismo dashboard quedan en
+        # hilos distintos y los dashboards avanzan a la par
+        batches = [tasks[i::workers] for i in range(workers)]
+        # Los hilos abren sus propias conexiones: lo pendiente debe estar
+        # confirmado antes de que lo lean
+        frappe.db.commit()
+        site, user = frappe.local.site, frappe.session.user
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for counts in pool.map(
+                lambda batch: warm_tasks(site, user, batch), batches
+            ):
+                for key, value in counts.items():
+                    totals[key] += value
+
+    ready = totals["warmed"] + totals["cached"]
+    report = {
+        "generated_at": frappe.utils.now(),
+        "duration": round(time.monotonic() - started, 3),
+        "dashboards": dashboards,
+        "widgets": sum(len(task["widgets"]) for task in tasks),
+        "datasets": len(tasks),
+        **totals,
+        "coverage": round(ready / len(tasks), 4) if tasks else 1.0,
+    }
+    frappe.cache().set_value(WARMUP_REPORT_CACHE_KEY, report)
+    frappe.logger("daltek").info(
+        f"Precalentamiento: {len(dashboards)} dashboards, {ready}/{len(tasks)} "
+        f"datasets en caché ({totals['failed']} fallidos) en {report['duration']}s"
+    )
+    return report
+
+
+def get_last_warmup_report():
+    return frappe.cache().get_value(WARMUP_REPORT_CACHE_KEY)
+
+
+def enqueue_warm_up():
+    """Hook after_migrate y tarea programada: precalienta en segundo plano."""
+    frappe.enqueue(
+        "daltek.daltek.services.warmup.warm_up_dashboards",
+        queue="long",
+        job_id="daltek_cache_warmup",
+        deduplicate=True,
+        enqueue_after_commit=True,
+    )
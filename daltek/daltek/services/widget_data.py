@@ -0,0 +1,542 @@
+# daltek/services/widget_data.py
+
+import copy
+import time
+
+import frappe
+
+from daltek.daltek.domain.chart_factory import DEFAULT_WEBGL_THRESHOLD, ChartFactory
+from daltek.daltek.domain.chunked_dataset import ChunkedDataset
+from daltek.daltek.domain.dataset import Dataset, lineage_hash
+from daltek.daltek.domain.execution_plan import DEFAULT_ROW_LIMIT
+from daltek.daltek.domain.plotly_data_manager import (
+    AGGREGATES,
+    PlotlyDataManager,
+    records,
+)
+from daltek.daltek.domain.query_engine.query_definition import (
+    definition_doctypes,
+    quote_identifier,
+    split_column,
+)
+from daltek.daltek.domain.query_engine.query_engine import PIVOT_AGGREGATES
+from daltek.daltek.domain.sparse_pivot import SparsePivot
+from daltek.daltek.services import metrics
+from daltek.daltek.services.data_version import (
+    get_query_version,
+    is_settled,
+    is_unchanged,
+)
+from daltek.daltek.services.export import QueryStream
+from daltek.daltek.services.link_graph import resolve_query_joins
+from daltek.daltek.services.permissions import (
+    compile_secure_definition,
+    get_row_conditions,
+)
+from daltek.daltek.services.query_guard import prepare_select_sql
+from daltek.daltek.services.replica import run_read_query
+
+# Prioridades que envía el canvas: lo visible antes que lo precargado
+PRIORITIES = {"visible": 0, "near": 1, "prefetch": 2}
+RESULT_CACHE_PREFIX = "daltek_widget_result:"
+
+
+def get_widget_settings():
+    """
+    daltek_widget_batch_budget: segundos por lote; pasado ese tiempo los
+        widgets que no están visibles se devuelven como diferidos
+    daltek_widget_result_ttl: segundos que se conserva en Redis el
+        resultado de un widget (la versión de datos ya lo invalida antes)
+    daltek_pipeline_max_rows: filas máximas de una consulta sobre la que
+        los widgets aplican un pipeline en memoria; por encima, el pipeline
+        se agrega por bloques
+    daltek_aggregation_chunk_size: filas por bloque de la agregación por
+        bloques (acota la memoria de cada worker)
+    daltek_pivot_max_columns: valores distintos de la columna de un pivote
+        hasta los que se compila a agregación condicional; por encima se
+        piden coordenadas dispersas
+    daltek_pivot_max_cells: celdas con dato (o filas) máximas de un pivote
+    daltek_webgl_threshold: puntos a partir de los cuales los charts usan
+        trazas WebGL y arreglos tipados (0 lo desactiva)
+    """
+    conf = frappe.conf
+    return frappe._dict(
+        time_budget=float(conf.get("daltek_widget_batch_budget") or 2),
+        result_ttl=int(conf.get("daltek_widget_result_ttl") or 6 * 3600),
+        pipeline_max_rows=int(conf.get("daltek_pipeline_max_rows") or 50000),
+        chunk_size=int(conf.get("daltek_aggregation_chunk_size") or 20000),
+        pivot_max_columns=int(conf.get("daltek_pivot_max_columns") or 50),
+        pivot_max_cells=int(conf.get("daltek_pivot_max_cells") or 200000),
+        webgl_threshold=int(
+            conf.get("daltek_webgl_threshold", DEFAULT_WEBGL_THRESHOLD)
+        ),
+    )
+
+
+def parse_json_field(value, default):
+    if not value:
+        return default
+    if isinstance(value, str):
+        return frappe.parse_json(value)
+    return value
+
+
+def priority_rank(priority):
+    if isinstance(priority, (int, float)):
+        return priority
+    return PRIORITIES.get(priority, PRIORITIES["prefetch"])
+
+
+def qualified_column(column, base_doctype):
+    doctype, fieldname = split_column(column, base_doctype)
+    return f"{quote_identifier(doctype)}.{quote_identifier(fieldname)}"
+
+
+def widget_sql(engine, base_doctype, properties):
+    """
+    SQL de los datos de un widget sobre el QueryEngine ya compilado de su
+    consulta (`base_doctype` es su DocType base).
+
+    Con `properties.aggregate` (count, sum, avg, min, max) y
+    `properties.field` la agregación se resuelve en la base de datos y el
+    widget recibe un único valor; si no, recibe las filas de la consulta.
+    """
+    aggregate = (properties.get("aggregate") or "").lower()
+    if not aggregate:
+        limit = int(properties.get("limit") or DEFAULT_ROW_LIMIT)
+        return prepare_select_sql(engine.build(), limit)
+
+    func_cls = AGGREGATES.get(aggregate)
+    if not func_cls:
+        raise ValueError(f"Agregación '{aggregate}' no soportada")
+
+    field = properties.get("field")
+    if field:
+        column = qualified_column(field, base_doctype)
+    elif aggregate == "count":
+        column = "*"
+    else:
+        raise ValueError(f"La agregación '{aggregate}' requiere un campo")
+
+    engine._select = [str(func_cls(column, alias="value"))]
+    return prepare_select_sql(engine.build())
+
+
+def build_widget_sql(query, properties):
+    """
+    SQL de los datos de un widget a partir de la consulta guardada que
+    tiene vinculada (`properties.query_id`), con los permisos del usuario.
+    """
+    definition = resolve_query_joins({**query, "limit": None})
+    return widget_sql(
+        compile_secure_definition(definition), definition["doctype"], properties
+    )
+
+
+def render_widget_chart(chart, data):
+    """
+    Traza de Plotly de `properties.chart` ({"type", "x", "y", "title"})
+    sobre los datos de un widget, o None si no hay qué dibujar. Los
+    pivotes solo se dibujan como heatmap. Las trazas grandes usan WebGL y
+    arreglos tipados según `webgl_threshold`.
+    """
+    if not chart or not data.get("success"):
+        return None
+    webgl_threshold = get_widget_settings().webgl_threshold
+    if "pivot" in data:
+        if chart.get("type") != "heatmap":
+            return None
+        return ChartFactory.create_pivot_chart(
+            SparsePivot.from_payload(data["pivot"]),
+            title=chart.get("title"),
+            webgl_threshold=webgl_threshold,
+        ).render()
+    if not data.get("rows"):
+        return None
+    return ChartFactory.create_chart(
+        chart.get("type", "bar"),
+        Dataset(data["rows"]),
+        chart["x"],
+        chart["y"],
+        title=chart.get("title"),
+        webgl_threshold=webgl_threshold,
+    ).render()
+
+
+def with_chart(data, chart, widget_id=None):
+    """Agrega a `data` la traza del chart del widget, si tiene uno"""
+    try:
+        trace = render_widget_chart(chart, data)
+    except Exception as e:
+        # Un chart mal configurado (p. ej. una columna que ya no existe)
+        # deja el widget con su valor
+        frappe.logger("daltek").warning(
+            f"No se pudo dibujar el chart del widget {widget_id}: {e}"
+        )
+        return data
+    if trace is not None:
+        data["chart"] = trace
+    return data
+
+
+def result_cache_key(version):
+    return f"{RESULT_CACHE_PREFIX}{version['fingerprint']}:{version['data_version']}"
+
+
+def run_widget_query(sql, version):
+    """
+    Filas de la consulta de un widget, desde la caché de resultados si ya
+    se ejecutó con la misma versión de datos.
+
+    Si las filas pueden ser anteriores a la versión (cambió durante la
+    consulta o la réplica aún no la tiene), no se cachean y se quita
+    `data_version` de `version` para que el cliente tampoco las guarde.
+
+    Returns:
+        tuple: (filas, metadatos del nodo, True si vino de la caché)
+    """
+    cache = frappe.cache()
+    key = result_cache_key(version)
+    cached = cache.get_value(key)
+    metrics.count_cache("widget_result", cached is not None)
+    if cached is not None:
+        return cached["rows"], {"node": "cache"}, True
+
+    rows, node = run_read_query(sql)
+    if not is_settled(sql, version, node):
+        version["data_version"] = None
+        return rows, node, False
+    cache.set_value(
+        key,
+        {"rows": rows},
+        expires_in_sec=get_widget_settings().result_ttl,
+    )
+    return rows, node, False
+
+
+def load_pipeline_widget(
+    query_id, definition, properties, manager, fingerprint=None, data_version=None
+):
+    """
+    Datos de un widget con `properties.pipeline` (pasos de Dataset como
+    filter_rows, group_by o sort_by) aplicados en memoria sobre las filas
+    de su consulta.
+
+    Las filas de cada consulta se leen una vez por lote en `manager` y los
+    pasos se memoizan por linaje, así que los widgets que comparten
+    consulta y primeros pasos no repiten ese trabajo.
+
+    Si la consulta supera `pipeline_max_rows`, se recorre por bloques con
+    un cursor de servidor (ChunkedDataset) y el pipeline debe agrupar
+    (group_by o pivot) para que el resultado quepa en memoria.
+
+    `definition` es la consulta con los joins ya resueltos.
+    """
+    settings = get_widget_settings()
+    engine = compile_secure_definition(definition)
+    full_sql = prepare_select_sql(engine.build())
+    # El LIMIT en el motor: agregarlo sobre el texto fallaría con columnas
+    # como `credit_limit` y cargaría la tabla completa en memoria
+    sql = prepare_select_sql(engine.limit(settings.pipeline_max_rows + 1).build())
+    source = get_query_version(sql)
+    version = {
+        **source,
+        "fingerprint": lineage_hash(
+            source["fingerprint"], "pipeline", properties["pipeline"]
+        ),
+    }
+    unchanged = is_unchanged(version, fingerprint, data_version)
+    if data_version:
+        metrics.count_cache("revalidation", unchanged)
+    if unchanged:
+        return {"success": True, "unchanged": True, **version}
+
+    # Un dataset por consulta; la huella distingue permisos y filtros
+    name = f"{query_id}:{source['fingerprint']}"
+    node = "memory"
+    if name not in manager.datasets:
+        rows, meta, _ = run_widget_query(sql, source)
+        if len(rows) > settings.pipeline_max_rows:
+            dataset = ChunkedDataset(lambda: QueryStream(full_sql, settings.chunk_size))
+            node = "chunked"
+        else:
+            dataset = Dataset(list(rows))
+            node = meta["node"]
+        if source["data_version"] is None:
+            # Filas posiblemente anteriores a la versión: no se comparten
+            # con los demás widgets del lote
+            version["data_version"] = None
+            manager = PlotlyDataManager()
+        manager.add_dataset(name, dataset, version=source["data_version"])
+
+    result = manager.run_pipeline(name, properties["pipeline"])
+    if isinstance(result, ChunkedDataset):
+        raise ValueError(
+            f"La consulta supera las {settings.pipeline_max_rows} filas que se "
+            "pueden procesar en memoria; el pipeline debe agrupar (group_by o pivot)"
+        )
+    limit = int(properties.get("limit") or DEFAULT_ROW_LIMIT)
+    rows = records(result.df.head(limit))
+    return {"success": True, "node": node, **version, "rows": rows, "count": len(rows)}
+
+
+def load_pivot_widget(definition, properties, fingerprint=None, data_version=None):
+    """
+    Datos de un widget con `properties.pivot` ({"index", "columns",
+    "values", "aggfunc", "format"}): tabla pivote resuelta en SQL y
+    devuelta dispersa ("csr" por defecto o "coo"), sin celdas vacías.
+    """
+    settings = get_widget_settings()
+    pivot = properties["pivot"]
+    aggfunc = (pivot.get("aggfunc") or "sum").lower()
+    if aggfunc not in PIVOT_AGGREGATES:
+        raise ValueError(f"Agregación '{aggfunc}' no soportada en un pivote")
+
+    engine = compile_secure_definition(definition)
+    prepare_select_sql(engine.build())
+    base = definition["doctype"]
+    index = qualified_column(pivot["index"], base)
+    columns = qualified_column(pivot["columns"], base)
+    values = qualified_column(pivot["values"], base) if pivot.get("values") else "*"
+    engine.limit(settings.pivot_max_cells + 1)
+
+    # La versión es la de la consulta dispersa: no depende de los valores
+    # que tenga la columna en cada momento
+    version = get_query_version(
+        copy.deepcopy(engine).pivot(index, columns, values, aggfunc).build()
+    )
+    unchanged = is_unchanged(version, fingerprint, data_version)
+    if data_version:
+        metrics.count_cache("revalidation", unchanged)
+    if unchanged:
+        return {"success": True, "unchanged": True, **version}
+
+    nodes = set()
+    settled = []
+
+    def execute(sql):
+        sql_version = get_query_version(sql)
+        rows, node, _ = run_widget_query(sql, sql_version)
+        nodes.add(node["node"])
+        settled.append(sql_version["data_version"] is not None)
+        return rows
+
+    manager = PlotlyDataManager(executor=execute)
+    manager.add_query("pivot", engine)
+    result = manager.pivot_table(
+        "pivot",
+        index,
+        columns,
+        values,
+        aggfunc,
+        max_columns=settings.pivot_max_columns,
+    )
+    if max(result.shape[0], result.nnz) > settings.pivot_max_cells:
+        raise ValueError(
+            f"El pivote supera las {settings.pivot_max_cells} celdas con datos"
+        )
+    if not all(settled):
+        version["data_version"] = None
+
+    return {
+        "success": True,
+        "node": min(nodes - {"cache"}, default="cache"),
+        **version,
+        "pivot": result.to_payload(pivot.get("format") or "csr"),
+        "count": result.nnz,
+    }
+
+
+def load_dataset(
+    widget_id,
+    query_id,
+    definition,
+    properties,
+    fingerprint=None,
+    data_version=None,
+    manager=None,
+    sql=None,
+):
+    """
+    Datos de un widget a partir de la definición de su consulta con los
+    joins ya resueltos. Si `fingerprint` y `data_version` (lo que el
+    cliente tiene en caché) siguen vigentes, responde `unchanged`.
+
+    `manager` es el PlotlyDataManager del lote, compartido por los widgets
+    con pipeline. `sql` es la plantilla sin permisos del plan de ejecución:
+    se usa tal cual si el usuario no tiene condiciones de fila sobre los
+    DocTypes de la consulta.
+    """
+    try:
+        if properties.get("pivot"):
+            return load_pivot_widget(definition, properties, fingerprint, data_version)
+        if properties.get("pipeline"):
+            return load_pipeline_widget(
+                query_id,
+                definition,
+                properties,
+                manager or PlotlyDataManager(),
+                fingerprint,
+                data_version,
+            )
+
+        # get_row_conditions también comprueba que el usuario pueda leer
+        if not sql or get_row_conditions(definition_doctypes(definition)):
+            sql = widget_sql(
+                compile_secure_definition(definition),
+                definition["doctype"],
+                properties,
+            )
+        version = get_query_version(sql)
+        unchanged = is_unchanged(version, fingerprint, data_version)
+        if data_version:
+            metrics.count_cache("revalidation", unchanged)
+        if unchanged:
+            return {"success": True, "unchanged": True, **version}
+
+        rows, node, _ = run_widget_query(sql, version)
+    except (frappe.ValidationError, frappe.PermissionError, ValueError) as e:
+        return {"success": False, "error": str(e)}
+    except Exception as e:
+        # Un widget con error no debe impedir cargar el resto del lote
+        frappe.log_error(
+            f"Error cargando datos del widget {widget_id}: {str(e)}",
+            "Dashboard Widget Error",
+        )
+        return {"success": False, "error": str(e)}
+
+    result = {"success": True, "node": node["node"], **version}
+    if properties.get("aggregate"):
+        result["value"] = rows[0]["value"] if rows else None
+    else:
+        result.update(rows=rows, count=len(rows))
+    return result
+
+
+def load_widget_data(
+    widget, queries, fingerprint=None, data_version=None, manager=None
+):
+    """
+    Datos de un widget a partir de las consultas guardadas, sin plan de
+    ejecución (p. ej. con los filtros del crossfilter aplicados).
+    """
+    properties = widget.get("properties") or {}
+    query_id = properties.get("query_id")
+    query = queries.get(query_id)
+    if not query:
+        return {"success": False, "error": "El widget no tiene una consulta válida"}
+
+    try:
+        definition = resolve_query_joins({**query, "limit": None})
+    except (frappe.ValidationError, ValueError) as e:
+        return {"success": False, "error": str(e)}
+    data = load_dataset(
+        widget.get("id"),
+        query_id,
+        definition,
+        properties,
+        fingerprint,
+        data_version,
+        manager,
+    )
+    return with_chart(data, properties.get("chart"), widget.get("id"))
+
+
+def load_plan_dataset(
+    plan, widget_id, key, fingerprint=None, data_version=None, manager=None
+):
+    """Datos del dataset `key` del plan de ejecución de un dashboard"""
+    dataset = plan["datasets"][key]
+    if dataset.get("error"):
+        return {"success": False, "error": dataset["error"]}
+    query = plan["queries"][dataset["query_id"]]
+    return load_dataset(
+        widget_id,
+        dataset["query_id"],
+        query["definition"],
+        dataset["properties"],
+        fingerprint,
+        data_version,
+        manager,
+        sql=dataset["sql"],
+    )
+
+
+def load_widgets_data(doc, requests, time_budget=None):
+    """
+    Resuelve un lote de peticiones de datos de widgets de un dashboard
+    ejecutando su plan de ejecución: los widgets que comparten dataset (la
+    misma consulta y propiedades de datos) lo cargan una sola vez.
+
+    Las peticiones se atienden por prioridad ("visible", "near",
+    "prefetch" o un número: menor es más urgente). Agotado el presupuesto
+    de tiempo, solo se siguen atendiendo las visibles; el resto se devuelve
+    en `deferred` para que el cliente lo vuelva a pedir.
+
+    Args:
+        doc: documento Daltek (se usa su plan de ejecución)
+        requests (list): [{"widget_id", "priority", "fingerprint",
+            "data_version"}, ...]; los dos últimos solo si el cliente tiene
+            el resultado en caché
+
+    Returns:
+        dict: {"results": {widget_id: datos}, "deferred": [widget_id, ...],
+            "pipeline_cache": reutilización de pasos de pipeline, si hubo}
+    """
+    from daltek.daltek.services.execution_plan import get_execution_plan
+
+    if time_budget is None:
+        time_budget = get_widget_settings().time_budget
+
+    plan = get_execution_plan(doc)
+
+    ordered = sorted(
+        requests, key=lambda request: priority_rank(request.get("priority"))
+    )
+
+    manager = PlotlyDataManager()
+    started = time.monotonic()
+    results = {}
+    deferred = []
+    loaded = {}
+    for request in ordered:
+        widget_id = request.get("widget_id")
+        widget = plan["widgets"].get(widget_id)
+        if not widget:
+            results[widget_id] = {"success": False, "error": "Widget no encontrado"}
+            continue
+
+        out_of_budget = time.monotonic() - started > time_budget
+        if out_of_budget and priority_rank(request.get("priority")) > 0:
+            deferred.append(widget_id)
+            continue
+
+        if widget.get("error"):
+            results[widget_id] = {"success": False, "error": widget["error"]}
+            continue
+
+        fingerprint = request.get("fingerprint")
+        data_version = request.get("data_version")
+        key = (widget["dataset"], fingerprint, data_version)
+        if key not in loaded:
+            loaded[key] = load_plan_dataset(
+                plan, widget_id, widget["dataset"], fingerprint, data_version, manager
+            )
+        results[widget_id] = with_chart(
+            dict(loaded[key]), widget.get("chart"), widget_id
+        )
+
+    response = {"results": results, "deferred": deferred}
+    stats = manager.pipeline_stats()
+    if stats["hits"] or stats["misses"]:
+        metrics.inc(
+            "daltek_cache_requests_total", stats["hits"], cache="pipeline", result="hit"
+        )
+        metrics.inc(
+            "daltek_cache_requests_total",
+            stats["misses"],
+            cache="pipeline",
+            result="miss",
+        )
+        response["pipeline_cache"] = stats
+    return response
@@ -0,0 +1,219 @@
+# daltek/services/workload.py
+
+import re
+
+import frappe
+
+from daltek.daltek.domain.index_advisor import IndexAdvisor
+from daltek.daltek.domain.query_engine.sql_analysis import fingerprint_sql
+
+WORKLOAD_CACHE_KEY = "daltek_query_workload"
+# Un hash de Redis por campo, con la huella como clave
+WORKLOAD_FIELDS = ("sql", "count", "total_time", "max_time", "last_seen")
+MAX_TRACKED_FINGERPRINTS = 500
+DISTINCT_SAMPLE_SIZE = 100000
+
+_SAFE_IDENTIFIER_RE = re.compile(r"^[\w\s-]+$")
+
+# Suma una ejecución a la huella ARGV[1] de forma atómica. Las huellas
+# nuevas solo se registran mientras haya menos de ARGV[5].
+RECORD_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 0 then
+    if redis.call('HLEN', KEYS[1]) >= tonumber(ARGV[5]) then
+        return 0
+    end
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+end
+redis.call('HINCRBY', KEYS[2], ARGV[1], 1)
+redis.call('HINCRBYFLOAT', KEYS[3], ARGV[1], ARGV[3])
+local max_time = tonumber(redis.call('HGET', KEYS[4], ARGV[1]) or '0')
+if tonumber(ARGV[3]) > max_time then
+    redis.call('HSET', KEYS[4], ARGV[1], ARGV[3])
+end
+redis.call('HSET', KEYS[5], ARGV[1], ARGV[4])
+return 1
+"""
+
+
+def workload_keys(cache):
+    return [
+        cache.make_key(f"{WORKLOAD_CACHE_KEY}:{field}") for field in WORKLOAD_FIELDS
+    ]
+
+
+def record_query(sql, duration):
+    """
+    Registra una ejecución en la carga capturada del Query Builder.
+    Nunca interrumpe la petición que la origina.
+    """
+    try:
+        cache = frappe.cache()
+        cache.eval(
+            RECORD_SCRIPT,
+            len(WORKLOAD_FIELDS),
+            *workload_keys(cache),
+            fingerprint_sql(sql),
+            sql,
+            f"{float(duration):.6f}",
+            frappe.utils.now(),
+            MAX_TRACKED_FINGERPRINTS,
+        )
+    except Exception as e:
+        frappe.logger("daltek").warning(f"No se pudo registrar la consulta: {e}")
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def get_workload():
+    """Devuelve {huella: entrada} con la carga capturada."""
+    cache = frappe.cache()
+    # HGETALL directo: los valores no están serializados con pickle
+    fields = {
+        field: {
+            _decode(key): _decode(value)
+            for key, value in (cache.execute_command("HGETALL", key) or {}).items()
+        }
+        for field, key in zip(WORKLOAD_FIELDS, workload_keys(cache))
+    }
+    return {
+        fingerprint: {
+            "sql": sql,
+            "count": int(fields["count"].get(fingerprint) or 0),
+            "total_time": float(fields["total_time"].get(fingerprint) or 0),
+            "max_time": float(fields["max_time"].get(fingerprint) or 0),
+            "last_seen": fields["last_seen"].get(fingerprint),
+        }
+        for fingerprint, sql in fields["sql"].items()
+    }
+
+
+def clear_workload():
+    frappe.cache().delete_value(
+        [f"{WORKLOAD_CACHE_KEY}:{field}" for field in WORKLOAD_FIELDS]
+    )
+
+
+def doctype_from_table(table):
+    return table[3:] if table.startswith("tab") else table
+
+
+def explain_rows(sql, tables):
+    """
+    Ejecuta EXPLAIN y devuelve {tabla: filas estimadas}.
+
+    Args:
+        sql (str): consulta SELECT
+        tables (dict): {alias: tabla} para resolver los alias del plan
+    """
+    try:
+        plan = frappe.db.sql(f"EXPLAIN {sql}", as_dict=True)
+    except Exception as e:
+        frappe.logger("daltek").warning(f"EXPLAIN falló: {e}")
+        return {}
+
+    rows = {}
+    for step in plan:
+        table = tables.get(step.get("table"), step.get("table"))
+        if table:
+            rows[table] = max(rows.get(table, 0), int(step.get("rows") or 0))
+    return rows
+
+
+def get_table_indexes(table):
+    """Devuelve las columnas de cada índice existente de la tabla."""
+    if not _SAFE_IDENTIFIER_RE.match(table):
+        return []
+    indexes = {}
+    for row in frappe.db.sql(f"SHOW INDEX FROM `{table}`", as_dict=True):
+        indexes.setdefault(row["Key_name"], []).append(
+            (row["Seq_in_index"], row["Column_name"])
+        )
+    return [[column for _seq, column in sorted(cols)] for cols in indexes.values()]
+
+
+def get_table_rows(table):
+    result = frappe.db.sql(
+        """SELECT TABLE_ROWS FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s""",
+        (table,),
+    )
+    return int(result[0][0] or 0) if result else 0
+
+
+def count_distinct(table, columns):
+    """Valores distintos de `columns` sobre una muestra acotada de la tabla."""
+    if not columns or not all(
+        _SAFE_IDENTIFIER_RE.match(name) for name in [table, *columns]
+    ):
+        return None
+    cols = ", ".join(f"`{column}`" for column in columns)
+    result = frappe.db.sql(
+        f"""SELECT COUNT(DISTINCT {cols}) FROM
+        (SELECT {cols} FROM `{table}` LIMIT {DISTINCT_SAMPLE_SIZE}) AS sample"""
+    )
+    return int(result[0][0] or 0) if result else None
+
+
+def build_index_report(top=20, max_columns=3):
+    """
+    Analiza las consultas más costosas de la carga capturada y sugiere
+    índices compuestos por DocType, con filas examinadas antes y después.
+
+    Returns:
+        dict: {"generated_at", "analyzed_fingerprints", "doctypes": {...}}
+    """
+    advisor = IndexAdvisor(max_columns=max_columns)
+    for entry in get_workload().values():
+        advisor.add_query(entry["sql"], entry["total_time"], entry["count"])
+
+    fingerprints = advisor.top_fingerprints(top)
+    plans = {
+        fingerprint: explain_rows(
+            advisor.workload[fingerprint]["sql"],
+            advisor.workload[fingerprint]["usage"]["tables"],
+        )
+        for fingerprint in fingerprints
+    }
+
+    tables = {
+        table
+        for fingerprint in fingerprints
+        for table in advisor.candidate_for(fingerprint)
+    }
+    existing = {table: get_table_indexes(table) for table in tables}
+    suggestions = advisor.suggest_indexes(fingerprints, existing)
+
+    doctypes = {}
+    for table, items in suggestions.items():
+        table_rows = get_table_rows(table)
+        for suggestion in items:
+            rows_before = max(
+                plans[fingerprint].get(table, table_rows)
+                for fingerprint in suggestion["fingerprints"]
+            )
+            rows_after = advisor.estimate_rows(
+                table_rows,
+                count_distinct(table, suggestion["equality"]),
+                bool(suggestion["range"]),
+            )
+            doctypes.setdefault(doctype_from_table(table), []).append(
+                {
+                    "table": table,
+                    "columns": suggestion["columns"],
+                    "ddl": advisor.ddl(table, suggestion["columns"]),
+                    "rows_before": rows_before,
+                    "rows_after": min(rows_after, rows_before or rows_after),
+                    "queries": len(suggestion["fingerprints"]),
+                    "executions": suggestion["count"],
+                    "total_time": round(suggestion["total_time"], 4),
+                    "fingerprints": suggestion["fingerprints"],
+                }
+            )
+
+    return {
+        "generated_at": frappe.utils.now(),
+        "analyzed_fingerprints": len(fingerprints),
+        "doctypes": doctypes,
+    }
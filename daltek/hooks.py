@@ -70,6 +70,11 @@ app_include_js = ["/assets/daltek/js/gridstack-all.js"]
 # automatically create page for each record of this doctype
 # website_generators = ["Web Page"]
 
+# Dashboards públicos servidos desde su snapshot (templates/pages/daltek_dashboard)
+website_route_rules = [
+    {"from_route": "/dashboards/<name>", "to_route": "daltek_dashboard"},
+]
+
 # Jinja
 # ----------
 
@@ -85,6 +90,9 @@ app_include_js = ["/assets/daltek/js/gridstack-all.js"]
 # before_install = "daltek.install.before_install"
 # after_install = "daltek.install.after_install"
 
+# Precalienta la caché de los dashboards más vistos tras cada migración
+after_migrate = ["daltek.daltek.services.warmup.enqueue_warm_up"]
+
 # Uninstallation
 # ------------
 
@@ -145,9 +153,65 @@ app_include_js = ["/assets/daltek/js/gridstack-all.js"]
 # 	}
 # }
 
+doc_events = {
+    "*": {
+        "on_change": "daltek.daltek.services.data_version.bump_doctype_version",
+        "on_trash": "daltek.daltek.services.data_version.bump_doctype_version",
+    },
+    "DocType": {
+        "on_update": [
+            "daltek.daltek.services.link_graph.clear_link_graph_cache",
+            "daltek.daltek.services.permissions.clear_permission_cache",
+        ],
+        "on_trash": "daltek.daltek.services.link_graph.clear_link_graph_cache",
+    },
+    "Custom Field": {
+        "on_update": "daltek.daltek.services.link_graph.clear_link_graph_cache",
+        "on_trash": "daltek.daltek.services.link_graph.clear_link_graph_cache",
+    },
+    "User": {
+        "on_update": "daltek.daltek.services.permissions.on_user_update",
+    },
+    "User Permission": {
+        "on_update": "daltek.daltek.services.permissions.on_user_permission_change",
+        "on_trash": "daltek.daltek.services.permissions.on_user_permission_change",
+    },
+    "DocShare": {
+        "on_update": "daltek.daltek.services.permissions.on_docshare_change",
+        "on_trash": "daltek.daltek.services.permissions.on_docshare_change",
+    },
+    "Custom DocPerm": {
+        "on_update": "daltek.daltek.services.permissions.clear_permission_cache",
+        "on_trash": "daltek.daltek.services.permissions.clear_permission_cache",
+    },
+    "Role": {
+        "on_update": "daltek.daltek.services.permissions.clear_permission_cache",
+    },
+    "Daltek": {
+        "on_update": "daltek.daltek.services.snapshots.on_dashboard_update",
+        "on_trash": "daltek.daltek.services.snapshots.on_dashboard_trash",
+    },
+}
+
+# `bench clear-cache` también invalida los permisos cacheados
+clear_cache = "daltek.daltek.services.permissions.clear_permission_cache"
+
 # Scheduled Tasks
 # ---------------
 
+scheduler_events = {
+    "cron": {
+        # Snapshots de los dashboards públicos
+        "*/15 * * * *": [
+            "daltek.daltek.services.snapshots.refresh_public_snapshots",
+        ],
+        # Caché de los dashboards más vistos antes del horario laboral
+        "30 6 * * 1-5": [
+            "daltek.daltek.services.warmup.enqueue_warm_up",
+        ],
+    },
+}
+
 # scheduler_events = {
 # 	"all": [
 # 		"daltek.tasks.all"
@@ -196,13 +260,15 @@ app_include_js = ["/assets/daltek/js/gridstack-all.js"]
 
 # Request Events
 # ----------------
-# before_request = ["daltek.utils.before_request"]
-# after_request = ["daltek.utils.after_request"]
+# Métricas de rendimiento: se acumulan por hilo y se publican en Redis al
+# terminar cada petición o trabajo
+before_request = ["daltek.daltek.services.metrics.before_request"]
+after_request = ["daltek.daltek.services.metrics.after_request"]
 
 # Job Events
 # ----------
-# before_job = ["daltek.utils.before_job"]
-# after_job = ["daltek.utils.after_job"]
+before_job = ["daltek.daltek.services.metrics.before_job"]
+after_job = ["daltek.daltek.services.metrics.after_job"]
 
 # User Data Protection
 # --------------------
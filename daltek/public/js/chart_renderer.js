@@ -0,0 +1,182 @@
+// Renderizado de charts Plotly compartido por el Drag & Drop y los
+// dashboards públicos. Las trazas grandes llegan con arreglos tipados
+// ({dtype, bdata} en base64); se decodifican y preparan en un Web Worker
+// para no bloquear el hilo principal mientras se arrastran widgets.
+// Se ejecuta en el contexto del campo HTML de ERPNext
+
+(function (window) {
+  "use strict";
+
+  if (window.DaltekCharts) return;
+
+  const PLOTLY_URL = "https://cdn.plot.ly/plotly-2.35.2.min.js";
+
+  // Se ejecuta dentro del worker (y en el hilo principal si no hay
+  // workers): reemplaza cada {dtype, bdata} por un arreglo tipado y
+  // devuelve los buffers para transferirlos sin copiarlos
+  function prepareTrace(trace) {
+    const ARRAYS = {
+      i1: Int8Array,
+      u1: Uint8Array,
+      i2: Int16Array,
+      u2: Uint16Array,
+      i4: Int32Array,
+      u4: Uint32Array,
+      f4: Float32Array,
+      f8: Float64Array,
+    };
+    const buffers = [];
+
+    function decode(value) {
+      const binary = atob(value.bdata);
+      const bytes = new Uint8Array(binary.length);
+      for (let i = 0; i < binary.length; i++) bytes[i] = binary.charCodeAt(i);
+      buffers.push(bytes.buffer);
+      return new ARRAYS[value.dtype](bytes.buffer);
+    }
+
+    function walk(value) {
+      if (!value || typeof value !== "object") return value;
+      if (typeof value.bdata === "string" && ARRAYS[value.dtype]) {
+        return decode(value);
+      }
+      if (Array.isArray(value)) return value;
+      const result = {};
+      Object.keys(value).forEach((key) => {
+        result[key] = walk(value[key]);
+      });
+      return result;
+    }
+
+    return { trace: walk(trace), buffers };
+  }
+
+  let plotlyPromise = null;
+  let worker = null;
+  let nextId = 0;
+  const pending = new Map();
+
+  // Renders que esperan a que termine un arrastre o redimensionado
+  let paused = false;
+  const deferred = [];
+
+  function loadPlotly() {
+    if (window.Plotly) return Promise.resolve(window.Plotly);
+    if (plotlyPromise) return plotlyPromise;
+    plotlyPromise = new Promise((resolve, reject) => {
+      const script = document.createElement("script");
+      script.src = PLOTLY_URL;
+      script.onload = () => resolve(window.Plotly);
+      script.onerror = reject;
+      document.head.appendChild(script);
+    });
+    return plotlyPromise;
+  }
+
+  function getWorker() {
+    if (worker !== null) return worker;
+    worker = false;
+    if (!window.Worker || !window.Blob || !window.URL) return worker;
+    try {
+      const source =
+        `const prepareTrace = ${prepareTrace.toString()};\n` +
+        "self.onmessage = (event) => {\n" +
+        "  const result = prepareTrace(event.data.trace);\n" +
+        "  self.postMessage(\n" +
+        "    { id: event.data.id, trace: result.trace },\n" +
+        "    result.buffers,\n" +
+        "  );\n" +
+        "};\n";
+      const url = URL.createObjectURL(
+        new Blob([source], { type: "application/javascript" }),
+      );
+      worker = new Worker(url);
+      worker.onmessage = (event) => {
+        const request = pending.get(event.data.id);
+        pending.delete(event.data.id);
+        if (request) request.resolve(event.data.trace);
+      };
+      // Con CSP sin blob: o error en el worker se prepara en el hilo principal
+      worker.onerror = () => {
+        worker.terminate();
+        worker = false;
+        pending.forEach((request) =>
+          request.resolve(prepareTrace(request.trace).trace),
+        );
+        pending.clear();
+      };
+    } catch (e) {
+      worker = false;
+    }
+    return worker;
+  }
+
+  function hasTypedArrays(trace) {
+    return Object.keys(trace).some(
+      (key) => trace[key] && typeof trace[key].bdata === "string",
+    );
+  }
+
+  // Devuelve una promesa con la traza lista para Plotly
+  function prepare(trace) {
+    const target = hasTypedArrays(trace) ? getWorker() : false;
+    if (!target) return Promise.resolve(prepareTrace(trace).trace);
+    return new Promise((resolve) => {
+      const id = ++nextId;
+      pending.set(id, { resolve, trace });
+      target.postMessage({ id, trace });
+    });
+  }
+
+  function draw(element, trace, layout) {
+    return loadPlotly().then((Plotly) =>
+      Plotly.react(element, [trace], layout, {
+        responsive: true,
+        displaylogo: false,
+      }),
+    );
+  }
+
+  // Prepara la traza fuera del hilo principal y la dibuja cuando no hay
+  // un arrastre en curso
+  function plot(element, trace, layout) {
+    element.dataset.daltekChart = "1";
+    return Promise.all([prepare(trace), loadPlotly()]).then(([prepared]) => {
+      if (!element.isConnected) return null;
+      const finalLayout = Object.assign(
+        { margin: { t: 10, r: 10, b: 30, l: 40 } },
+        layout,
+      );
+      if (!paused) return draw(element, prepared, finalLayout);
+      return new Promise((resolve) => {
+        deferred.push(() => resolve(draw(element, prepared, finalLayout)));
+      });
+    });
+  }
+
+  function pause() {
+    paused = true;
+  }
+
+  function resume() {
+    paused = false;
+    deferred.splice(0).forEach((render) => render());
+  }
+
+  // Ajusta al nuevo tamaño los charts dentro de `container`
+  function resize(container) {
+    if (!window.Plotly) return;
+    container
+      .querySelectorAll("[data-daltek-chart]")
+      .forEach((element) => window.Plotly.Plots.resize(element));
+  }
+
+  window.DaltekCharts = {
+    loadPlotly,
+    prepare,
+    plot,
+    pause,
+    resume,
+    resize,
+  };
+})(window);
@@ -33,6 +33,27 @@
       window.DragDropGrid.handleGridChange(items);
     });
 
+    // Filtrado cruzado desde los charts de los widgets
+    UI.onChartSelect = window.DragDropGrid.selectChartValues;
+    if (UI.dom.crossfilterClear) {
+      UI.dom.crossfilterClear.addEventListener("click", () =>
+        window.DragDropGrid.applyCrossfilter([]),
+      );
+    }
+
+    // Los charts que terminan de cargar durante un arrastre se dibujan al
+    // soltar, para que mover widgets no compita con Plotly
+    const Charts = window.DaltekCharts;
+    if (Charts) {
+      grid.on("dragstart resizestart", function () {
+        Charts.pause();
+      });
+      grid.on("dragstop resizestop", function (event, element) {
+        Charts.resume();
+        if (element) Charts.resize(element);
+      });
+    }
+
     return grid;
   };
 
@@ -98,6 +119,8 @@
         window.DragDropGrid.handleWidgetConfig(id, node);
       });
     }
+
+    window.DragDropGrid.observeWidget(node);
   };
 
   // Renderizar widgets existentes en el grid
@@ -138,6 +161,9 @@
           window.DragDropGrid.handleWidgetConfig(widget.id, node);
         });
       }
+
+      // Los datos se piden cuando el widget entra en pantalla
+      window.DragDropGrid.observeWidget(node);
     });
   };
 
@@ -148,10 +174,14 @@
 
     if (!widget) return;
 
-    UI.showEditDialog(widget, (newTitle) => {
-      widget.properties.title = newTitle;
-      UI.updateWidgetTitle(nodeElement, newTitle);
+    UI.showEditDialog(widget, (values) => {
+      Object.assign(widget.properties, values);
+      UI.updateWidgetTitle(nodeElement, widget.properties.title);
       State.saveWidgets(widgets);
+
+      // La consulta vinculada pudo cambiar: volver a cargar los datos
+      delete State.state.widgetData[widget.id];
+      window.DragDropGrid.observeWidget(nodeElement);
     });
   };
 
@@ -164,8 +194,305 @@
       `[data-widget-id="${widgetId}"]`,
     );
     if (node) {
+      window.DragDropGrid.unobserveWidget(node);
       grid.removeWidget(node);
       State.removeWidget(widgetId);
     }
   };
+
+  // ============ Carga diferida de datos de widgets ============
+  // Los datos de cada widget se piden solo cuando su celda entra en el
+  // viewport del canvas. Las peticiones se agrupan en lotes con prioridad
+  // ("visible" antes que "near") y se cancelan si el widget sale de la
+  // pantalla antes de recibir respuesta.
+
+  const PREFETCH_MARGIN = "200px 0px";
+  const FLUSH_DELAY = 50;
+  const PRIORITY_RANK = { visible: 0, near: 1 };
+
+  const loader = {
+    observer: null,
+    pending: new Map(), // widgetId -> prioridad
+    inFlight: new Map(), // widgetId -> lote en curso
+    flushTimer: null,
+  };
+
+  function getObserver() {
+    if (loader.observer || typeof IntersectionObserver === "undefined") {
+      return loader.observer;
+    }
+    loader.observer = new IntersectionObserver(handleIntersections, {
+      root: UI.dom.canvas,
+      rootMargin: PREFETCH_MARGIN,
+    });
+    return loader.observer;
+  }
+
+  // "visible" si el widget está dentro del canvas; "near" si solo entra
+  // en el margen de precarga
+  function getPriority(entry) {
+    const canvasRect = UI.dom.canvas.getBoundingClientRect();
+    const rect = entry.boundingClientRect;
+    const visible =
+      rect.bottom > canvasRect.top && rect.top < canvasRect.bottom;
+    return visible ? "visible" : "near";
+  }
+
+  function handleIntersections(entries) {
+    entries.forEach((entry) => {
+      const widgetId = entry.target.dataset.widgetId;
+      if (entry.isIntersecting) {
+        queueWidget(widgetId, getPriority(entry));
+      } else {
+        cancelWidget(widgetId);
+      }
+    });
+  }
+
+  window.DragDropGrid.observeWidget = function (node) {
+    const widget = State.getWidgets().find(
+      (w) => w.id === node.dataset.widgetId,
+    );
+    if (!widget || !widget.properties || !widget.properties.query_id) return;
+
+    const cached = State.state.widgetData[widget.id];
+    if (cached) {
+      UI.renderWidgetData(node, cached);
+      return;
+    }
+
+    const observer = getObserver();
+    if (!observer) {
+      // Navegadores sin IntersectionObserver: cargar directamente
+      queueWidget(widget.id, "visible");
+      return;
+    }
+    observer.unobserve(node);
+    observer.observe(node);
+  };
+
+  window.DragDropGrid.unobserveWidget = function (node) {
+    if (loader.observer) loader.observer.unobserve(node);
+    cancelWidget(node.dataset.widgetId);
+  };
+
+  function queueWidget(widgetId, priority) {
+    if (State.state.widgetData[widgetId] || loader.inFlight.has(widgetId)) {
+      return;
+    }
+    const current = loader.pending.get(widgetId);
+    if (current !== "visible") loader.pending.set(widgetId, priority);
+
+    if (!loader.flushTimer) {
+      loader.flushTimer = setTimeout(flushQueue, FLUSH_DELAY);
+    }
+  }
+
+  function cancelWidget(widgetId) {
+    loader.pending.delete(widgetId);
+
+    const batch = loader.inFlight.get(widgetId);
+    if (!batch) return;
+    loader.inFlight.delete(widgetId);
+    batch.widgetIds.delete(widgetId);
+
+    const node = findWidgetNode(widgetId);
+    if (node) UI.setWidgetLoading(node, false);
+
+    // Si ningún widget del lote sigue esperando, abortar la petición
+    if (batch.widgetIds.size === 0 && batch.request && batch.request.abort) {
+      batch.request.abort();
+    }
+  }
+
+  function flushQueue() {
+    loader.flushTimer = null;
+    if (!loader.pending.size) return;
+
+    const frm = State.state.frm;
+    if (!frm || !frm.doc || frm.is_new()) {
+      loader.pending.clear();
+      return;
+    }
+
+    const requests = Array.from(loader.pending, ([widgetId, priority]) => ({
+      widget_id: widgetId,
+      priority: priority,
+    }));
+    requests.sort(
+      (a, b) => PRIORITY_RANK[a.priority] - PRIORITY_RANK[b.priority],
+    );
+    loader.pending.clear();
+
+    const batch = { widgetIds: new Set(), request: null, cached: {} };
+    requests.forEach((r) => {
+      batch.widgetIds.add(r.widget_id);
+      loader.inFlight.set(r.widget_id, batch);
+      const node = findWidgetNode(r.widget_id);
+      if (node) UI.setWidgetLoading(node, true);
+    });
+
+    // Lo que haya en IndexedDB se muestra ya y se envía para revalidar
+    const lookups = requests.map((r) =>
+      State.getCachedWidgetData(r.widget_id).then((entry) => {
+        if (!entry) return;
+        batch.cached[r.widget_id] = entry.payload;
+        r.fingerprint = entry.fingerprint;
+        r.data_version = entry.data_version;
+        const node = findWidgetNode(r.widget_id);
+        if (node) UI.renderWidgetData(node, entry.payload);
+      }),
+    );
+
+    Promise.all(lookups).then(() => {
+      const pending = requests.filter((r) => batch.widgetIds.has(r.widget_id));
+      if (pending.length) sendBatch(frm.doc.name, pending, batch);
+    });
+  }
+
+  function sendBatch(docName, requests, batch) {
+    batch.request = frappe.call({
+      method: "daltek.daltek.doctype.daltek.daltek.get_widgets_data",
+      args: {
+        doc_name: docName,
+        requests: JSON.stringify(requests),
+      },
+      callback: function (response) {
+        const message = response.message || {};
+        const results = message.results || {};
+
+        Object.keys(results).forEach((widgetId) => {
+          // Respuesta de un widget cancelado: se descarta
+          if (!batch.widgetIds.has(widgetId)) return;
+
+          const result = results[widgetId];
+          if (result.unchanged && batch.cached[widgetId]) {
+            finishWidget(widgetId, batch.cached[widgetId]);
+            return;
+          }
+          finishWidget(widgetId, result);
+          if (result.success) State.cacheWidgetData(widgetId, result);
+        });
+
+        // Diferidos por el servidor: se vuelven a pedir si siguen esperando
+        (message.deferred || []).forEach((widgetId) => {
+          if (!batch.widgetIds.has(widgetId)) return;
+          loader.inFlight.delete(widgetId);
+          queueWidget(widgetId, "near");
+        });
+      },
+      always: function () {
+        batch.widgetIds.forEach((widgetId) => {
+          if (loader.inFlight.get(widgetId) !== batch) return;
+          loader.inFlight.delete(widgetId);
+          const node = findWidgetNode(widgetId);
+          if (node) UI.setWidgetLoading(node, false);
+        });
+      },
+    });
+  }
+
+  function finishWidget(widgetId, data) {
+    loader.inFlight.delete(widgetId);
+    const node = findWidgetNode(widgetId);
+
+    if (data && data.success) {
+      State.state.widgetData[widgetId] = data;
+      if (loader.observer && node) loader.observer.unobserve(node);
+    }
+    if (node) {
+      UI.setWidgetLoading(node, false);
+      UI.renderWidgetData(node, data);
+    }
+  }
+
+  // Filtrado cruzado: filtra el resto de widgets por un valor (p. ej. al
+  // hacer clic en una barra). filters: [{column: "DocType.campo",
+  // values: [...] | range: [desde, hasta], widget_id}]. El servidor lo
+  // resuelve en memoria y solo devuelve los widgets que cambiaron.
+  window.DragDropGrid.applyCrossfilter = function (filters) {
+    const frm = State.state.frm;
+    const crossfilter = State.state.crossfilter;
+    if (!frm || !frm.doc || frm.is_new()) return Promise.resolve();
+
+    if (crossfilter.request) crossfilter.request.abort();
+    crossfilter.filters = filters || [];
+    UI.renderCrossfilterBar(crossfilter.filters);
+
+    // Sin filtros se vuelve a los datos ya cargados
+    if (!crossfilter.filters.length) {
+      crossfilter.hashes = {};
+      Object.keys(State.state.widgetData).forEach((widgetId) => {
+        const node = findWidgetNode(widgetId);
+        if (node) UI.renderWidgetData(node, State.state.widgetData[widgetId]);
+      });
+      return Promise.resolve();
+    }
+
+    return new Promise((resolve) => {
+      const request = frappe.call({
+        method: "daltek.daltek.doctype.daltek.daltek.get_crossfilter_data",
+        args: {
+          doc_name: frm.doc.name,
+          filters: JSON.stringify(crossfilter.filters),
+          known: JSON.stringify(crossfilter.hashes),
+        },
+        callback: function (response) {
+          const message = response.message || {};
+          const widgets = message.widgets || {};
+          Object.keys(widgets).forEach((widgetId) => {
+            crossfilter.hashes[widgetId] = widgets[widgetId].hash;
+            const node = findWidgetNode(widgetId);
+            if (node) UI.renderWidgetData(node, widgets[widgetId]);
+          });
+          resolve(message);
+        },
+        always: function () {
+          if (crossfilter.request === request) crossfilter.request = null;
+        },
+      });
+      crossfilter.request = request;
+    });
+  };
+
+  // Clic o selección en el chart de un widget: reemplaza su filtro por los
+  // valores elegidos del eje x (null los quita) y filtra el resto
+  window.DragDropGrid.selectChartValues = function (widgetId, values) {
+    const column = chartFilterColumn(widgetId);
+    if (!column) return Promise.resolve();
+
+    const filters = State.state.crossfilter.filters.filter(
+      (f) => f.widget_id !== widgetId,
+    );
+    if (values && values.length) {
+      filters.push({ column, values, widget_id: widgetId });
+    }
+    return window.DragDropGrid.applyCrossfilter(filters);
+  };
+
+  // Columna "DocType.campo" del eje x del chart de un widget
+  function chartFilterColumn(widgetId) {
+    const widget = State.getWidgets().find((w) => w.id === widgetId);
+    const properties = (widget && widget.properties) || {};
+    const x = properties.chart && properties.chart.x;
+    if (!x) return null;
+    if (x.includes(".")) return x;
+
+    let queries = State.state.frm.doc.query_data_storage || [];
+    if (typeof queries === "string") {
+      try {
+        queries = JSON.parse(queries);
+      } catch (e) {
+        queries = [];
+      }
+    }
+    const query = (queries || []).find((q) => q.id === properties.query_id);
+    return query && query.doctype ? `${query.doctype}.${x}` : null;
+  }
+
+  function findWidgetNode(widgetId) {
+    return UI.dom.gridContainer.querySelector(
+      `.grid-stack-item[data-widget-id="${widgetId}"]`,
+    );
+  }
 })(window);
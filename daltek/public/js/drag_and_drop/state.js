@@ -13,6 +13,8 @@
     grid: null, // Instancia de GridStack
     widgets: [], // Widgets actualmente en el canvas
     availableWidgets: [], // Widgets disponibles para añadir
+    widgetData: {}, // Datos ya cargados por widget (id -> respuesta)
+    crossfilter: { filters: [], hashes: {}, request: null }, // Filtros cruzados
     isDark: false, // Modo oscuro activado
   };
 
@@ -71,6 +73,33 @@
     this.saveWidgets(filtered);
   };
 
+  // ============ Caché persistente de datos de widgets ============
+  // Los datos se guardan en IndexedDB (DaltekResultCache) con la huella y
+  // versión que devolvió el servidor; al reabrir el dashboard se envían
+  // para que el servidor responda "unchanged" si nada cambió.
+
+  function widgetCacheKey(widgetId) {
+    const frm = window.DragDropState.state.frm;
+    const docName = frm && frm.doc ? frm.doc.name : "";
+    return `widget:${docName}:${widgetId}`;
+  }
+
+  window.DragDropState.getCachedWidgetData = function (widgetId) {
+    if (!window.DaltekResultCache) return Promise.resolve(null);
+    return window.DaltekResultCache.get(widgetCacheKey(widgetId));
+  };
+
+  window.DragDropState.cacheWidgetData = function (widgetId, data) {
+    if (!window.DaltekResultCache || !data.data_version) return;
+    const { fingerprint, data_version, ...payload } = data;
+    window.DaltekResultCache.set(
+      widgetCacheKey(widgetId),
+      fingerprint,
+      data_version,
+      payload,
+    );
+  };
+
   window.DragDropState.detectDarkMode = function () {
     const isDark =
       document.body.classList.contains("dark") ||
@@ -13,12 +13,17 @@
   const gridContainer = document.getElementById("ddGridContainer");
   const sidebar = document.getElementById("ddSidebar");
   const widgetList = document.getElementById("ddWidgetList");
+  const crossfilterBar = document.getElementById("ddCrossfilterBar");
+  const crossfilterLabel = document.getElementById("ddCrossfilterLabel");
+  const crossfilterClear = document.getElementById("ddCrossfilterClear");
 
   window.DragDropUI.dom = {
     canvas,
     gridContainer,
     sidebar,
     widgetList,
+    crossfilterBar,
+    crossfilterClear,
   };
 
   // Crear HTML de un widget
@@ -61,12 +66,164 @@
     });
   };
 
-  // Mostrar diálogo para editar widget
+  // Mostrar diálogo para editar widget (título y consulta vinculada)
   window.DragDropUI.showEditDialog = function (widget, callback) {
-    const newTitle = prompt("Nuevo título:", widget.properties.title);
-    if (newTitle !== null && newTitle.trim() !== "") {
-      callback(newTitle);
+    const frm = getState().frm;
+    if (!frm || frm.is_new()) {
+      const newTitle = prompt("Nuevo título:", widget.properties.title);
+      if (newTitle !== null && newTitle.trim() !== "") {
+        callback({ title: newTitle });
+      }
+      return;
     }
+
+    frappe.call({
+      method: "daltek.daltek.doctype.daltek.daltek.get_saved_queries",
+      args: { doc_name: frm.doc.name },
+      callback: function (response) {
+        const queries = (response.message && response.message.queries) || [];
+        const dialog = new frappe.ui.Dialog({
+          title: "Configurar widget",
+          fields: [
+            {
+              fieldname: "title",
+              label: "Título",
+              fieldtype: "Data",
+              reqd: 1,
+              default: widget.properties.title,
+            },
+            {
+              fieldname: "query_id",
+              label: "Consulta",
+              fieldtype: "Select",
+              options: [{ value: "", label: "" }].concat(
+                queries.map((q) => ({ value: q.id, label: q.name })),
+              ),
+              default: widget.properties.query_id || "",
+            },
+            {
+              fieldname: "aggregate",
+              label: "Agregación",
+              fieldtype: "Select",
+              options: ["", "count", "sum", "avg", "min", "max"],
+              default: widget.properties.aggregate || "count",
+            },
+            {
+              fieldname: "field",
+              label: "Campo",
+              fieldtype: "Data",
+              default: widget.properties.field || "",
+            },
+          ],
+          primary_action_label: "Guardar",
+          primary_action: function (values) {
+            dialog.hide();
+            callback({
+              title: values.title,
+              query_id: values.query_id || null,
+              aggregate: values.aggregate || null,
+              field: values.field || null,
+            });
+          },
+        });
+        dialog.show();
+      },
+    });
+  };
+
+  // Indicador de carga de datos del widget
+  window.DragDropUI.setWidgetLoading = function (nodeElement, loading) {
+    const card = nodeElement.querySelector(".dd-widget-card");
+    if (card) card.classList.toggle("dd-widget-loading", loading);
+  };
+
+  // Mostrar los datos recibidos del servidor en el widget
+  window.DragDropUI.renderWidgetData = function (nodeElement, data) {
+    const numberElement = nodeElement.querySelector(".dd-widget-number");
+    if (!numberElement) return;
+
+    let chartElement = nodeElement.querySelector(".dd-widget-chart");
+    const tableElement = nodeElement.querySelector(".dd-widget-table");
+    if (tableElement) tableElement.remove();
+    if (!data || !data.success) {
+      if (chartElement) chartElement.remove();
+      numberElement.style.display = "";
+      numberElement.textContent = "—";
+      numberElement.title = (data && data.error) || "";
+      return;
+    }
+
+    // Con traza de Plotly el widget muestra el chart; se prepara en un
+    // worker y se dibuja cuando no hay un arrastre en curso
+    if (data.chart && window.DaltekCharts) {
+      if (!chartElement) {
+        chartElement = document.createElement("div");
+        chartElement.className = "dd-widget-chart";
+        numberElement.after(chartElement);
+      }
+      numberElement.style.display = "none";
+      const element = chartElement;
+      window.DaltekCharts.plot(element, data.chart).then(() =>
+        bindChartSelection(nodeElement, element),
+      );
+      return;
+    }
+    if (chartElement) chartElement.remove();
+
+    // Pivote sin chart: tabla dispersa ("csr" o "coo") con las celdas
+    // con dato
+    const Tables = window.DaltekSparseTable;
+    if (data.pivot && Tables && Tables.isSparseTable(data.pivot)) {
+      numberElement.style.display = "none";
+      const table = Tables.render(
+        numberElement.parentNode,
+        data.pivot,
+        "dd-widget-table",
+      );
+      numberElement.after(table);
+      return;
+    }
+    numberElement.style.display = "";
+
+    const value = data.value !== undefined ? data.value : data.count;
+    numberElement.textContent =
+      typeof value === "number" ? value.toLocaleString() : (value ?? "—");
+    numberElement.title = "";
+  };
+
+  // Clic o selección en un chart: avisa a onChartSelect(widgetId, valores)
+  // con los valores del eje x (o las etiquetas de un pie); doble clic o
+  // deseleccionar avisa con null para quitar el filtro del widget
+  function bindChartSelection(nodeElement, chartElement) {
+    if (!chartElement.on || chartElement.dataset.daltekSelect) return;
+    chartElement.dataset.daltekSelect = "1";
+
+    const pointValue = (point) =>
+      point.label !== undefined ? point.label : point.x;
+    const notify = (points) => {
+      const onChartSelect = window.DragDropUI.onChartSelect;
+      if (!onChartSelect) return;
+      const values = points
+        ? [...new Set(points.map(pointValue))].filter((value) => value != null)
+        : null;
+      onChartSelect(nodeElement.dataset.widgetId, values);
+    };
+
+    chartElement.on("plotly_click", (event) => notify(event.points));
+    chartElement.on("plotly_selected", (event) => {
+      if (event && event.points && event.points.length) notify(event.points);
+    });
+    chartElement.on("plotly_deselect", () => notify(null));
+    chartElement.on("plotly_doubleclick", () => notify(null));
+  }
+
+  // Barra con los filtros cruzados activos; se oculta sin filtros
+  window.DragDropUI.renderCrossfilterBar = function (filters) {
+    if (!crossfilterBar) return;
+    crossfilterBar.hidden = !filters.length;
+    crossfilterLabel.textContent = filters
+      .map((f) => `${f.column}: ${(f.values || f.range || []).join(", ")}`)
+      .join(" · ");
   };
 
   // Actualizar el título de un widget en el DOM
@@ -2,6 +2,9 @@ function escapeSql(s) {
   return s.replace(/'/g, "''");
 }
 
+// Construye un SELECT de una sola tabla en el cliente.
+// La vista previa y la ejecución envían getQueryDefinition() y el servidor
+// la compila con QueryEngine (joins y permisos incluidos).
 function buildSQL() {
   const state = window.QueryBuilderState.state;
   const select = state.selectedCols.join(", ");
@@ -28,6 +31,210 @@ function buildSQL() {
   return `SELECT ${select} FROM \`${from}\`${where}`;
 }
 
+function getQueryDefinition() {
+  const state = window.QueryBuilderState.state;
+  return {
+    doctype: state.doctypeName,
+    columns: state.selectedCols,
+    filters: state.filters,
+    joins: (state.joins || []).map((j) => ({
+      doctype: j.doctype,
+      path: j.path,
+    })),
+  };
+}
+
+// Ejecuta una consulta en el servidor reutilizando el resultado guardado en
+// IndexedDB cuando el servidor confirma que los datos no cambiaron.
+// `query` es SQL o la definición del Query Builder (getQueryDefinition());
+// con la definición el servidor aplica los permisos del usuario por registro
+function runQuery(query, limit = 100) {
+  const cache = window.DaltekResultCache;
+  const isSql = typeof query === "string";
+  const cacheKey = isSql
+    ? `sql:${limit}:${query}`
+    : `query:${limit}:${JSON.stringify(query)}`;
+  const lookup = cache ? cache.get(cacheKey) : Promise.resolve(null);
+
+  return lookup.then(
+    (entry) =>
+      new Promise((resolve, reject) => {
+        frappe.call({
+          method: "daltek.daltek.doctype.daltek.daltek.execute_query_builder_sql",
+          args: {
+            sql_query: isSql ? query : null,
+            query_data: isSql ? null : JSON.stringify(query),
+            limit: limit,
+            fingerprint: entry ? entry.fingerprint : null,
+            data_version: entry ? entry.data_version : null,
+          },
+          callback: function (r) {
+            const result = r.message;
+            if (!result || !result.success) {
+              reject(result);
+              return;
+            }
+            if (result.unchanged && entry) {
+              resolve({ ...entry.payload, from_cache: true });
+              return;
+            }
+            if (cache && result.data_version && !result.queued) {
+              const { fingerprint, data_version, ...payload } = result;
+              cache.set(cacheKey, fingerprint, data_version, payload);
+            }
+            resolve(result);
+          },
+          error: reject,
+        });
+      }),
+  );
+}
+
+// Espera el resultado de una consulta que el guardián de coste mandó a
+// segundo plano: se pide al llegar el aviso en tiempo real
+// (daltek_query_result) y, por si el aviso se pierde, cada
+// QUEUED_POLL_MS. Resuelve con el resultado o lo rechaza si falló.
+var QUEUED_POLL_MS = 5000;
+
+function waitForQueuedResult(jobId) {
+  return new Promise((resolve, reject) => {
+    let done = false;
+    let timer = null;
+
+    const finish = (result) => {
+      if (done) return;
+      done = true;
+      clearInterval(timer);
+      frappe.realtime.off("daltek_query_result", onResult);
+      if (result && result.success) resolve(result);
+      else reject(result);
+    };
+
+    const fetchResult = () => {
+      frappe.call({
+        method:
+          "daltek.daltek.doctype.daltek.daltek.get_background_query_result",
+        args: { job_id: jobId },
+        callback: function (r) {
+          if (r.message && r.message.pending) return;
+          finish(r.message);
+        },
+        error: finish,
+      });
+    };
+
+    function onResult(data) {
+      if (data && data.job_id === jobId) fetchResult();
+    }
+
+    frappe.realtime.on("daltek_query_result", onResult);
+    timer = setInterval(fetchResult, QUEUED_POLL_MS);
+  });
+}
+
+// Vista previa en vivo: los cambios se agrupan con un debounce y solo se
+// pinta la respuesta de la última petición. Cada petición lleva un número
+// creciente para que el servidor cancele la consulta de las anteriores.
+// `var`: el script se vuelve a ejecutar cada vez que se recarga el HTML
+var PREVIEW_DEBOUNCE_MS = 400;
+var previewSessionKey = Math.random().toString(36).slice(2, 12);
+var previewTimer = null;
+var previewSeq = 0;
+var lastPreviewKey = null;
+
+function schedulePreview() {
+  clearTimeout(previewTimer);
+  previewTimer = setTimeout(runPreview, PREVIEW_DEBOUNCE_MS);
+}
+
+function resetPreview() {
+  clearTimeout(previewTimer);
+  // Invalida las respuestas que sigan en camino
+  previewSeq++;
+  lastPreviewKey = null;
+  window.QueryBuilderUI.setPreviewStatus("hidden");
+}
+
+function runPreview() {
+  const state = window.QueryBuilderState.state;
+  if (!state.doctypeName || !state.selectedCols.length) {
+    resetPreview();
+    return;
+  }
+
+  const queryData = JSON.stringify(getQueryDefinition());
+  if (queryData === lastPreviewKey) return;
+  lastPreviewKey = queryData;
+
+  const seq = ++previewSeq;
+  const ui = window.QueryBuilderUI;
+  ui.setPreviewStatus("loading");
+
+  frappe.call({
+    method: "daltek.daltek.doctype.daltek.daltek.preview_query_builder_sql",
+    args: {
+      query_data: queryData,
+      session_key: previewSessionKey,
+      preview_id: seq,
+    },
+    callback: function (r) {
+      const result = r.message;
+      // Una vista previa más nueva ya está en curso
+      if (seq !== previewSeq || !result || result.superseded) return;
+      if (!result.success) {
+        lastPreviewKey = null;
+        ui.setPreviewStatus("error", result.error || result.message);
+        return;
+      }
+      ui.renderPreview(result);
+    },
+    error: function () {
+      if (seq !== previewSeq) return;
+      lastPreviewKey = null;
+      ui.setPreviewStatus("error", "No se pudo cargar la vista previa");
+    },
+  });
+}
+
+// Ejecución completa (hasta EXECUTE_LIMIT filas) con el botón Ejecutar. Usa
+// runQuery, así que repetirla sin cambios en los datos responde desde
+// IndexedDB. Comparte el número de secuencia con la vista previa para que
+// una respuesta vieja de cualquiera de las dos no pise a la más nueva.
+var EXECUTE_LIMIT = 500;
+
+function executeQuery() {
+  const state = window.QueryBuilderState.state;
+  if (!state.doctypeName || !state.selectedCols.length) return;
+
+  const query = getQueryDefinition();
+  clearTimeout(previewTimer);
+  lastPreviewKey = JSON.stringify(query);
+  const seq = ++previewSeq;
+  const ui = window.QueryBuilderUI;
+  ui.setPreviewStatus("loading");
+
+  runQuery(query, EXECUTE_LIMIT)
+    .then((result) => {
+      if (seq !== previewSeq || !result.queued) return result;
+      ui.setPreviewStatus("ready", result.message);
+      return waitForQueuedResult(result.job_id);
+    })
+    .then((result) => {
+      if (seq !== previewSeq) return;
+      const source = result.from_cache ? " (desde la caché)" : "";
+      ui.renderPreview(result, `(${result.count} filas${source})`);
+    })
+    .catch((result) => {
+      if (seq !== previewSeq) return;
+      lastPreviewKey = null;
+      ui.setPreviewStatus(
+        "error",
+        (result && (result.error || result.message)) ||
+          "No se pudo ejecutar la consulta",
+      );
+    });
+}
+
 function parseVal(v) {
   if (v.toLowerCase() === "true") return true;
   if (v.toLowerCase() === "false") return false;
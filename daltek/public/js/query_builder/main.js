@@ -189,6 +189,13 @@ function init() {
     );
   }
 
+  if (dom.addJoinBtn) {
+    dom.addJoinBtn.addEventListener(
+      "click",
+      window.QueryBuilderSteps.handleAddJoin,
+    );
+  }
+
   if (dom.addFilterBtn) {
     dom.addFilterBtn.addEventListener(
       "click",
@@ -196,6 +203,10 @@ function init() {
     );
   }
 
+  if (dom.runQueryBtn) {
+    dom.runQueryBtn.addEventListener("click", executeQuery);
+  }
+
   if (dom.resetBtn) {
     dom.resetBtn.addEventListener("click", () => {
       if (window.QueryBuilderViews && window.QueryBuilderViews.resetBuilder) {
@@ -11,6 +11,8 @@
     doctypeName: null,
     selectedCols: [],
     filters: [],
+    joins: [],
+    links: [],
     availableFields: [],
   };
 
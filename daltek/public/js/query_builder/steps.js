@@ -134,7 +134,8 @@
     // Agrupar campos por tipo
     const fieldsByType = {};
     fields.forEach((field) => {
-      const type = field.fieldtype || "Otros";
+      // Los campos de DocTypes unidos se agrupan por su DocType
+      const type = field.group || field.fieldtype || "Otros";
       if (!fieldsByType[type]) {
         fieldsByType[type] = [];
       }
@@ -202,11 +203,16 @@
 
     state.table = table;
     dom.colsSection.style.display = "none";
+    dom.joinsSection.style.display = "none";
     dom.filtersSection.style.display = "none";
     state.selectedCols = [];
     state.filters = [];
+    state.joins = [];
+    state.links = [];
     dom.colsList.innerHTML = "";
+    dom.joinsList.innerHTML = "";
     dom.filtersContainer.innerHTML = "";
+    resetPreview();
 
     dom.tableHint.textContent = `DocType seleccionado: ${doctypeName}`;
 
@@ -217,7 +223,7 @@
       dom.fieldsDropdown.style.display = "none";
     }
 
-    frappe.call({
+    return frappe.call({
       method: "daltek.daltek.doctype.daltek.daltek.get_doctype_fields",
       args: {
         doctype_name: doctypeName,
@@ -234,6 +240,8 @@
           window.QueryBuilderSteps.populateFieldsDropdown(fields);
 
           dom.colsSection.style.display = "block";
+
+          window.QueryBuilderSteps.loadDoctypeLinks(doctypeName);
         }
       },
       error: function (error) {
@@ -247,6 +255,178 @@
     });
   };
 
+  const RELATION_LABELS = {
+    link: "Enlaces",
+    child: "Tablas hijas",
+    parent: "DocType padre",
+    referenced_by: "Referenciado por",
+  };
+
+  // Cargar los DocTypes relacionados para ofrecer joins
+  window.QueryBuilderSteps.loadDoctypeLinks = function (doctypeName) {
+    const state = getState();
+    const joinSelect = dom.joinSelect;
+    if (!joinSelect) return;
+
+    joinSelect.innerHTML = '<option value="">Cargando relaciones...</option>';
+
+    frappe.call({
+      method: "daltek.daltek.doctype.daltek.daltek.get_doctype_links",
+      args: {
+        doctype_name: doctypeName,
+      },
+      callback: function (response) {
+        if (!response.message || !response.message.success) return;
+
+        state.links = response.message.links || [];
+        joinSelect.innerHTML =
+          '<option value="">-- DocType relacionado --</option>';
+
+        Object.keys(RELATION_LABELS).forEach((relation) => {
+          const links = state.links
+            .map((link, index) => ({ link, index }))
+            .filter(({ link }) => link.relation === relation);
+          if (!links.length) return;
+
+          const group = document.createElement("optgroup");
+          group.label = RELATION_LABELS[relation];
+          links.forEach(({ link, index }) => {
+            const opt = document.createElement("option");
+            opt.value = index;
+            opt.textContent = `${link.doctype} (${link.fieldname})`;
+            group.appendChild(opt);
+          });
+          joinSelect.appendChild(group);
+        });
+
+        const other = document.createElement("option");
+        other.value = "other";
+        other.textContent = "Otro DocType...";
+        joinSelect.appendChild(other);
+
+        dom.joinsSection.style.display = "block";
+      },
+      error: function (error) {
+        console.error("Error obteniendo relaciones del DocType:", error);
+        joinSelect.innerHTML = '<option value="">Sin relaciones</option>';
+      },
+    });
+  };
+
+  // Unir un DocType a la consulta y agregar sus campos a los disponibles
+  window.QueryBuilderSteps.addJoin = function (doctype, path) {
+    const state = getState();
+
+    if (state.joins.some((join) => join.doctype === doctype)) {
+      return Promise.resolve();
+    }
+
+    return new Promise((resolve) => {
+      frappe.call({
+        method: "daltek.daltek.doctype.daltek.daltek.get_doctype_fields",
+        args: {
+          doctype_name: doctype,
+        },
+        callback: function (response) {
+          if (response.message && response.message.success) {
+            const fields = response.message.all_fields.map((field) => ({
+              ...field,
+              fieldname: `${doctype}.${field.fieldname}`,
+              label: `${doctype} › ${field.label}`,
+              group: `↪ ${doctype}`,
+            }));
+
+            state.joins.push({ doctype, path });
+            state.availableFields = state.availableFields.concat(fields);
+
+            window.QueryBuilderSteps.populateFieldsDropdown(
+              state.availableFields,
+            );
+            window.QueryBuilderUI.renderJoins();
+            schedulePreview();
+          }
+          resolve();
+        },
+        error: function (error) {
+          frappe.msgprint("Error al cargar los campos: " + error.message);
+          resolve();
+        },
+      });
+    });
+  };
+
+  window.QueryBuilderSteps.handleAddJoin = function () {
+    const state = getState();
+    const value = dom.joinSelect ? dom.joinSelect.value : "";
+
+    if (value === "") return;
+
+    if (value !== "other") {
+      const link = state.links[Number(value)];
+      if (link) {
+        const { doctype, relation, ...edge } = link;
+        window.QueryBuilderSteps.addJoin(doctype, [edge]);
+      }
+      return;
+    }
+
+    // DocType no relacionado directamente: pedir la ruta al servidor
+    frappe.prompt(
+      {
+        fieldname: "doctype",
+        fieldtype: "Link",
+        options: "DocType",
+        label: "DocType",
+        reqd: 1,
+      },
+      (values) => {
+        frappe.call({
+          method: "daltek.daltek.doctype.daltek.daltek.get_join_path",
+          args: {
+            source_doctype: state.doctypeName,
+            target_doctype: values.doctype,
+          },
+          callback: function (response) {
+            if (response.message && response.message.success) {
+              window.QueryBuilderSteps.addJoin(
+                values.doctype,
+                response.message.path,
+              );
+            } else {
+              frappe.msgprint(
+                response.message?.message || "No se encontró una relación",
+              );
+            }
+          },
+        });
+      },
+      "Unir con otro DocType",
+    );
+  };
+
+  window.QueryBuilderSteps.removeJoin = function (doctype) {
+    const state = getState();
+    const prefix = `${doctype}.`;
+
+    state.joins = state.joins.filter((join) => join.doctype !== doctype);
+    state.availableFields = state.availableFields.filter(
+      (field) => !field.fieldname.startsWith(prefix),
+    );
+    state.selectedCols = state.selectedCols.filter(
+      (col) => !col.startsWith(prefix),
+    );
+
+    [...dom.filtersContainer.children].forEach((row) => {
+      const colSel = row.querySelector("select");
+      if (colSel && colSel.value.startsWith(prefix)) row.remove();
+    });
+
+    window.QueryBuilderSteps.populateFieldsDropdown(state.availableFields);
+    window.QueryBuilderUI.renderSelectedCols();
+    window.QueryBuilderUI.renderJoins();
+    window.QueryBuilderSteps.updateFiltersState();
+  };
+
   window.QueryBuilderSteps.handleAddColumn = function () {
     const state = getState();
     const fieldsSearch = dom.fieldsSearch;
@@ -270,6 +450,7 @@
     delete fieldsSearch.dataset.label;
 
     dom.filtersSection.style.display = "block";
+    schedulePreview();
   };
 
   window.QueryBuilderSteps.handleSelectAllColumns = function () {
@@ -282,6 +463,7 @@
 
     window.QueryBuilderUI.renderSelectedCols();
     dom.filtersSection.style.display = "block";
+    schedulePreview();
   };
 
   window.QueryBuilderSteps.addFilterRow = function () {
@@ -329,6 +511,11 @@
         window.QueryBuilderSteps.updateFiltersState,
       ),
     );
+    // Mientras se escribe el valor la vista previa espera al debounce
+    valInput.addEventListener(
+      "input",
+      window.QueryBuilderSteps.updateFiltersState,
+    );
 
     row.appendChild(colSel);
     row.appendChild(opSel);
@@ -355,5 +542,6 @@
     });
 
     state.filters = filters;
+    schedulePreview();
   };
 })(window);
@@ -16,12 +16,22 @@
   const colsList = document.getElementById("colsList");
   const selectAllCols = document.getElementById("selectAllCols");
 
+  const joinsSection = document.getElementById("joinsSection");
+  const joinSelect = document.getElementById("joinSelect");
+  const addJoinBtn = document.getElementById("addJoinBtn");
+  const joinsList = document.getElementById("joinsList");
+
   const filtersSection = document.getElementById("filtersSection");
   const filtersContainer = document.getElementById("filtersContainer");
   const addFilterBtn = document.getElementById("addFilterBtn");
 
+  const previewSection = document.getElementById("previewSection");
+  const previewStatus = document.getElementById("previewStatus");
+  const previewTable = document.getElementById("previewTable");
+
   const resetBtn = document.getElementById("resetBtn");
   const saveQueryBtn = document.getElementById("saveQueryBtn");
+  const runQueryBtn = document.getElementById("runQueryBtn");
 
   window.QueryBuilderUI.dom = {
     tableHint,
@@ -31,11 +41,19 @@
     addColBtn,
     colsList,
     selectAllCols,
+    joinsSection,
+    joinSelect,
+    addJoinBtn,
+    joinsList,
     filtersSection,
     filtersContainer,
     addFilterBtn,
+    previewSection,
+    previewStatus,
+    previewTable,
     resetBtn,
     saveQueryBtn,
+    runQueryBtn,
   };
 
   window.QueryBuilderUI.renderSelectedCols = function () {
@@ -50,8 +68,65 @@
         state.selectedCols = state.selectedCols.filter((x) => x !== col);
         window.QueryBuilderUI.renderSelectedCols();
         if (!state.selectedCols.length) filtersSection.style.display = "none";
+        schedulePreview();
       });
       colsList.appendChild(chip);
     });
   };
+
+  // Estado de la vista previa: "hidden", "loading", "error" o "ready"
+  window.QueryBuilderUI.setPreviewStatus = function (status, message = "") {
+    previewSection.style.display = status === "hidden" ? "none" : "block";
+    previewStatus.textContent =
+      status === "loading" ? "Actualizando…" : message;
+    previewStatus.style.color = status === "error" ? "red" : "";
+  };
+
+  // `message` reemplaza el texto de estado (p. ej. al ejecutar la consulta)
+  window.QueryBuilderUI.renderPreview = function (result, message = null) {
+    const rows = result.data || [];
+    const columns = rows.length ? Object.keys(rows[0]) : [];
+    previewTable.innerHTML = "";
+
+    if (!rows.length) {
+      previewTable.innerHTML = '<div class="empty">Sin resultados</div>';
+    } else {
+      const table = document.createElement("table");
+      const headRow = table.createTHead().insertRow();
+      columns.forEach((column) => {
+        const th = document.createElement("th");
+        th.textContent = column;
+        headRow.appendChild(th);
+      });
+      const body = table.createTBody();
+      rows.forEach((row) => {
+        const tr = body.insertRow();
+        columns.forEach((column) => {
+          tr.insertCell().textContent = row[column] ?? "";
+        });
+      });
+      previewTable.appendChild(table);
+    }
+
+    window.QueryBuilderUI.setPreviewStatus(
+      "ready",
+      message || `(primeras ${rows.length} filas)`,
+    );
+  };
+
+  window.QueryBuilderUI.renderJoins = function () {
+    const state = getState();
+    joinsList.innerHTML = "";
+
+    (state.joins || []).forEach((join) => {
+      const via = join.path.map((edge) => edge.fieldname).join(" → ");
+      const chip = document.createElement("div");
+      chip.className = "col-chip";
+      chip.innerHTML = `${join.doctype} <small style="color:var(--qb-muted)">(${via})</small> <button style="border:none;background:transparent;color:var(--qb-muted);cursor:pointer">✕</button>`;
+      chip.querySelector("button").addEventListener("click", () => {
+        window.QueryBuilderSteps.removeJoin(join.doctype);
+      });
+      joinsList.appendChild(chip);
+    });
+  };
 })(window);
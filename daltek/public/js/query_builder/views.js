@@ -25,6 +25,7 @@
     currentView = "list";
     queriesListView.style.display = "block";
     queryBuilderView.style.display = "none";
+    resetPreview();
 
     renderQueriesList();
   };
@@ -93,7 +94,15 @@
       deleteQuery(query);
     });
 
+    const exportBtn = document.createElement("button");
+    exportBtn.textContent = "Exportar";
+    exportBtn.addEventListener("click", (e) => {
+      e.stopPropagation();
+      exportQuery(query);
+    });
+
     actions.appendChild(editBtn);
+    actions.appendChild(exportBtn);
     actions.appendChild(deleteBtn);
 
     header.appendChild(title);
@@ -162,35 +171,45 @@
               window.QueryBuilderSteps &&
               window.QueryBuilderSteps.handleTableChange
             ) {
-              window.QueryBuilderSteps.handleTableChange();
-
-              setTimeout(() => {
-                state.selectedCols = query.columns || [];
-
-                if (window.QueryBuilderUI.renderSelectedCols) {
-                  window.QueryBuilderUI.renderSelectedCols();
-                }
-
-                state.filters = query.filters || [];
-                if (query.filters && query.filters.length > 0) {
-                  const dom = window.QueryBuilderUI?.dom;
-                  if (dom && dom.filtersContainer) {
-                    dom.filtersContainer.innerHTML = "";
-                    query.filters.forEach((filter) => {
-                      window.QueryBuilderSteps.addFilterRow();
-                      const lastRow = dom.filtersContainer.lastElementChild;
-                      if (lastRow) {
-                        const selects = lastRow.querySelectorAll("select");
-                        const input = lastRow.querySelector("input");
-                        if (selects[0]) selects[0].value = filter.col;
-                        if (selects[1]) selects[1].value = filter.op;
-                        if (input) input.value = filter.val;
-                      }
-                    });
-                    window.QueryBuilderSteps.updateFiltersState();
+              const joins = query.joins || [];
+
+              // Esperar a que carguen los campos y los joins antes de restaurar
+              Promise.resolve(window.QueryBuilderSteps.handleTableChange())
+                .then(() =>
+                  Promise.all(
+                    joins.map((join) =>
+                      window.QueryBuilderSteps.addJoin(join.doctype, join.path),
+                    ),
+                  ),
+                )
+                .then(() => {
+                  state.selectedCols = query.columns || [];
+
+                  if (window.QueryBuilderUI.renderSelectedCols) {
+                    window.QueryBuilderUI.renderSelectedCols();
                   }
-                }
-              }, 100);
+
+                  state.filters = query.filters || [];
+                  if (query.filters && query.filters.length > 0) {
+                    const dom = window.QueryBuilderUI?.dom;
+                    if (dom && dom.filtersContainer) {
+                      dom.filtersContainer.innerHTML = "";
+                      query.filters.forEach((filter) => {
+                        window.QueryBuilderSteps.addFilterRow();
+                        const lastRow = dom.filtersContainer.lastElementChild;
+                        if (lastRow) {
+                          const selects = lastRow.querySelectorAll("select");
+                          const input = lastRow.querySelector("input");
+                          if (selects[0]) selects[0].value = filter.col;
+                          if (selects[1]) selects[1].value = filter.op;
+                          if (input) input.value = filter.val;
+                        }
+                      });
+                      window.QueryBuilderSteps.updateFiltersState();
+                    }
+                  }
+                  schedulePreview();
+                });
             }
           } else {
             frappe.msgprint(
@@ -215,6 +234,8 @@
         tableName: "",
         selectedCols: [],
         filters: [],
+        joins: [],
+        links: [],
         availableFields: [],
       };
     }
@@ -235,13 +256,78 @@
       }
 
       if (dom.colsList) dom.colsList.innerHTML = "";
+      if (dom.joinsList) dom.joinsList.innerHTML = "";
       if (dom.filtersContainer) dom.filtersContainer.innerHTML = "";
       if (dom.tableHint)
         dom.tableHint.textContent = "Selecciona un DocType para continuar.";
 
       if (dom.colsSection) dom.colsSection.style.display = "none";
+      if (dom.joinsSection) dom.joinsSection.style.display = "none";
       if (dom.filtersSection) dom.filtersSection.style.display = "none";
     }
+    resetPreview();
+  }
+
+  let exportListenerReady = false;
+
+  // Aviso cuando termina una exportación generada en segundo plano
+  function listenExportReady() {
+    if (exportListenerReady) return;
+    exportListenerReady = true;
+    frappe.realtime.on("daltek_export_ready", (data) => {
+      if (data.success) {
+        frappe.msgprint(
+          `Exportación lista: <a href="${data.file_url}" target="_blank">descargar</a>`,
+        );
+      } else {
+        frappe.msgprint(data.error || "Error generando la exportación");
+      }
+    });
+  }
+
+  function exportQuery(query) {
+    frappe.prompt(
+      {
+        fieldname: "file_format",
+        label: "Formato",
+        fieldtype: "Select",
+        options: "csv\nxlsx\nparquet",
+        default: "csv",
+      },
+      (values) => {
+        frappe.call({
+          method: "daltek.daltek.doctype.daltek.daltek.prepare_query_export",
+          args: {
+            file_format: values.file_format,
+            query_data: JSON.stringify({
+              doctype: query.doctype,
+              columns: query.columns || [],
+              filters: query.filters || [],
+              joins: query.joins || [],
+            }),
+          },
+          callback: function (response) {
+            const result = response.message;
+            if (!result || !result.success) {
+              frappe.msgprint(
+                result?.error || "Error preparando la exportación",
+              );
+              return;
+            }
+
+            if (result.mode === "background") {
+              listenExportReady();
+              frappe.show_alert({ message: result.message, indicator: "blue" });
+              return;
+            }
+
+            window.open(result.url);
+          },
+        });
+      },
+      "Exportar consulta",
+      "Exportar",
+    );
   }
 
   function deleteQuery(query) {
@@ -358,6 +444,10 @@
       doctype: state.doctypeName || "",
       columns: state.selectedCols || [],
       filters: state.filters || [],
+      joins: (state.joins || []).map((j) => ({
+        doctype: j.doctype,
+        path: j.path,
+      })),
       description: queryDescription || `Consulta sobre ${state.doctypeName}`,
       created_by: frappe.session.user,
       created_at: currentQuery?.created_at || new Date().toISOString(),
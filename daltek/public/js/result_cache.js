@@ -0,0 +1,108 @@
+// Caché de resultados en IndexedDB compartida por el Query Builder y el
+// Drag & Drop. Cada entrada guarda la huella de la consulta y la versión de
+// datos que devolvió el servidor, para revalidarla con una petición mínima.
+// Se ejecuta en el contexto del campo HTML de ERPNext
+
+(function (window) {
+  "use strict";
+
+  if (window.DaltekResultCache) return;
+
+  const DB_NAME = "daltek_results";
+  const STORE = "results";
+  const MAX_ENTRIES = 300;
+
+  let dbPromise = null;
+
+  function openDB() {
+    if (dbPromise) return dbPromise;
+
+    dbPromise = new Promise((resolve) => {
+      if (!window.indexedDB) {
+        resolve(null);
+        return;
+      }
+      const request = window.indexedDB.open(DB_NAME, 1);
+      request.onupgradeneeded = () => {
+        const store = request.result.createObjectStore(STORE, {
+          keyPath: "key",
+        });
+        store.createIndex("updated_at", "updated_at");
+      };
+      request.onsuccess = () => resolve(request.result);
+      // Sin IndexedDB (modo privado, cuota...) la caché queda desactivada
+      request.onerror = () => resolve(null);
+    });
+    return dbPromise;
+  }
+
+  // Las claves incluyen el usuario: el navegador puede ser compartido
+  function scopedKey(key) {
+    const user = (window.frappe && frappe.session && frappe.session.user) || "";
+    return `${user}:${key}`;
+  }
+
+  function withStore(mode, fn) {
+    return openDB().then((db) => {
+      if (!db) return null;
+      return new Promise((resolve) => {
+        const tx = db.transaction(STORE, mode);
+        const result = fn(tx.objectStore(STORE));
+        tx.oncomplete = () => resolve(result && result.result);
+        tx.onerror = () => resolve(null);
+        tx.onabort = () => resolve(null);
+      });
+    });
+  }
+
+  // Devuelve {fingerprint, data_version, payload} o null
+  function get(key) {
+    return withStore("readonly", (store) => store.get(scopedKey(key))).catch(
+      () => null,
+    );
+  }
+
+  function set(key, fingerprint, dataVersion, payload) {
+    return withStore("readwrite", (store) => {
+      store.put({
+        key: scopedKey(key),
+        fingerprint: fingerprint,
+        data_version: dataVersion,
+        payload: payload,
+        updated_at: Date.now(),
+      });
+    })
+      .then(prune)
+      .catch(() => null);
+  }
+
+  function remove(key) {
+    return withStore("readwrite", (store) => {
+      store.delete(scopedKey(key));
+    }).catch(() => null);
+  }
+
+  // Elimina las entradas más antiguas por encima de MAX_ENTRIES
+  function prune() {
+    return withStore("readwrite", (store) => {
+      const countRequest = store.count();
+      countRequest.onsuccess = () => {
+        let excess = countRequest.result - MAX_ENTRIES;
+        if (excess <= 0) return;
+        store.index("updated_at").openCursor().onsuccess = (event) => {
+          const cursor = event.target.result;
+          if (!cursor || excess <= 0) return;
+          cursor.delete();
+          excess -= 1;
+          cursor.continue();
+        };
+      };
+    });
+  }
+
+  window.DaltekResultCache = {
+    get: get,
+    set: set,
+    remove: remove,
+  };
+})(window);
@@ -0,0 +1,84 @@
+// Tablas pivote dispersas compartidas por el Drag & Drop y los dashboards
+// públicos. El servidor envía solo las celdas con dato en formato "csr"
+// ({indptr, indices, data}) o "coo" ({row, col, data}); se recorren esas
+// celdas sin armar la matriz densa.
+// Se ejecuta en el contexto del campo HTML de ERPNext
+
+(function (window) {
+  "use strict";
+
+  if (window.DaltekSparseTable) return;
+
+  const MAX_TABLE_CELLS = 200;
+
+  // Devuelve [fila, columna, valor] de las primeras `limit` celdas
+  function cells(table, limit = Infinity) {
+    const shown = Math.min(table.data.length, limit);
+    const result = [];
+    if (table.format === "coo") {
+      for (let i = 0; i < shown; i++) {
+        result.push([
+          table.rows[table.row[i]],
+          table.columns[table.col[i]],
+          table.data[i],
+        ]);
+      }
+      return result;
+    }
+
+    let row = 0;
+    for (let i = 0; i < shown; i++) {
+      while (table.indptr[row + 1] <= i) row++;
+      result.push([
+        table.rows[row],
+        table.columns[table.indices[i]],
+        table.data[i],
+      ]);
+    }
+    return result;
+  }
+
+  function isSparseTable(table) {
+    return Boolean(
+      table &&
+        Array.isArray(table.data) &&
+        (table.format === "csr" || table.format === "coo"),
+    );
+  }
+
+  // Agrega a `parent` una tabla fila | columna | valor con hasta
+  // `maxCells` celdas y un aviso con las que quedan fuera
+  function render(parent, table, className, maxCells = MAX_TABLE_CELLS) {
+    const container = document.createElement("div");
+    container.className = className;
+    const body = document.createElement("tbody");
+    cells(table, maxCells).forEach((cell) => {
+      const tr = document.createElement("tr");
+      cell.forEach((value) => {
+        const td = document.createElement("td");
+        td.textContent =
+          typeof value === "number" ? value.toLocaleString() : value ?? "";
+        tr.appendChild(td);
+      });
+      body.appendChild(tr);
+    });
+    const element = document.createElement("table");
+    element.appendChild(body);
+    container.appendChild(element);
+
+    const hidden = table.data.length - maxCells;
+    if (hidden > 0) {
+      const more = document.createElement("div");
+      more.textContent = `… ${hidden.toLocaleString()} celdas más`;
+      container.appendChild(more);
+    }
+    parent.appendChild(container);
+    return container;
+  }
+
+  window.DaltekSparseTable = {
+    cells,
+    isSparseTable,
+    render,
+  };
+})(window);
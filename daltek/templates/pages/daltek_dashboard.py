@@ -0,0 +1,30 @@
+# Copyright (c) 2025, GSI and contributors
+# For license information, please see license.txt
+
+from urllib.parse import quote
+
+import frappe
+
+from daltek.daltek.services.snapshots import get_snapshot
+
+no_cache = 0
+
+
+def get_context(context):
+    """
+    Dashboard público servido desde su snapshot precalculado
+    (ruta /dashboards/<name>). No ejecuta consultas: solo lee Redis.
+    """
+    name = frappe.form_dict.name
+    snapshot = get_snapshot(name) if name else None
+    if not snapshot:
+        raise frappe.DoesNotExistError
+
+    context.title = snapshot["title"]
+    context.generated_at = snapshot["generated_at"]
+    context.snapshot_url = (
+        "/api/method/daltek.daltek.doctype.daltek.daltek.get_public_dashboard_snapshot"
+        f"?name={quote(name)}&v={snapshot['hash']}"
+    )
+    context.no_breadcrumbs = 1
+    return context